@@ -1,12 +1,120 @@
+import uuid
+
+from django.conf import settings
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .anonymization import blind_index
+from .categories import CATEGORIES, normalize_category
+from .models import Email, LLMAnalysis, LLMFailure
+
+ADMIN_PREVIEW_LENGTH = 80
+
+
+def truncate(value, length: int = ADMIN_PREVIEW_LENGTH):
+	if value and len(value) > length:
+		return value[: length - 1] + '…'
+	return value
+
+
+def estimated_row_count(model):
+	"""
+	Cheap row count estimate from database statistics, None if the backend offers none.
+	"""
+	table = connection.ops.quote_name(model._meta.db_table)
+	with connection.cursor() as cursor:
+		if connection.vendor == 'postgresql':
+			cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [model._meta.db_table])
+		elif connection.vendor == 'sqlite':
+			# new rows get the next rowid, so MAX(rowid) approximates the row count with a single b-tree lookup
+			cursor.execute(f'SELECT MAX(rowid) FROM {table}')
+		else:
+			return None
+		row = cursor.fetchone()
+	return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+	"""
+	Uses the statistics estimate instead of COUNT(*) for unfiltered changelists of large tables.
+	"""
+
+	@cached_property
+	def count(self):
+		queryset = self.object_list
+		if not queryset.query.where:
+			estimate = estimated_row_count(queryset.model)
+			if estimate is not None and estimate > settings.ADMIN_EXACT_COUNT_LIMIT:
+				return estimate
+		return super().count
 
-from .models import Email
+
+class CategoryListFilter(admin.SimpleListFilter):
+	title = 'category'
+	parameter_name = 'category'
+
+	def lookups(self, request, model_admin):
+		return [(category, category.replace('_', ' ')) for category in CATEGORIES]
+
+	def queryset(self, request, queryset):
+		if self.value():
+			return queryset.filter(category_index=blind_index(normalize_category(self.value())))
+		return queryset
+
+
+class EncryptedModelAdmin(admin.ModelAdmin):
+	"""
+	Admin for models with encrypted columns: no full counts, no sorting on ciphertext, read-only decrypted fields.
+	"""
+
+	paginator = EstimatedCountPaginator
+	show_full_result_count = False
+	list_per_page = 50
+	# columns loaded for the changelist, the rest (e.g. message bodies) is deferred
+	list_columns: tuple = ()
+
+	def get_queryset(self, request):
+		queryset = super().get_queryset(request)
+		url_name = getattr(request.resolver_match, 'url_name', None) or ''
+		if url_name.endswith('_changelist') and self.list_columns:
+			queryset = queryset.only(*self.list_columns)
+		return queryset
+
+	def has_add_permission(self, request):
+		return False
 
 
-# Register your models here.
 @admin.register(Email)
-class EmailAdmin(admin.ModelAdmin):
+class EmailAdmin(EncryptedModelAdmin):
 	list_display = (
+		'id',
+		'sender',
+		'recipient',
+		'short_subject',
+		'category',
+		'short_preview',
+		'created_at',
+	)
+	list_columns = (
+		'id',
+		'encrypted_sender_name',
+		'encrypted_sender_email',
+		'encrypted_recipient_name',
+		'encrypted_recipient_email',
+		'encrypted_subject',
+		'encrypted_category',
+		'encrypted_preview',
+		'created_at',
+	)
+	list_filter = (CategoryListFilter, ('duplicate_of', admin.EmptyFieldListFilter))
+	sortable_by = ('created_at',)
+	ordering = ('-created_at',)
+	search_fields = ('id',)
+	search_help_text = 'Exact sender or recipient name or email address, or an email id.'
+	fields = readonly_fields = (
 		'id',
 		'sender_name',
 		'sender_email',
@@ -14,6 +122,82 @@ class EmailAdmin(admin.ModelAdmin):
 		'recipient_email',
 		'subject',
 		'date',
+		'category',
+		'category_source',
+		'summary',
 		'message_content',
+		'duplicate_of',
 		'created_at',
 	)
+
+	@admin.display(description='sender')
+	def sender(self, obj):
+		return obj.sender_email or obj.sender_name
+
+	@admin.display(description='recipient')
+	def recipient(self, obj):
+		return obj.recipient_email or obj.recipient_name
+
+	@admin.display(description='subject')
+	def short_subject(self, obj):
+		return truncate(obj.subject)
+
+	@admin.display(description='preview')
+	def short_preview(self, obj):
+		return truncate(obj.preview)
+
+	def get_search_results(self, request, queryset, search_term):
+		"""
+		Exact-match search on the blind indexes instead of decrypting every row.
+		"""
+		search_term = search_term.strip()
+		if not search_term:
+			return queryset, False
+
+		fingerprint = blind_index(search_term)
+		condition = (
+			Q(sender_name_index=fingerprint)
+			| Q(sender_email_index=fingerprint)
+			| Q(recipient_name_index=fingerprint)
+			| Q(recipient_email_index=fingerprint)
+		)
+		try:
+			condition |= Q(id=uuid.UUID(search_term))
+		except ValueError:
+			pass
+		return queryset.filter(condition), False
+
+
+@admin.register(LLMFailure)
+class LLMFailureAdmin(EncryptedModelAdmin):
+	list_display = ('id', 'endpoint', 'short_error', 'email_id', 'resolved', 'created_at')
+	list_columns = ('id', 'endpoint', 'error', 'email', 'resolved', 'created_at')
+	list_filter = ('endpoint', 'resolved')
+	sortable_by = ('created_at',)
+	ordering = ('-created_at',)
+	fields = readonly_fields = ('id', 'endpoint', 'prompt_version', 'error', 'response', 'email', 'resolved', 'created_at')
+
+	@admin.display(description='error')
+	def short_error(self, obj):
+		return truncate(obj.error)
+
+	@admin.display(description='email')
+	def email_id(self, obj):
+		# the id only, showing the email would decrypt its subject for every row
+		return obj.email_id
+
+
+@admin.register(LLMAnalysis)
+class LLMAnalysisAdmin(EncryptedModelAdmin):
+	list_display = ('id', 'session_id', 'short_question', 'short_answer', 'created_at')
+	list_columns = ('id', 'session', 'encrypted_question', 'encrypted_answer', 'created_at')
+	sortable_by = ()
+	fields = readonly_fields = ('id', 'session_id', 'question', 'answer', 'created_at')
+
+	@admin.display(description='question')
+	def short_question(self, obj):
+		return truncate(obj.question)
+
+	@admin.display(description='answer')
+	def short_answer(self, obj):
+		return truncate(obj.answer)
@@ -0,0 +1,228 @@
+import collections
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.utils import timezone
+
+from .llm_client import llm_invoke
+from .models import AnalysisSession, Attachment, DocumentChunk, Email, LLMAnalysis
+from .prompts import ANALYSIS_FOLLOWUP_PROMPT
+from .relations import relations_context
+from .test_connection import query_llm
+
+_WORD = re.compile(r'\w{4,}')
+
+
+class WorkingSet:
+	"""
+	Decrypted emails of an analysis session with the text follow-up prompts are built from.
+	"""
+
+	def __init__(
+		self,
+		fingerprint: Tuple[Any, ...],
+		emails: List[Dict[str, Any]],
+		relations: str = '',
+		attachments: Optional[List[Dict[str, Any]]] = None,
+	):
+		self.fingerprint = fingerprint
+		self.emails = emails
+		self.relations = relations
+		self.attachments = attachments or []
+		self.summaries = '\n'.join(_summary_line(i, email) for i, email in enumerate(emails, 1))
+		self.search_text = [
+			' '.join(str(email[field] or '') for field in ('subject', 'sender_name', 'recipient_name', 'message_content')).lower()
+			for email in emails
+		]
+		self.attachment_text = [f'{chunk["source"]} {chunk["text"]}'.lower() for chunk in self.attachments]
+
+	def relevant(self, question: str, limit: int) -> List[Dict[str, Any]]:
+		"""
+		Up to limit emails sharing the most words of four or more letters with question.
+		"""
+		return [self.emails[i] for i in _ranked(self.search_text, question)[:limit]]
+
+	def excerpts(self, question: str, max_tokens: int) -> str:
+		"""
+		Attachment chunks sharing the most words with question, as many as fit into max_tokens.
+		"""
+		parts = []
+		for i in _ranked(self.attachment_text, question):
+			chunk = self.attachments[i]
+			if chunk['tokens'] > max_tokens:
+				continue
+			max_tokens -= chunk['tokens']
+			parts.append(f'[{chunk["source"]}, pages {chunk["page_start"]}-{chunk["page_end"]}]\n{chunk["text"]}')
+		return '\n\n'.join(parts) or 'none'
+
+
+def _ranked(texts: List[str], question: str) -> List[int]:
+	# indexes of the texts containing words of four or more letters of question, most matching words first
+	terms = set(_WORD.findall(question.lower()))
+	scores = [(sum(term in text for term in terms), i) for i, text in enumerate(texts)]
+	return [i for _, i in sorted((item for item in scores if item[0]), key=lambda item: (-item[0], item[1]))]
+
+
+def _summary_line(number: int, email: Dict[str, Any]) -> str:
+	return (
+		f'[{number}] {email["date"]} {email["sender_name"]} -> {email["recipient_name"]}: '
+		f'{email["subject"]} | {email["summary"] or "no summary"}'
+	)
+
+
+class ContextCache:
+	"""
+	Least recently used working sets of analysis sessions, entries expire ttl seconds after their last use.
+	"""
+
+	def __init__(self, ttl: float, size: int):
+		self.ttl = ttl
+		self.size = size
+		self.entries: collections.OrderedDict[Any, Tuple[float, WorkingSet]] = collections.OrderedDict()
+		self.lock = threading.Lock()
+
+	def _evict(self, now: float) -> None:
+		while self.entries and (len(self.entries) > self.size or next(iter(self.entries.values()))[0] <= now):
+			self.entries.popitem(last=False)
+
+	def get(self, key: Any) -> Optional[WorkingSet]:
+		with self.lock:
+			now = time.monotonic()
+			self._evict(now)
+			entry = self.entries.pop(key, None)
+			if entry is None:
+				return None
+			self.entries[key] = (now + self.ttl, entry[1])
+			return entry[1]
+
+	def put(self, key: Any, working_set: WorkingSet) -> None:
+		with self.lock:
+			now = time.monotonic()
+			self.entries.pop(key, None)
+			self.entries[key] = (now + self.ttl, working_set)
+			self._evict(now)
+
+	def find(self, fingerprint: Tuple[Any, ...]) -> Optional[WorkingSet]:
+		"""
+		Working set of another session built from the same emails.
+		"""
+		with self.lock:
+			now = time.monotonic()
+			for expires, working_set in self.entries.values():
+				if expires > now and working_set.fingerprint == fingerprint:
+					return working_set
+			return None
+
+
+_cache: Optional[ContextCache] = None
+_lock = threading.Lock()
+
+
+def get_cache() -> ContextCache:
+	global _cache
+	with _lock:
+		if _cache is None:
+			_cache = ContextCache(settings.ANALYSIS_SESSION_TTL, settings.ANALYSIS_SESSION_CACHE_SIZE)
+		return _cache
+
+
+def emails_fingerprint() -> Tuple[Any, ...]:
+	"""
+	Changes when emails or attachments are added or deleted and when summaries are rewritten,
+	a cached working set with another fingerprint is rebuilt.
+	"""
+	stats = Email.objects.aggregate(count=Count('id'), latest=Max('created_at'), summarized=Max('summarized_at'))
+	return stats['count'], stats['latest'], stats['summarized'], Attachment.objects.count()
+
+
+def attachment_chunks() -> List[Dict[str, Any]]:
+	"""
+	Decrypted chunks of the attached documents, labelled with the file names and subjects of the emails they are attached to.
+	"""
+	sources: Dict[Any, List[str]] = collections.defaultdict(list)
+	for attachment in Attachment.objects.select_related('email').only(
+		'document_id', 'encrypted_file_name', 'email__encrypted_subject'
+	):
+		sources[attachment.document_id].append(f'{attachment.file_name} attached to "{attachment.email.subject}"')
+	return [
+		{
+			'source': '; '.join(sources[chunk.document_id]),
+			'page_start': chunk.page_start,
+			'page_end': chunk.page_end,
+			'tokens': chunk.tokens,
+			'text': chunk.text or '',
+		}
+		for chunk in DocumentChunk.objects.filter(document_id__in=sources)
+	]
+
+
+def working_set(session_id: Any) -> WorkingSet:
+	"""
+	Working set of the session, decrypting the emails only when no current one is cached.
+	"""
+	cache = get_cache()
+	fingerprint = emails_fingerprint()
+	cached = cache.get(session_id)
+	if cached is None or cached.fingerprint != fingerprint:
+		cached = cache.find(fingerprint) or WorkingSet(
+			fingerprint, [email.to_dict() for email in Email.objects.all()], relations_context(), attachment_chunks()
+		)
+		cache.put(session_id, cached)
+	return cached
+
+
+def format_history(history: List[Dict[str, str]]) -> str:
+	return '\n'.join(f'Q: {turn["question"]}\nA: {turn["answer"]}' for turn in history)
+
+
+def ask(session: AnalysisSession, question: str) -> LLMAnalysis:
+	"""
+	Answer question within session. Every question gets the communication graph and project index and the attachment
+	chunks matching it, the first one the full emails, follow-ups the conversation, one line per email and the emails
+	matching the question only.
+
+	A new, unsaved session is stored with its first answer, so a failed call leaves no empty session behind.
+	Concurrent follow-ups of one session append their turns one after the other instead of overwriting them.
+	"""
+	from langchain_core.prompts import ChatPromptTemplate
+
+	history = session.history
+	emails = working_set(session.id)
+	attachments = emails.excerpts(question, settings.ANALYSIS_ATTACHMENT_TOKENS)
+	if history:
+		messages = ChatPromptTemplate.from_template(ANALYSIS_FOLLOWUP_PROMPT).format_messages(
+			history=format_history(history),
+			relations=emails.relations,
+			summaries=emails.summaries,
+			context=str(emails.relevant(question, settings.ANALYSIS_FOLLOWUP_EMAILS)),
+			attachments=attachments,
+			question=question,
+		)
+		answer = llm_invoke(messages, 'analyze_followup').content
+	else:
+		answer = query_llm(question, emails.emails, emails.relations, attachments)
+
+	turn = {'question': question, 'answer': answer}
+	if session._state.adding:
+		session.history = [turn]
+		with transaction.atomic():
+			session.save()
+			return LLMAnalysis.objects.create(session=session, question=question, answer=answer)
+
+	while True:
+		session.history = (history + [turn])[-settings.ANALYSIS_HISTORY_TURNS :]
+		with transaction.atomic():
+			saved = AnalysisSession.objects.filter(pk=session.pk, version=session.version).update(
+				encrypted_history=session.encrypted_history, version=F('version') + 1, updated_at=timezone.now()
+			)
+			if saved:
+				session.version += 1
+				return LLMAnalysis.objects.create(session=session, question=question, answer=answer)
+		# a concurrent follow-up of the session saved its turn first, append after it
+		session.refresh_from_db(fields=['encrypted_history', 'version'])
+		history = session.history
@@ -1,18 +1,44 @@
-from cryptography.fernet import Fernet
+import functools
+import hashlib
+import hmac
+
 from django.conf import settings
 
-FERNET = Fernet(settings.EMAIL_ENCRYPTION_KEY.encode())
+
+@functools.cache
+def get_fernet():
+	"""
+	Fernet instance for the configured key, built on first use so imports work without the key
+	"""
+	from cryptography.fernet import Fernet
+
+	return Fernet(settings.EMAIL_ENCRYPTION_KEY.encode())
+
+
+@functools.cache
+def blind_index_key() -> bytes:
+	"""
+	key of the blind index, derived from the encryption key
+	"""
+	return hashlib.sha256(b'blind-index:' + settings.EMAIL_ENCRYPTION_KEY.encode()).digest()
 
 
 def encrypt_value(value: str) -> bytes:
 	"""
 	encrypts value using key
 	"""
-	return FERNET.encrypt(value.encode()).decode()
+	return get_fernet().encrypt(value.encode()).decode()
 
 
 def decrypt_value(value: bytes) -> str:
 	"""
 	decrypts value using key
 	"""
-	return FERNET.decrypt(value.encode()).decode()
+	return get_fernet().decrypt(value.encode()).decode()
+
+
+def blind_index(value: str) -> str:
+	"""
+	keyed deterministic fingerprint of value, allows equality lookups on encrypted columns
+	"""
+	return hmac.new(blind_index_key(), value.strip().lower().encode(), hashlib.sha256).hexdigest()
@@ -0,0 +1,62 @@
+import hashlib
+import json
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+FAKE_CATEGORIES = ['Project Update', 'Meeting', 'Technical', 'Security', 'HR', 'Finance', 'Announcement']
+FAKE_PROJECTS = ['ATS', 'Billstream', 'CityFlow', 'DeskFlow', None]
+
+
+class FakeChatModel(BaseChatModel):
+	"""
+	Deterministic local chat model used in place of the remote LLM during benchmarks.
+	"""
+
+	latency: float = 0.0
+	# share of JSON answers wrapped in prose and code fences with a trailing comma, like real models sometimes do
+	malformed: float = 0.0
+	model_name: str = 'fake-chat-model'
+
+	@property
+	def _llm_type(self) -> str:
+		return 'fake-chat-model'
+
+	def _generate(
+		self,
+		messages: List[BaseMessage],
+		stop: Optional[List[str]] = None,
+		run_manager: Optional[Any] = None,
+		**kwargs: Any,
+	) -> ChatResult:
+		prompt = '\n'.join(str(message.content) for message in messages)
+		digest = hashlib.sha1(prompt.encode()).hexdigest()
+
+		if self.latency:
+			time.sleep(self.latency)
+
+		summary = f'Synthetic summary {digest[:12]} of a {len(prompt)} character prompt.'
+		if '"summary"' in prompt:
+			category = FAKE_CATEGORIES[int(digest[:8], 16) % len(FAKE_CATEGORIES)]
+			project = FAKE_PROJECTS[int(digest[12:16], 16) % len(FAKE_PROJECTS)]
+			content = json.dumps({'summary': summary, 'category': category, 'project_name': project})
+			if int(digest[8:12], 16) < self.malformed * 0x10000:
+				content = f'Here is the summary:\n```json\n{content[:-1]},}}\n```'
+		else:
+			content = summary
+
+		input_tokens = len(prompt) // 4
+		output_tokens = len(content) // 4
+		message = AIMessage(
+			content=content,
+			usage_metadata={
+				'input_tokens': input_tokens,
+				'output_tokens': output_tokens,
+				'total_tokens': input_tokens + output_tokens,
+			},
+			response_metadata={'model_name': self.model_name},
+		)
+		return ChatResult(generations=[ChatGeneration(message=message)])
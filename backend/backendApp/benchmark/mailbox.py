@@ -0,0 +1,88 @@
+import pathlib
+import random
+from typing import List
+
+FIRST_NAMES = ['Anna', 'Marek', 'Ewelina', 'Piotr', 'Katarzyna', 'Tomasz', 'Agnieszka', 'Paweł', 'Magdalena', 'Krzysztof']
+LAST_NAMES = ['Nowak', 'Kowalski', 'Wiśniewska', 'Wójcik', 'Kamińska', 'Lewandowski', 'Zielińska', 'Szymański', 'Woźniak']
+DOMAINS = ['szpilex.ai', 'hrcloud.pl', 'softtalent.ai', 'alphacloud.com', 'telgo.pl', 'metalpro.pl']
+PROJECT_CODES = ['ATS-HRCLOUD-MVP', 'FLEET-MNGMT-GPS', 'RAG-HR-MVP', 'VBT-TELGO-IVR', 'BILL-FINAPP-MVP', 'ML-MON-DRIFT']
+TOPICS = [
+	'harmonogram wdrożenia',
+	'integracja API',
+	'wymagania bezpieczeństwa',
+	'raport z testów',
+	'zakres MVP',
+	'eskalacja incydentu',
+	'budżet projektu',
+	'migracja bazy danych',
+]
+SENTENCES = [
+	'Przesyłam aktualizację statusu prac nad modułem raportowym.',
+	'Proszę o potwierdzenie terminu spotkania z klientem.',
+	'Zespół backendu zakończył integrację z zewnętrznym API płatności.',
+	'Widzimy ryzyko opóźnienia ze względu na brak dostępu do środowiska testowego.',
+	'Decyzja: przechodzimy na architekturę opartą o kolejkę zdarzeń.',
+	'Endpoint /api/v1/orders zwraca błąd 500 przy dużych zamówieniach.',
+	'Klient prosi o dodanie eksportu danych do CSV oraz PDF.',
+	'Termin oddania wersji produkcyjnej to koniec przyszłego miesiąca.',
+	'Baza PostgreSQL wymaga partycjonowania tabel z logami.',
+	'Proszę o review dokumentacji przed przekazaniem jej do działu prawnego.',
+	'Wymagamy uwierzytelniania SSO oraz szyfrowania danych w spoczynku.',
+	'Na spotkaniu ustalono priorytety na kolejny sprint.',
+]
+
+
+def _person(rng: random.Random) -> str:
+	first = rng.choice(FIRST_NAMES)
+	last = rng.choice(LAST_NAMES)
+	login = f'{first}.{last}'.lower()
+	return f'{first} {last} <{login}@{rng.choice(DOMAINS)}>'
+
+
+def _message(rng: random.Random, subject: str, day: int, minute: int) -> str:
+	sender = _person(rng)
+	recipients = ', '.join(_person(rng) for _ in range(rng.randint(1, 3)))
+	body = '\n'.join(rng.choice(SENTENCES) for _ in range(rng.randint(2, 8)))
+	signature_name = sender.split(' <')[0]
+	return (
+		f'Od: {sender}\n'
+		f'Temat: {subject}\n'
+		f'Wysłano: 2025-{(day // 28) % 12 + 1:02d}-{day % 28 + 1:02d} {(minute // 60) % 24:02d}:{minute % 60:02d}\n'
+		f'Do: {recipients}\n'
+		'\n'
+		f'Cześć,\n\n{body}\n\nPozdrawiam\n'
+		'--\n'
+		f'{signature_name}\n'
+	)
+
+
+def generate_mailbox(out_dir: pathlib.Path, messages: int, messages_per_file: int = 5, seed: int = 0) -> List[pathlib.Path]:
+	"""
+	Write a synthetic mailbox in the Od:/Do:/Temat:/Wysłano: format and return the created files.
+	"""
+	rng = random.Random(seed)
+	out_dir = pathlib.Path(out_dir)
+	out_dir.mkdir(parents=True, exist_ok=True)
+
+	files = []
+	written = 0
+	file_index = 0
+	while written < messages:
+		count = min(messages_per_file, messages - written)
+		code = f'{rng.choice(PROJECT_CODES)}-{rng.randint(1, 999):03d}'
+		subject = f'[{code}] {rng.choice(TOPICS)}'
+		day = rng.randint(0, 335)
+		minute = rng.randint(8 * 60, 17 * 60)
+
+		thread = []
+		for i in range(count):
+			thread.append(_message(rng, subject if i == 0 else f'RE: {subject}', day, minute + i * 17))
+
+		file_path = out_dir / f'{code}-{file_index:07d}.txt'
+		file_path.write_text('\n'.join(thread), encoding='utf-8')
+		files.append(file_path)
+
+		written += count
+		file_index += 1
+
+	return files
@@ -0,0 +1,423 @@
+import contextlib
+import os
+import pathlib
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from django.db.models import F, Sum
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+
+from ..anonymization import decrypt_value, encrypt_value
+from ..emails import parse_single_file, read_files_data
+from ..llm_client import set_llm
+from .fake_llm import FakeChatModel
+from .mailbox import generate_mailbox
+
+STAGES = ['imports', 'parse', 'encryption', 'ingest', 'list', 'analyze', 'contention']
+
+# Modules that must stay off the import path of a worker or manage.py process
+HEAVY_MODULES = ['pandas', 'numpy', 'langchain_core', 'langchain_openai', 'openai', 'httpx']
+
+
+def _timings(samples: List[float]) -> Dict[str, float]:
+	ordered = sorted(samples)
+	return {
+		'runs': len(ordered),
+		'min_ms': ordered[0] * 1000,
+		'median_ms': statistics.median(ordered) * 1000,
+		'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+		'max_ms': ordered[-1] * 1000,
+	}
+
+
+def _measure(func: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+	"""
+	Run func repeat times, returning latency percentiles and the peak traced memory of the first run.
+	"""
+	tracemalloc.start()
+	func()
+	_, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	samples = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		func()
+		samples.append(time.perf_counter() - start)
+
+	result = _timings(samples)
+	result['peak_memory_mb'] = peak / (1024 * 1024)
+	return result
+
+
+@contextlib.contextmanager
+def no_usage_ledger() -> Iterator[None]:
+	"""
+	Skip the usage ledger writes of LLM calls for the duration of the block, e.g. while many threads call the
+	fake LLM at once, which the SQLite test database cannot take concurrently.
+	"""
+	from .. import usage
+
+	previous = usage.record_responses
+	usage.record_responses = lambda *args, **kwargs: None
+	try:
+		yield
+	finally:
+		usage.record_responses = previous
+
+
+@contextlib.contextmanager
+def fake_llm(latency: float) -> Iterator[FakeChatModel]:
+	"""
+	Replace the remote LLM with a deterministic local fake for the duration of the block.
+	"""
+	model = FakeChatModel(latency=latency)
+	previous = set_llm(model)
+	try:
+		yield model
+	finally:
+		set_llm(previous)
+
+
+def bench_imports() -> Dict[str, Any]:
+	"""
+	Start a fresh interpreter with -X importtime that sets up Django and loads the URL configuration.
+	"""
+	from django.conf import settings
+
+	code = 'import django; django.setup(); import django_backend.urls'
+	env = dict(os.environ)
+	env.setdefault('DJANGO_SETTINGS_MODULE', 'django_backend.settings')
+
+	start = time.perf_counter()
+	process = subprocess.run(
+		[sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, cwd=settings.BASE_DIR, env=env
+	)
+	wall_seconds = time.perf_counter() - start
+
+	modules: Dict[str, int] = {}
+	top_level: List[Tuple[str, int]] = []
+	for line in process.stderr.splitlines():
+		# import time:       self |  cumulative | package, nesting is shown by indenting the package name
+		if not line.startswith('import time:') or 'cumulative' in line:
+			continue
+		_, cumulative, name = line[len('import time:') :].split('|')
+		modules[name.strip()] = int(cumulative)
+		if not name[1:].startswith(' '):
+			top_level.append((name.strip(), int(cumulative)))
+
+	result: Dict[str, Any] = {
+		'returncode': process.returncode,
+		'wall_ms': wall_seconds * 1000,
+		'import_ms': sum(cumulative for _, cumulative in top_level) / 1000,
+		'modules': len(modules),
+		'heavy_modules': [module for module in HEAVY_MODULES if module in modules],
+		'slowest': [
+			{'module': name, 'cumulative_ms': cumulative / 1000}
+			for name, cumulative in sorted(top_level, key=lambda item: item[1], reverse=True)[:10]
+		],
+	}
+	if process.returncode:
+		# the last line of the traceback, not of the import timings
+		errors = [line for line in process.stderr.splitlines() if not line.startswith('import time:')]
+		result['error'] = errors[-1] if errors else f'exit code {process.returncode}'
+	return result
+
+
+def bench_parse(mail_dir: pathlib.Path) -> Dict[str, Any]:
+	start = time.perf_counter()
+	files_data = read_files_data(mail_dir)
+	read_seconds = time.perf_counter() - start
+
+	start = time.perf_counter()
+	messages = 0
+	for file_data in files_data:
+		messages += len(parse_single_file(file_data))
+	parse_seconds = time.perf_counter() - start
+
+	total_bytes = sum(len(file_data.encode()) for file_data in files_data)
+	return {
+		'files': len(files_data),
+		'messages': messages,
+		'bytes': total_bytes,
+		'read_seconds': read_seconds,
+		'parse_seconds': parse_seconds,
+		'messages_per_sec': messages / parse_seconds if parse_seconds else None,
+		'mb_per_sec': total_bytes / (1024 * 1024) / parse_seconds if parse_seconds else None,
+	}
+
+
+def bench_encryption(mail_dir: pathlib.Path, limit: int) -> Dict[str, Any]:
+	values = []
+	for file_data in read_files_data(mail_dir):
+		for message in parse_single_file(file_data):
+			values.append(message['message_content'] or '')
+		if len(values) >= limit:
+			break
+	values = values[:limit]
+	total_bytes = sum(len(value.encode()) for value in values)
+
+	start = time.perf_counter()
+	encrypted = [encrypt_value(value) for value in values]
+	encrypt_seconds = time.perf_counter() - start
+
+	start = time.perf_counter()
+	for value in encrypted:
+		decrypt_value(value)
+	decrypt_seconds = time.perf_counter() - start
+
+	return {
+		'values': len(values),
+		'bytes': total_bytes,
+		'encrypt_ops_per_sec': len(values) / encrypt_seconds if encrypt_seconds else None,
+		'decrypt_ops_per_sec': len(values) / decrypt_seconds if decrypt_seconds else None,
+		'encrypt_mb_per_sec': total_bytes / (1024 * 1024) / encrypt_seconds if encrypt_seconds else None,
+		'decrypt_mb_per_sec': total_bytes / (1024 * 1024) / decrypt_seconds if decrypt_seconds else None,
+	}
+
+
+def bench_ingest(mail_dir: pathlib.Path) -> Dict[str, Any]:
+	from ..models import Email, LLMUsage
+	from ..views import EmailAPIView
+
+	factory = APIRequestFactory()
+	view = EmailAPIView.as_view()
+	request = factory.post('/emails/', {'email_path': str(mail_dir)}, format='json')
+
+	start = time.perf_counter()
+	response = view(request)
+	seconds = time.perf_counter() - start
+
+	processed = response.data.get('processed', 0)
+	tokens = LLMUsage.objects.filter(job='api_ingest').aggregate(
+		calls=Sum('calls'), tokens=Sum(F('prompt_tokens') + F('completion_tokens'))
+	)
+	return {
+		'status': response.status_code,
+		'total': response.data.get('total'),
+		'processed': processed,
+		'stored': Email.objects.count(),
+		'seconds': seconds,
+		'emails_per_sec': processed / seconds if seconds else None,
+		'llm_calls': tokens['calls'] or 0,
+		'tokens_per_email': (tokens['tokens'] or 0) / processed if processed else None,
+	}
+
+
+def bench_list(repeat: int) -> Dict[str, Any]:
+	from ..models import Email
+	from ..views import EmailAPIView
+
+	factory = APIRequestFactory()
+	view = EmailAPIView.as_view()
+	sizes = []
+
+	def call() -> None:
+		response = view(factory.get('/emails/'))
+		response.render()
+		sizes.append(len(response.content))
+
+	result = _measure(call, repeat)
+	result['rows'] = Email.objects.count()
+	result['payload_bytes'] = sizes[-1]
+	return result
+
+
+def bench_analyze(repeat: int) -> Dict[str, Any]:
+	"""
+	Latency and tokens of the first question of an analysis session and of follow-ups in the same session.
+	"""
+	from ..models import LLMUsage
+	from ..views import AnalyzeEmailsView
+
+	factory = APIRequestFactory()
+	view = AnalyzeEmailsView.as_view()
+	session = {}
+
+	def call(data: Dict[str, Any]) -> Any:
+		return view(factory.post('/analyze/', data, format='json'))
+
+	def first() -> None:
+		session['id'] = call({'text': 'Jakie ryzyka pojawiają się w projektach?'}).data['session_id']
+
+	def followup() -> None:
+		call({'text': 'A które z nich dotyczą terminów?', 'session_id': str(session['id'])})
+
+	result = _measure(first, repeat)
+	result['followup'] = _measure(followup, repeat)
+	for endpoint, key in (('analyze', 'tokens_per_question'), ('analyze_followup', 'tokens_per_followup')):
+		tokens = LLMUsage.objects.filter(endpoint=endpoint).aggregate(
+			calls=Sum('calls'), tokens=Sum(F('prompt_tokens') + F('completion_tokens'))
+		)
+		result[key] = (tokens['tokens'] or 0) / tokens['calls'] if tokens['calls'] else None
+	return result
+
+
+def _interactive_under_load(latency: float, slots: int, bulk_share: float, calls: int) -> Dict[str, Any]:
+	from .. import usage
+	from ..llm_client import llm_invoke
+	from ..scheduler import BULK, LLMScheduler, set_scheduler
+
+	scheduler = LLMScheduler(slots, {'interactive': 1.0, 'backfill': bulk_share, 'bulk': bulk_share})
+	previous = set_scheduler(scheduler)
+	stop = threading.Event()
+	errors: List[BaseException] = []
+
+	def ingest() -> None:
+		from django.db import connection
+
+		from ..llm_client import llm_batch
+
+		# every worker keeps more calls queued than there are slots, like a large ingest
+		try:
+			with usage.activate(usage.Job('benchmark_bulk', priority=BULK)):
+				while not stop.is_set():
+					llm_batch([f'bulk {i}' for i in range(slots * 2)], 'benchmark', concurrency=slots * 2)
+		except BaseException as e:
+			errors.append(e)
+			stop.set()
+		finally:
+			connection.close()
+
+	workers = [threading.Thread(target=ingest) for _ in range(2)]
+	try:
+		for worker in workers:
+			worker.start()
+		# let the bulk calls take their slots first
+		time.sleep(latency * 2)
+		samples = []
+		for i in range(calls):
+			start = time.perf_counter()
+			llm_invoke(f'interactive {i}', 'benchmark')
+			samples.append(time.perf_counter() - start)
+	finally:
+		stop.set()
+		for worker in workers:
+			worker.join()
+		set_scheduler(previous)
+	if errors:
+		# interactive latency without the bulk load behind it would be meaningless
+		raise RuntimeError(f'Bulk worker failed: {errors[0]!r}') from errors[0]
+
+	result = _timings(samples)
+	classes = scheduler.metrics()['classes']
+	result['scheduler_wait_ms'] = {priority: metrics['wait_ms'] for priority, metrics in classes.items() if metrics['served']}
+	return result
+
+
+def bench_contention(latency: float, repeat: int) -> Dict[str, Any]:
+	"""
+	Latency of interactive calls alone and while two bulk jobs saturate the scheduler, with the default bulk share
+	and with a bulk share of 1.0 (no slots reserved for interactive calls).
+	"""
+	from ..llm_client import llm_invoke
+
+	# without latency every call finishes before the next one queues and there is nothing to schedule
+	latency = latency or 0.02
+	slots = 4
+	calls = max(repeat, 10)
+	with fake_llm(latency), no_usage_ledger():
+		samples = []
+		for i in range(calls):
+			start = time.perf_counter()
+			llm_invoke(f'interactive {i}', 'benchmark')
+			samples.append(time.perf_counter() - start)
+		return {
+			'llm_latency': latency,
+			'slots': slots,
+			'idle': _timings(samples),
+			'bulk_load': _interactive_under_load(latency, slots, 0.75, calls),
+			'bulk_load_no_reserve': _interactive_under_load(latency, slots, 1.0, calls),
+		}
+
+
+def git_commit() -> Optional[str]:
+	try:
+		return subprocess.run(
+			['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True, cwd=pathlib.Path(__file__).parent
+		).stdout.strip()
+	except Exception:
+		return None
+
+
+def run_suite(
+	messages: int,
+	db_messages: int,
+	messages_per_file: int = 5,
+	latency: float = 0.0,
+	repeat: int = 5,
+	seed: int = 0,
+	stages: List[str] = STAGES,
+	log: Callable[[str], None] = print,
+) -> Dict[str, Any]:
+	"""
+	Run the selected benchmark stages against synthetic mailboxes and return JSON-serializable results.
+
+	Database stages run against a throwaway test database so they never touch real data.
+	"""
+	from django.db import connection
+
+	results: Dict[str, Any] = {}
+	with tempfile.TemporaryDirectory(prefix='mail-bench-') as tmp:
+		tmp_dir = pathlib.Path(tmp)
+
+		if 'imports' in stages:
+			log('Benchmarking import time')
+			results['imports'] = bench_imports()
+		if 'parse' in stages or 'encryption' in stages:
+			log(f'Generating {messages} synthetic messages')
+			generate_mailbox(tmp_dir / 'parse', messages, messages_per_file, seed)
+		if 'parse' in stages:
+			log('Benchmarking parse')
+			results['parse'] = bench_parse(tmp_dir / 'parse')
+		if 'encryption' in stages:
+			log('Benchmarking encryption')
+			results['encryption'] = bench_encryption(tmp_dir / 'parse', messages)
+
+		db_stages = [stage for stage in ('ingest', 'list', 'analyze', 'contention') if stage in stages]
+		if db_stages:
+			# parse_mails_to_dataframe only reads the first half of the files, so generate twice as many
+			generate_mailbox(tmp_dir / 'ingest', db_messages * 2, messages_per_file, seed + 1)
+			old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+			try:
+				with fake_llm(latency):
+					log(f'Benchmarking ingest of {db_messages} messages')
+					results['ingest'] = bench_ingest(tmp_dir / 'ingest')
+					if 'list' in db_stages:
+						log('Benchmarking GET /emails/')
+						results['list'] = bench_list(repeat)
+					if 'analyze' in db_stages:
+						log('Benchmarking AnalyzeEmailsView')
+						results['analyze'] = bench_analyze(repeat)
+					if 'contention' in db_stages:
+						log('Benchmarking interactive LLM calls under bulk load')
+						results['contention'] = bench_contention(latency, repeat)
+			finally:
+				connection.creation.destroy_test_db(old_name, verbosity=0)
+
+	return {
+		'meta': {
+			'commit': git_commit(),
+			'timestamp': timezone.now().isoformat(),
+			'python': sys.version.split()[0],
+			'platform': platform.platform(),
+			'params': {
+				'messages': messages,
+				'db_messages': db_messages,
+				'messages_per_file': messages_per_file,
+				'llm_latency': latency,
+				'repeat': repeat,
+				'seed': seed,
+				'stages': stages,
+			},
+		},
+		'results': results,
+	}
@@ -0,0 +1,56 @@
+import re
+from typing import Optional
+
+OTHER = 'other'
+
+# Closed label set used for Email.category, both by the local classifier and by the LLM
+CATEGORIES = [
+	'project_update',
+	'requirements',
+	'technical',
+	'meeting',
+	'incident',
+	'security',
+	'legal',
+	'finance',
+	'sales',
+	'hr',
+	'announcement',
+	OTHER,
+]
+
+# Keywords used to map free-text labels (e.g. legacy LLM output) onto the closed set, checked in order
+CATEGORY_KEYWORDS = [
+	('security', ['security', 'bezpiecze', 'privacy', 'rodo', 'gdpr', 'compliance', 'audit']),
+	('incident', ['incident', 'incydent', 'outage', 'escalat', 'eskalac', 'bug', 'support', 'troubleshoot', 'awari']),
+	('legal', ['legal', 'prawn', 'contract', 'umow', 'umów', 'regulat']),
+	('finance', ['financ', 'finans', 'budget', 'budżet', 'invoice', 'faktur', 'billing', 'cost', 'koszt', 'payment']),
+	('sales', ['sales', 'sprzeda', 'offer', 'ofert', 'customer', 'klient', 'marketing', 'proposal']),
+	('hr', ['hr', 'human resources', 'recruit', 'rekrut', 'onboarding', 'employee', 'pracowni', 'training', 'szkoleni']),
+	('meeting', ['meeting', 'spotkan', 'schedul', 'calendar', 'invitation', 'zaproszen', 'call']),
+	('requirements', ['requirement', 'wymagan', 'specification', 'specyfikac', 'scope', 'zakres', 'mvp', 'feature']),
+	('technical', ['technical', 'techniczn', 'architect', 'api', 'integrat', 'development', 'infrastructure', 'data']),
+	('project_update', ['project', 'projekt', 'status', 'update', 'progress', 'report', 'raport', 'plan']),
+	('announcement', ['announcement', 'ogłoszen', 'newsletter', 'event', 'wydarzen', 'charity', 'csr', 'social']),
+]
+
+
+def normalize_category(label: Optional[str]) -> str:
+	"""
+	Map a free-text category label onto the closed CATEGORIES set.
+	"""
+	if not label:
+		return OTHER
+
+	normalized = re.sub(r'[\s\-/]+', '_', label.strip().lower())
+	if normalized in CATEGORIES:
+		return normalized
+
+	text = label.lower()
+	words = set(re.findall(r'\w+', text))
+	for category, keywords in CATEGORY_KEYWORDS:
+		for keyword in keywords:
+			# short keywords must match a whole word, longer ones may be a word prefix
+			if (len(keyword) <= 3 and keyword in words) or (len(keyword) > 3 and keyword in text):
+				return category
+	return OTHER
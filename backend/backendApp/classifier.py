@@ -0,0 +1,170 @@
+import math
+import os
+import pathlib
+import random
+import re
+import zlib
+from collections import Counter
+from typing import List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from .categories import normalize_category
+
+N_FEATURES = 2**16
+TOKEN_PATTERN = re.compile(r'\w\w+')
+
+
+def hash_features(text: str) -> Tuple[np.ndarray, np.ndarray]:
+	"""
+	Hash unigrams and bigrams of text into (indices, log term frequencies).
+	"""
+	tokens = TOKEN_PATTERN.findall(text.lower())
+	grams = tokens + [f'{a} {b}' for a, b in zip(tokens, tokens[1:])]
+	counts = Counter(zlib.crc32(gram.encode()) % N_FEATURES for gram in grams)
+	indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+	values = np.fromiter((1.0 + math.log(c) for c in counts.values()), dtype=np.float32, count=len(counts))
+	return indices, values
+
+
+def email_text(subject: Optional[str], content: Optional[str]) -> str:
+	# subject carries most of the signal, so it is counted twice
+	return f'{subject or ""} {subject or ""} {content or ""}'
+
+
+class CategoryClassifier:
+	"""
+	Linear softmax classifier over hashed TF-IDF features.
+	"""
+
+	def __init__(self, labels: List[str], idf: np.ndarray, weights: np.ndarray, bias: np.ndarray):
+		self.labels = labels
+		self.idf = idf
+		self.weights = weights
+		self.bias = bias
+
+	def _tfidf(self, indices: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+		values = values * self.idf[indices]
+		norm = np.linalg.norm(values)
+		return indices, values / norm if norm else values
+
+	def _vectorize(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+		return self._tfidf(*hash_features(text))
+
+	def predict_proba(self, text: str) -> np.ndarray:
+		indices, values = self._vectorize(text)
+		scores = self.weights[:, indices] @ values + self.bias
+		scores = np.exp(scores - scores.max())
+		return scores / scores.sum()
+
+	def predict(self, text: str) -> Tuple[str, float]:
+		"""
+		Return the most likely label and its probability.
+		"""
+		proba = self.predict_proba(text)
+		best = int(proba.argmax())
+		return self.labels[best], float(proba[best])
+
+	@classmethod
+	def fit(
+		cls, texts: List[str], labels: List[str], epochs: int = 15, learning_rate: float = 0.5, l2: float = 1e-5, seed: int = 0
+	) -> 'CategoryClassifier':
+		"""
+		Train with plain SGD on the cross-entropy loss.
+		"""
+		classes = sorted(set(labels))
+		targets = [classes.index(label) for label in labels]
+
+		features = [hash_features(text) for text in texts]
+		document_frequency = np.zeros(N_FEATURES, dtype=np.float32)
+		for indices, _ in features:
+			document_frequency[indices] += 1
+		idf = np.log((1 + len(texts)) / (1 + document_frequency)).astype(np.float32) + 1
+
+		model = cls(classes, idf, np.zeros((len(classes), N_FEATURES), dtype=np.float32), np.zeros(len(classes), np.float32))
+		vectors = [model._tfidf(indices, values) for indices, values in features]
+
+		order = list(range(len(texts)))
+		rng = random.Random(seed)
+		for epoch in range(epochs):
+			rng.shuffle(order)
+			rate = learning_rate / (1 + epoch)
+			for i in order:
+				indices, values = vectors[i]
+				scores = model.weights[:, indices] @ values + model.bias
+				proba = np.exp(scores - scores.max())
+				proba /= proba.sum()
+				proba[targets[i]] -= 1
+				model.weights[:, indices] -= rate * (np.outer(proba, values) + l2 * model.weights[:, indices])
+				model.bias -= rate * proba
+
+		return model
+
+	def save(self, path: pathlib.Path) -> None:
+		# written next to the model and renamed over it, so running processes never load a half-written file
+		path = pathlib.Path(path)
+		partial = path.with_name(f'{path.name}.partial')
+		with open(partial, 'wb') as f:
+			np.savez_compressed(f, labels=np.array(self.labels), idf=self.idf, weights=self.weights, bias=self.bias)
+		os.replace(partial, path)
+
+	@classmethod
+	def load(cls, path: pathlib.Path) -> 'CategoryClassifier':
+		data = np.load(path)
+		return cls([str(label) for label in data['labels']], data['idf'], data['weights'], data['bias'])
+
+
+# modification time of the model file and the classifier loaded from it
+_loaded: Optional[Tuple[int, CategoryClassifier]] = None
+
+
+def get_classifier() -> Optional[CategoryClassifier]:
+	"""
+	The trained classifier, loaded again when `manage.py train_classifier` replaced the model file.
+	None if no model was trained yet.
+	"""
+	global _loaded
+	path = pathlib.Path(settings.CATEGORY_MODEL_PATH)
+	try:
+		mtime = path.stat().st_mtime_ns
+	except FileNotFoundError:
+		return None
+	loaded = _loaded
+	if loaded is None or loaded[0] != mtime:
+		loaded = _loaded = (mtime, CategoryClassifier.load(path))
+	return loaded[1]
+
+
+def classify_email(subject: Optional[str], content: Optional[str]) -> Optional[str]:
+	"""
+	Category from the local classifier, or None when it is missing or not confident enough.
+	"""
+	classifier = get_classifier()
+	if classifier is None:
+		return None
+	label, confidence = classifier.predict(email_text(subject, content))
+	if confidence < settings.CATEGORY_CONFIDENCE_THRESHOLD:
+		return None
+	return label
+
+
+def training_data(include_legacy: bool = False) -> Tuple[List[str], List[str]]:
+	"""
+	Texts and normalized labels of the emails labelled by the LLM or by hand, so the classifier never learns
+	from its own predictions. Near-duplicates only repeat the label of their original and are left out.
+	With include_legacy, emails stored before label sources were recorded are used too.
+	"""
+	from django.db.models import Q
+
+	from .models import Email
+
+	sources = Q(category_source__in=['llm', 'manual'])
+	if include_legacy:
+		sources |= Q(category_source=None)
+	emails = Email.objects.exclude(encrypted_category=None).filter(sources, duplicate_of=None)
+	texts, labels = [], []
+	for email in emails.iterator():
+		texts.append(email_text(email.subject, email.message_content))
+		labels.append(normalize_category(email.category))
+	return texts, labels
@@ -0,0 +1,106 @@
+import hashlib
+import re
+import zlib
+from typing import Optional
+
+import numpy as np
+from django.conf import settings
+
+from .anonymization import blind_index_key
+
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+MAX_HASH = np.uint64(2**32 - 1)
+PRIME = np.uint64(4294967311)
+
+# Fixed seed so that signatures stay comparable between processes and runs
+_rng = np.random.default_rng(20251130)
+_A = _rng.integers(1, 2**32 - 1, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, 2**32 - 1, size=NUM_PERM, dtype=np.uint64)
+
+
+def normalize_body(text: str) -> str:
+	"""
+	Lowercase the body and drop quoted lines and punctuation, so that forwarded copies compare equal.
+	"""
+	lines = [line for line in text.lower().splitlines() if not line.lstrip().startswith('>')]
+	return ' '.join(re.findall(r'\w+', ' '.join(lines)))
+
+
+def compute_signature(text: Optional[str]) -> Optional[np.ndarray]:
+	"""
+	MinHash signature of the word shingles of a message body, None for bodies too short to compare.
+	"""
+	words = normalize_body(text or '').split()
+	if len(words) < SHINGLE_SIZE:
+		return None
+
+	shingles = {' '.join(words[i : i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+	hashes = np.fromiter((zlib.crc32(shingle.encode()) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+	permuted = (np.outer(hashes, _A) + _B) % PRIME & MAX_HASH
+	return permuted.min(axis=0).astype(np.uint32)
+
+
+def similarity(first: np.ndarray, second: np.ndarray) -> float:
+	"""
+	Estimated Jaccard similarity of two signatures.
+	"""
+	return float(np.mean(first == second))
+
+
+def band_keys(signature: np.ndarray) -> list[str]:
+	"""
+	LSH bucket key for every band, keyed so the stored buckets do not reveal content hashes.
+	"""
+	return [
+		hashlib.blake2b(signature[band * ROWS : (band + 1) * ROWS].tobytes(), digest_size=16, key=blind_index_key()).hexdigest()
+		for band in range(BANDS)
+	]
+
+
+def signature_from_bytes(value: bytes) -> np.ndarray:
+	return np.frombuffer(bytes(value), dtype=np.uint32)
+
+
+def find_duplicate(signature: Optional[np.ndarray]):
+	"""
+	Most similar already summarized email above the duplicate threshold, or None.
+	"""
+	from .models import Email, LSHBucket
+
+	if signature is None:
+		return None
+
+	keys = band_keys(signature)
+	candidate_ids = set()
+	for band, key in enumerate(keys):
+		candidate_ids.update(LSHBucket.objects.filter(band=band, key=key).values_list('email_id', flat=True))
+	if not candidate_ids:
+		return None
+
+	best, best_similarity = None, settings.DUPLICATE_SIMILARITY_THRESHOLD
+	candidates = Email.objects.filter(id__in=candidate_ids).exclude(encrypted_summary=None).only('id', 'minhash', 'duplicate_of')
+	for candidate in candidates:
+		candidate_similarity = similarity(signature, signature_from_bytes(candidate.minhash))
+		if candidate_similarity >= best_similarity:
+			best, best_similarity = candidate, candidate_similarity
+	if best is None:
+		return None
+
+	# always point at the root of a cluster
+	return Email.objects.get(id=best.duplicate_of_id or best.id)
+
+
+def index_email(email, signature: Optional[np.ndarray]) -> None:
+	"""
+	Store the signature of an email and add it to the LSH buckets.
+	"""
+	from .models import LSHBucket
+
+	if signature is None:
+		return
+	email.minhash = signature.tobytes()
+	email.save(update_fields=['minhash'])
+	LSHBucket.objects.bulk_create([LSHBucket(band=band, key=key, email=email) for band, key in enumerate(band_keys(signature))])
@@ -0,0 +1,191 @@
+import glob
+import hmac
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+
+from .anonymization import blind_index_key
+from .extraction import DOCUMENT_EXTENSIONS, extract_document
+from .models import Attachment, Document, DocumentChunk, Email
+
+logger = logging.getLogger(__name__)
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Extraction pool of the web process, created on first upload
+_executor: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def get_executor() -> ProcessPoolExecutor:
+	"""
+	Process pool shared by document uploads, so large PDFs are extracted outside the request thread.
+	"""
+	global _executor
+	with _lock:
+		if _executor is None:
+			_executor = ProcessPoolExecutor(max_workers=settings.DOCUMENT_WORKERS)
+		return _executor
+
+
+def discard_executor(executor: ProcessPoolExecutor) -> None:
+	"""
+	Drop a pool broken by a dying worker (e.g. out of memory on a huge PDF), the next upload creates a new one.
+	"""
+	global _executor
+	with _lock:
+		if _executor is executor:
+			_executor = None
+	executor.shutdown(wait=False)
+
+
+def submit_extraction(path: str) -> Tuple[ProcessPoolExecutor, Future]:
+	"""
+	Extract path in the shared pool, replacing the pool once if it is broken.
+	"""
+	executor = get_executor()
+	try:
+		return executor, executor.submit(extract_document, path, settings.DOCUMENT_CHUNK_TOKENS)
+	except BrokenProcessPool:
+		discard_executor(executor)
+		executor = get_executor()
+		return executor, executor.submit(extract_document, path, settings.DOCUMENT_CHUNK_TOKENS)
+
+
+def list_document_files(path: str) -> List[str]:
+	"""
+	The path itself if it is a file, otherwise the supported documents below the directory.
+	"""
+	if os.path.isfile(path):
+		return [path]
+	files = glob.glob(os.path.join(path, '**', '*'), recursive=True)
+	return sorted(file for file in files if os.path.isfile(file) and file.lower().endswith(DOCUMENT_EXTENSIONS))
+
+
+def document_hash(source: IO[bytes]) -> str:
+	"""
+	Cache key of a document, the file is read in blocks. Keyed like the blind indexes,
+	so stored hashes do not reveal whether a known public file was attached.
+	"""
+	digest = hmac.new(blind_index_key(), digestmod='sha256')
+	for block in iter(lambda: source.read(HASH_BLOCK_SIZE), b''):
+		digest.update(block)
+	return digest.hexdigest()
+
+
+def save_document(content_hash: str, extracted: Dict[str, Any]) -> Document:
+	"""
+	Store an extraction result of extract_document, returns the cached document if another process was faster.
+	"""
+	try:
+		with transaction.atomic():
+			document = Document.objects.create(
+				content_hash=content_hash,
+				kind=extracted['kind'],
+				pages=extracted['pages'],
+				tokens=sum(tokens for _, _, _, tokens in extracted['chunks']),
+			)
+			chunks = []
+			for index, (page_start, page_end, text, tokens) in enumerate(extracted['chunks']):
+				chunk = DocumentChunk(document=document, index=index, page_start=page_start, page_end=page_end, tokens=tokens)
+				chunk.text = text
+				chunks.append(chunk)
+			DocumentChunk.objects.bulk_create(chunks)
+	except IntegrityError:
+		return Document.objects.get(content_hash=content_hash)
+	return document
+
+
+def attach(document: Document, email: Email, file_name: str) -> Attachment:
+	"""
+	Attach document to email, the same content attached again under another name is listed under the new one.
+	"""
+	attachment = Attachment.objects.filter(email=email, document=document).first()
+	if attachment is None:
+		attachment = Attachment(email=email, document=document)
+	elif attachment.file_name == file_name:
+		return attachment
+	attachment.file_name = file_name
+	attachment.save()
+	return attachment
+
+
+def ingest_documents(
+	paths: Iterable[str], email: Optional[Email] = None, workers: int = 1
+) -> Iterator[Tuple[str, Document, bool]]:
+	"""
+	Extract documents in a process pool, yields (path, document, cached) as they finish.
+
+	Documents whose content hash is already stored are not extracted again. With email,
+	every document is attached to it.
+	"""
+	pending: Dict[Future, Tuple[str, str]] = {}
+	with ProcessPoolExecutor(max_workers=workers) as executor:
+		for path in paths:
+			with open(path, 'rb') as f:
+				content_hash = document_hash(f)
+			document = Document.objects.filter(content_hash=content_hash).first()
+			if document is not None:
+				if email is not None:
+					attach(document, email, os.path.basename(path))
+				yield path, document, True
+				continue
+			pending[executor.submit(extract_document, path, settings.DOCUMENT_CHUNK_TOKENS)] = (path, content_hash)
+
+		for future in as_completed(pending):
+			path, content_hash = pending[future]
+			try:
+				document = save_document(content_hash, future.result())
+			except Exception as e:
+				logger.error(f'Error extracting {path}: {e}')
+				continue
+			if email is not None:
+				attach(document, email, os.path.basename(path))
+			yield path, document, False
+
+
+def attach_upload(email: Email, upload) -> Optional[Attachment]:
+	"""
+	Attach an uploaded file to an email. A cached document is attached right away, otherwise
+	the upload is extracted in the background and None is returned.
+	"""
+	content_hash = document_hash(upload.open('rb'))
+	document = Document.objects.filter(content_hash=content_hash).first()
+	if document is not None:
+		return attach(document, email, upload.name)
+
+	# the upload is gone after the request, extraction works on a private copy
+	suffix = os.path.splitext(upload.name)[1].lower()
+	with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as copy:
+		upload.seek(0)
+		shutil.copyfileobj(upload, copy, HASH_BLOCK_SIZE)
+	try:
+		executor, future = submit_extraction(copy.name)
+	except Exception:
+		os.unlink(copy.name)
+		raise
+	future.add_done_callback(lambda done: _save_upload(done, executor, copy.name, content_hash, email.pk, upload.name))
+	return None
+
+
+def _save_upload(future: Future, executor: ProcessPoolExecutor, path: str, content_hash: str, email_id, file_name: str) -> None:
+	# runs in the pool's result thread, which has its own database connection
+	try:
+		document = save_document(content_hash, future.result())
+		attach(document, Email.objects.get(pk=email_id), file_name)
+	except BrokenProcessPool as e:
+		discard_executor(executor)
+		logger.error(f'Error extracting attachment of email {email_id}, extraction pool restarted: {e}')
+	except Exception as e:
+		logger.error(f'Error extracting attachment of email {email_id}: {e}')
+	finally:
+		os.unlink(path)
+		connections.close_all()
@@ -1,21 +1,21 @@
 import glob
+import hashlib
 import json
 import os
 import pathlib
 import re
-from typing import Any, Dict, List, Optional, Tuple
-
-import pandas as pd
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
 from .models import Email, LLMAnalysis
 
+if TYPE_CHECKING:
+	import pandas as pd
 
-def read_files_data(data_dir: pathlib.Path) -> List[str]:
+
+def list_mail_files(data_dir: pathlib.Path) -> List[str]:
 	"""
-	Read mail data from .txt files in the specified directory.
+	Paths of the .txt mail files in the specified directory.
 	"""
-	files_data = []
-
 	# Search for all .txt files recursively
 	path = os.path.join(data_dir, '**', '*.txt')
 	files = glob.glob(path, recursive=True)
@@ -25,8 +25,17 @@ def read_files_data(data_dir: pathlib.Path) -> List[str]:
 		path = os.path.join(data_dir, '*.txt')
 		files = glob.glob(path)
 
+	return files
+
+
+def read_files_data(data_dir: pathlib.Path) -> List[str]:
+	"""
+	Read mail data from .txt files in the specified directory.
+	"""
+	files_data = []
+
 	# Read all .txt files
-	for file_path in files:
+	for file_path in list_mail_files(data_dir):
 		try:
 			with open(file_path, 'r', encoding='utf-8') as mail:
 				content = mail.read().strip()
@@ -42,6 +51,16 @@ def read_files_data(data_dir: pathlib.Path) -> List[str]:
 	return files_data
 
 
+def parse_mail_file(file_path: str) -> Tuple[str, str, List[Dict[str, Any]]]:
+	"""
+	Read and parse a single mail file, returns its path, content hash and messages.
+	"""
+	with open(file_path, 'r', encoding='utf-8') as mail:
+		content = mail.read().strip()
+	content_hash = hashlib.sha256(content.encode()).hexdigest()
+	return file_path, content_hash, parse_single_file(content) if content else []
+
+
 def parse_sender(sender_string: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
 	"""
 	Parse sender string into name and email.
@@ -137,10 +156,12 @@ def parse_single_file(file_content: str) -> List[Dict[str, Any]]:
 	return messages
 
 
-def parse_mails_to_dataframe(data_dir: pathlib.Path) -> pd.DataFrame:
+def parse_mails_to_dataframe(data_dir: pathlib.Path) -> 'pd.DataFrame':
 	"""
 	Parse all mail data from .txt files into a pandas DataFrame.
 	"""
+	import pandas as pd
+
 	files_data = read_files_data(data_dir)
 	all_messages = []
 
@@ -0,0 +1,162 @@
+"""
+Text extraction for document attachments.
+
+Kept free of Django imports so extraction can run in worker processes of any multiprocessing start method.
+"""
+
+import os
+import re
+import zipfile
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+from xml.etree import ElementTree
+
+DOCUMENT_EXTENSIONS = ('.pdf', '.docx', '.txt', '.md')
+
+# Plain text files have no pages, they are split into pages of this many lines
+TEXT_PAGE_LINES = 60
+
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+Chunk = Tuple[int, int, str, int]
+
+
+def document_kind(path: str) -> str:
+	"""
+	Lowercase extension without the dot, raises ValueError for unsupported files.
+	"""
+	extension = os.path.splitext(path)[1].lower()
+	if extension not in DOCUMENT_EXTENSIONS:
+		raise ValueError(f'Unsupported document type: {extension or path}')
+	return extension[1:]
+
+
+def estimate_tokens(text: str) -> int:
+	"""
+	Rough token count (about 4 characters per token), good enough for budgeting chunks.
+	"""
+	return (len(text) + 3) // 4
+
+
+def _pdf_pages(path: str) -> Iterator[str]:
+	try:
+		from pypdf import PdfReader
+	except ImportError as e:
+		raise RuntimeError('PDF extraction requires pypdf, install it with `uv sync --extra documents`') from e
+
+	# pages are parsed lazily, only the current page is held in memory
+	reader = PdfReader(path)
+	for page in reader.pages:
+		yield page.extract_text() or ''
+
+
+def _docx_pages(path: str) -> Iterator[str]:
+	# word/document.xml is parsed incrementally, pages end at explicit or last rendered page breaks
+	with zipfile.ZipFile(path) as archive, archive.open('word/document.xml') as document:
+		paragraphs: List[str] = []
+		runs: List[str] = []
+		for event, element in ElementTree.iterparse(document, events=('start', 'end')):
+			if event == 'start':
+				if element.tag == f'{_W}lastRenderedPageBreak' or (
+					element.tag == f'{_W}br' and element.get(f'{_W}type') == 'page'
+				):
+					if runs:
+						paragraphs.append(''.join(runs))
+						runs = []
+					if paragraphs:
+						yield '\n'.join(paragraphs)
+						paragraphs = []
+				continue
+			if element.tag == f'{_W}t':
+				runs.append(element.text or '')
+			elif element.tag == f'{_W}tab':
+				runs.append('\t')
+			elif element.tag == f'{_W}p':
+				paragraphs.append(''.join(runs))
+				runs = []
+				element.clear()
+		if paragraphs:
+			yield '\n'.join(paragraphs)
+
+
+def _text_pages(path: str) -> Iterator[str]:
+	with open(path, 'r', encoding='utf-8', errors='replace') as f:
+		lines: List[str] = []
+		for line in f:
+			lines.append(line.rstrip('\n'))
+			if len(lines) == TEXT_PAGE_LINES:
+				yield '\n'.join(lines)
+				lines = []
+		if lines:
+			yield '\n'.join(lines)
+
+
+def iter_pages(path: str) -> Iterator[str]:
+	"""
+	Text of a document page by page, without loading the whole document.
+	"""
+	kind = document_kind(path)
+	if kind == 'pdf':
+		return _pdf_pages(path)
+	if kind == 'docx':
+		return _docx_pages(path)
+	return _text_pages(path)
+
+
+def _split_paragraph(paragraph: str, max_tokens: int) -> Iterator[str]:
+	# a paragraph over the budget is split at line breaks, or between words for long lines
+	max_chars = max_tokens * 4
+	start = 0
+	while len(paragraph) - start > max_chars:
+		end = paragraph.rfind('\n', start, start + max_chars)
+		if end <= start:
+			end = paragraph.rfind(' ', start, start + max_chars)
+		if end <= start:
+			end = start + max_chars
+		yield paragraph[start:end].strip()
+		start = end
+	if paragraph[start:].strip():
+		yield paragraph[start:].strip()
+
+
+def chunk_pages(pages: Iterable[str], max_tokens: int) -> Iterator[Chunk]:
+	"""
+	Group page text into chunks of at most max_tokens, split on paragraph boundaries.
+
+	Yields (first page, last page, text, tokens) with 1-based page numbers.
+	"""
+	parts: List[str] = []
+	tokens = 0
+	first_page = last_page = 1
+	for page_number, page in enumerate(pages, start=1):
+		for paragraph in re.split(r'\n\s*\n', page):
+			paragraph = re.sub(r'[ \t]+', ' ', paragraph).strip()
+			if not paragraph:
+				continue
+			for piece in _split_paragraph(paragraph, max_tokens):
+				piece_tokens = estimate_tokens(piece)
+				if parts and tokens + piece_tokens > max_tokens:
+					yield first_page, last_page, '\n\n'.join(parts), tokens
+					parts, tokens = [], 0
+				if not parts:
+					first_page = page_number
+				parts.append(piece)
+				tokens += piece_tokens
+				last_page = page_number
+	if parts:
+		yield first_page, last_page, '\n\n'.join(parts), tokens
+
+
+def extract_document(path: str, max_tokens: int) -> Dict[str, Any]:
+	"""
+	Extract and chunk a document, returns its kind, page count and chunks.
+	"""
+	page_count = 0
+
+	def counted(pages: Iterator[str]) -> Iterator[str]:
+		nonlocal page_count
+		for page in pages:
+			page_count += 1
+			yield page
+
+	chunks = list(chunk_pages(counted(iter_pages(path)), max_tokens))
+	return {'kind': document_kind(path), 'pages': page_count, 'chunks': chunks}
@@ -0,0 +1,376 @@
+import logging
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, When
+from django.utils import timezone
+
+from . import usage
+from .categories import CATEGORIES, normalize_category
+from .classifier import classify_email
+from .dedup import compute_signature, find_duplicate, index_email, similarity
+from .llm_client import configured_model, llm_batch
+from .models import Email, IngestCheckpoint, LLMFailure
+from .prompts import SUMMARY_ONLY_PROMPT, SUMMARY_PROMPT, SUMMARY_VERSION
+from .relations import INDEX_COLUMNS, index_emails, index_projects
+from .structured import SUMMARY_ONLY_SCHEMA, SUMMARY_SCHEMA, StructuredOutputError, build_repair_prompt, parse_structured
+
+logger = logging.getLogger(__name__)
+
+
+class BudgetStopped(usage.BudgetExceeded):
+	"""
+	The budget ran out during repair calls, after the batch was paid for. results are the batch results with the
+	unrepaired answers as failures, callers save them before stopping.
+	"""
+
+	def __init__(self, message: str, results: List[Dict[str, Any]]):
+		super().__init__(message)
+		self.results = results
+
+
+def build_summary_prompt(message: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+	"""
+	Prompt for a parsed message and the category of the local classifier, if it was confident.
+	"""
+	subject = message.get('subject') or 'N/A'
+	content = message.get('message_content') or 'N/A'
+	# Only ask the LLM for a category when the local classifier is not confident
+	category = classify_email(message.get('subject'), message.get('message_content'))
+	if category:
+		return SUMMARY_ONLY_PROMPT.format(subject=subject, content=content), category
+	return SUMMARY_PROMPT.format(subject=subject, content=content, categories=', '.join(CATEGORIES)), None
+
+
+def summarize_messages(messages: List[Dict[str, Any]], concurrency: int = 1) -> List[Dict[str, Any]]:
+	"""
+	Summarize and categorize messages with up to `concurrency` parallel LLM calls.
+
+	Results carry the prompt version and model that produced them. Answers that do not parse get one
+	repair call; when that fails too the result has no summary and describes the failure instead.
+	Raises BudgetStopped when the budget does not allow the repair calls.
+	"""
+	built = [build_summary_prompt(message) for message in messages]
+	schemas = [SUMMARY_ONLY_SCHEMA if category else SUMMARY_SCHEMA for _, category in built]
+	responses = llm_batch([prompt for prompt, _ in built], 'summarize', concurrency, json_mode=True)
+	llm_model = configured_model() if messages else None
+
+	parsed: List[Optional[Dict[str, Any]]] = [None] * len(messages)
+	# index -> (error, raw answer or None when the call itself failed)
+	failures: Dict[int, Tuple[str, Optional[str]]] = {}
+	for i, response in enumerate(responses):
+		if isinstance(response, Exception):
+			failures[i] = (f'{type(response).__name__}: {response}', None)
+			continue
+		try:
+			parsed[i] = parse_structured(response.content, schemas[i])
+		except StructuredOutputError as e:
+			failures[i] = (str(e), response.content)
+
+	to_repair = [i for i, (_, answer) in failures.items() if answer is not None]
+	repair_prompts = [build_repair_prompt(failures[i][1], schemas[i], failures[i][0]) for i in to_repair]
+	try:
+		repaired = llm_batch(repair_prompts, 'repair', concurrency, json_mode=True)
+	except usage.BudgetExceeded as e:
+		stopped: Optional[usage.BudgetExceeded] = e
+		repaired = []
+		for i in to_repair:
+			failures[i] = (f'{failures[i][0]}; not repaired: {e}', failures[i][1])
+	else:
+		stopped = None
+	for i, response in zip(to_repair, repaired):
+		if isinstance(response, Exception):
+			continue
+		try:
+			parsed[i] = parse_structured(response.content, schemas[i])
+			del failures[i]
+		except StructuredOutputError as e:
+			failures[i] = (f'{failures[i][0]}; after repair: {e}', failures[i][1])
+
+	results: List[Dict[str, Any]] = []
+	for i, (_, category) in enumerate(built):
+		if parsed[i] is None:
+			logger.error(f'Error summarizing email {i} of batch: {failures[i][0]}')
+			error, answer = failures[i]
+			results.append(
+				{
+					'summary': None,
+					'category': category,
+					'category_source': 'classifier' if category else None,
+					'project_name': None,
+					'prompt_version': None,
+					'llm_model': None,
+					'failure': {'error': error, 'response': answer},
+				}
+			)
+			continue
+		results.append(
+			{
+				'summary': parsed[i]['summary'],
+				'category': category or normalize_category(parsed[i]['category']),
+				'category_source': 'classifier' if category else 'llm',
+				'project_name': parsed[i]['project_name'],
+				'prompt_version': SUMMARY_VERSION,
+				'llm_model': llm_model,
+				'failure': None,
+			}
+		)
+	if stopped is not None:
+		raise BudgetStopped(str(stopped), results)
+	return results
+
+
+def record_failure(email: Email, failure: Dict[str, Any]) -> None:
+	"""
+	Keep a failed summarization, the email stays without a new summary until `manage.py resummarize` retries it.
+	"""
+	llm_failure = LLMFailure(email=email, endpoint='summarize', prompt_version=SUMMARY_VERSION, error=failure['error'])
+	llm_failure.response = failure['response']
+	llm_failure.save()
+
+
+def summarize_batch(messages: List[Dict[str, Any]], concurrency: int = 1) -> List[Dict[str, Any]]:
+	"""
+	Summarize a batch of parsed messages without saving them.
+
+	Near-duplicates of stored emails or of earlier messages in the batch reuse their summary,
+	the remaining messages are summarized by summarize_messages.
+	"""
+	signatures = [compute_signature(message.get('message_content')) for message in messages]
+	prepared: List[Dict[str, Any]] = []
+	to_summarize: List[int] = []
+	for i, signature in enumerate(signatures):
+		item = {'signature': signature, 'original': find_duplicate(signature), 'twin': None}
+		prepared.append(item)
+		if item['original'] is not None:
+			item.update(summary_fields(item['original']))
+			continue
+		if signature is not None:
+			item['twin'] = next(
+				(
+					j
+					for j in to_summarize
+					if signatures[j] is not None
+					and similarity(signature, signatures[j]) >= settings.DUPLICATE_SIMILARITY_THRESHOLD
+				),
+				None,
+			)
+		if item['twin'] is None:
+			to_summarize.append(i)
+
+	try:
+		results = summarize_messages([messages[i] for i in to_summarize], concurrency)
+		stopped = None
+	except BudgetStopped as e:
+		results, stopped = e.results, e
+	for i, result in zip(to_summarize, results):
+		prepared[i].update(result)
+
+	if stopped is not None:
+		raise BudgetStopped(str(stopped), prepared)
+	return prepared
+
+
+SUMMARY_KEYS = ('summary', 'category', 'category_source', 'project_name', 'prompt_version', 'llm_model')
+
+
+def summary_fields(email: Email) -> Dict[str, Any]:
+	return {key: getattr(email, key) for key in SUMMARY_KEYS}
+
+
+def stale_emails():
+	"""
+	Emails whose summary was produced by another prompt version or model, or that have none.
+
+	Near-duplicates follow their original and are left out. Emails without a summary come first, then the newest.
+	"""
+	return (
+		Email.objects.filter(duplicate_of__isnull=True)
+		.exclude(prompt_version=SUMMARY_VERSION, llm_model=configured_model())
+		.annotate(summarized=Case(When(encrypted_summary__isnull=True, then=0), default=1))
+		.order_by('summarized', '-created_at')
+	)
+
+
+def resummarize_emails(emails: List[Email], concurrency: int = 1) -> List[Email]:
+	"""
+	Summarize stored emails again with the current prompt and model, returns the emails that failed.
+
+	Each email keeps serving its old summary until the new one replaces it together with its near-duplicates,
+	the project index follows the new project name.
+	"""
+	messages = [{'subject': email.subject, 'message_content': email.message_content} for email in emails]
+	try:
+		results = summarize_messages(messages, concurrency)
+		stopped = None
+	except BudgetStopped as e:
+		results, stopped = e.results, e
+	failed = []
+	for email, result in zip(emails, results):
+		if result['failure'] is not None:
+			record_failure(email, result['failure'])
+			failed.append(email)
+			continue
+		email.summary = result['summary']
+		email.category = result['category']
+		email.category_source = result['category_source']
+		email.project_name = result['project_name']
+		email.prompt_version = result['prompt_version']
+		email.llm_model = result['llm_model']
+		email.summarized_at = timezone.now()
+		fields = [
+			'encrypted_summary',
+			'encrypted_category',
+			'category_index',
+			'category_source',
+			'encrypted_project_name',
+			'prompt_version',
+			'llm_model',
+			'summarized_at',
+		]
+		with transaction.atomic():
+			email.save(update_fields=fields)
+			email.duplicates.update(**{field: getattr(email, field) for field in fields})
+			email.llm_failures.filter(resolved=False).update(resolved=True)
+			index_projects([email, *email.duplicates.only(*INDEX_COLUMNS)], replace_llm=True)
+	if stopped is not None:
+		raise stopped
+	return failed
+
+
+def save_batch(messages: List[Dict[str, Any]], prepared: List[Dict[str, Any]], source_path: Optional[str] = None) -> int:
+	"""
+	Save the messages summarized by summarize_batch and index them, returns the number of saved emails.
+
+	Messages whose summarization failed are saved without a summary, so the paid call is not lost.
+	source_path is the mail file of the messages, a project code in its name links them to that project.
+	"""
+	saved: Dict[int, Email] = {}
+	for i, (message, item) in enumerate(zip(messages, prepared)):
+		original = item['original']
+		if item['twin'] is not None:
+			# near-duplicate of an earlier message of this batch
+			if item['twin'] in saved:
+				original = saved[item['twin']]
+				item.update(summary_fields(original))
+			else:
+				# the twin failed to save, this message is stored on its own with the twin's summary result
+				twin = prepared[item['twin']]
+				item.update({key: twin[key] for key in (*SUMMARY_KEYS, 'failure')})
+
+		try:
+			# savepoint, so a failing row does not break a surrounding transaction
+			with transaction.atomic():
+				saved[i] = save_email(message, item, original)
+		except Exception as e:
+			logger.error(f'Error saving email {i} of batch: {e}')
+
+	index_emails(list(saved.values()), source_path)
+	return len(saved)
+
+
+def ingest_batch(messages: List[Dict[str, Any]], concurrency: int = 1) -> int:
+	"""
+	Summarize and save a batch of parsed messages, returns the number of saved emails.
+	"""
+	try:
+		prepared = summarize_batch(messages, concurrency)
+	except BudgetStopped as e:
+		save_batch(messages, e.results)
+		raise
+	return save_batch(messages, prepared)
+
+
+def ingest_file(
+	path: str,
+	content_hash: str,
+	messages: List[Dict[str, Any]],
+	batch_size: int,
+	concurrency: int = 1,
+	on_batch: Optional[Callable[[int, int], None]] = None,
+	file_stat: Optional[os.stat_result] = None,
+) -> int:
+	"""
+	Ingest the messages of one mail file, resuming from and updating its IngestCheckpoint.
+
+	Mail files are treated as append-only: when a file changed, only messages after the
+	checkpointed position are ingested. Each batch is saved together with the checkpoint.
+	file_stat, taken before the file was read, is remembered so watchers can skip unchanged files.
+	"""
+	checkpoint, _ = IngestCheckpoint.objects.get_or_create(path=path, defaults={'content_hash': content_hash})
+	if checkpoint.completed and checkpoint.content_hash == content_hash:
+		if file_stat is not None and checkpoint.file_mtime_ns != file_stat.st_mtime_ns:
+			IngestCheckpoint.objects.filter(pk=checkpoint.pk).update(
+				file_size=file_stat.st_size, file_mtime_ns=file_stat.st_mtime_ns
+			)
+		return 0
+
+	saved = 0
+	start = min(checkpoint.messages_done, len(messages))
+	for offset in range(start, len(messages), batch_size):
+		batch = messages[offset : offset + batch_size]
+		try:
+			prepared = summarize_batch(batch, concurrency)
+			stopped = None
+		except BudgetStopped as e:
+			# the batch is paid for, save and checkpoint it before stopping
+			prepared, stopped = e.results, e
+		with transaction.atomic():
+			batch_saved = save_batch(batch, prepared, path)
+			checkpoint.content_hash = content_hash
+			checkpoint.messages_done = offset + len(batch)
+			checkpoint.total_messages = len(messages)
+			checkpoint.completed = False
+			checkpoint.error = None
+			checkpoint.save()
+		saved += batch_saved
+		if on_batch is not None:
+			on_batch(len(batch), batch_saved)
+		if stopped is not None:
+			raise stopped
+
+	checkpoint.content_hash = content_hash
+	checkpoint.messages_done = checkpoint.total_messages = len(messages)
+	checkpoint.completed = True
+	checkpoint.error = None
+	if file_stat is not None:
+		checkpoint.file_size = file_stat.st_size
+		checkpoint.file_mtime_ns = file_stat.st_mtime_ns
+	checkpoint.save()
+	return saved
+
+
+def record_file_error(path: str, error: str) -> None:
+	"""
+	Remember why a mail file failed, it is retried by the next run.
+	"""
+	logger.error(f'Error ingesting {path}: {error}')
+	IngestCheckpoint.objects.update_or_create(path=path, defaults={'error': error, 'completed': False})
+
+
+def save_email(message: Dict[str, Any], item: Dict[str, Any], original: Optional[Email]) -> Email:
+	"""
+	Store a summarized message and add it to the near-duplicate index.
+	"""
+	email = Email.objects.create(
+		sender_name=message.get('sender_name'),
+		sender_email=message.get('sender_email'),
+		recipient_name=message.get('recipient_name'),
+		recipient_email=message.get('recipient_email'),
+		subject=message.get('subject'),
+		date=message.get('date'),
+		message_content=message.get('message_content'),
+		summary=item['summary'],
+		category=item['category'],
+		category_source=item['category_source'],
+		project_name=item['project_name'],
+		prompt_version=item['prompt_version'],
+		llm_model=item['llm_model'],
+		duplicate_of=original,
+	)
+	if item.get('failure'):
+		record_failure(email, item['failure'])
+	index_email(email, item['signature'])
+	return email
@@ -0,0 +1,148 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from django.conf import settings
+
+from . import usage
+from .scheduler import INTERACTIVE, get_scheduler
+
+# Process-wide clients, created on first use so that importing the app never touches LangChain or the network
+_clients: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def _http_client():
+	"""
+	Shared keep-alive HTTP connection pool used by every LLM client of the process.
+	"""
+	import httpx
+
+	with _lock:
+		if 'http' not in _clients:
+			_clients['http'] = httpx.Client(
+				limits=httpx.Limits(
+					max_connections=settings.LLM_MAX_CONNECTIONS, max_keepalive_connections=settings.LLM_MAX_CONNECTIONS
+				),
+				timeout=settings.LLM_TIMEOUT,
+			)
+		return _clients['http']
+
+
+def get_llm(name: str = 'default'):
+	"""
+	LangChain chat model configured in settings.LLM_MODELS under name, constructed once per process.
+	"""
+	key = f'llm:{name}'
+	client = _clients.get(key)
+	if client is not None:
+		return client
+
+	from langchain_openai.chat_models import ChatOpenAI
+
+	http_client = _http_client()
+	with _lock:
+		if key not in _clients:
+			_clients[key] = ChatOpenAI(base_url=settings.LLM_BASE_URL, http_client=http_client, **settings.LLM_MODELS[name])
+		return _clients[key]
+
+
+def get_openai_client():
+	"""
+	Plain OpenAI client for calls that need the raw API, constructed once per process.
+	"""
+	client = _clients.get('openai')
+	if client is not None:
+		return client
+
+	api_key = os.getenv('OPEN_AI_TOKEN')
+	if not api_key:
+		raise ValueError('OPEN_AI_TOKEN environment variable not set')
+
+	from openai import OpenAI
+
+	http_client = _http_client()
+	with _lock:
+		if 'openai' not in _clients:
+			_clients['openai'] = OpenAI(api_key=api_key, base_url=settings.LLM_BASE_URL, http_client=http_client)
+		return _clients['openai']
+
+
+def set_llm(model, name: str = 'default'):
+	"""
+	Replace the chat model registered under name (e.g. with a local fake), returns the previous one or None.
+	"""
+	key = f'llm:{name}'
+	with _lock:
+		previous = _clients.get(key)
+		if model is None:
+			_clients.pop(key, None)
+		else:
+			_clients[key] = model
+	return previous
+
+
+def model_name(llm) -> str:
+	return getattr(llm, 'model_name', None) or type(llm).__name__
+
+
+def configured_model(name: str = 'default') -> str:
+	"""
+	Name of the model registered under name, read from settings.LLM_MODELS without creating a client.
+	"""
+	client = _clients.get(f'llm:{name}')
+	return model_name(client) if client is not None else settings.LLM_MODELS[name]['model']
+
+
+def llm_batch(
+	prompts: List[Any],
+	endpoint: str,
+	concurrency: int = 1,
+	name: str = 'default',
+	return_exceptions: bool = True,
+	json_mode: bool = False,
+):
+	"""
+	Run prompts through the chat model registered under name, checking the token budgets first
+	and recording the usage under endpoint. Raises usage.BudgetExceeded before calling the model.
+
+	With json_mode the server is asked for a JSON object response, unless settings.LLM_JSON_MODE is off.
+	Every call waits for a scheduler slot of the priority of the current job, calls outside a job are interactive.
+	"""
+	if not prompts:
+		return []
+	llm = get_llm(name)
+	runnable = llm.bind(response_format={'type': 'json_object'}) if json_mode and settings.LLM_JSON_MODE else llm
+	job = usage.current_job()
+	priority = job.priority if job else INTERACTIVE
+	scheduler = get_scheduler()
+
+	def call(prompt):
+		with scheduler.slot(priority, job.id if job else None):
+			try:
+				return runnable.invoke(prompt)
+			except Exception as e:
+				if return_exceptions:
+					return e
+				raise
+
+	reserved = usage.reserve(prompts)
+	try:
+		if len(prompts) == 1 or concurrency == 1:
+			responses = [call(prompt) for prompt in prompts]
+		else:
+			with ThreadPoolExecutor(max_workers=min(concurrency, len(prompts))) as executor:
+				responses = list(executor.map(call, prompts))
+	except Exception:
+		usage.release(reserved)
+		raise
+	usage.record_responses(endpoint, model_name(llm), prompts, responses, reserved)
+	return responses
+
+
+def llm_invoke(prompt: Any, endpoint: str, name: str = 'default', json_mode: bool = False):
+	"""
+	Single call of llm_batch, raises the error of a failed call.
+	"""
+	return llm_batch([prompt], endpoint, name=name, return_exceptions=False, json_mode=json_mode)[0]
@@ -1,59 +1,34 @@
-import json
-import os
 from typing import Any, Dict, Optional
 
 import pandas as pd
-from openai import OpenAI
+from django.conf import settings
 
-from .test_connection import llm
+from . import usage
+from .llm_client import llm_batch, llm_invoke
+from .prompts import KEY_INFORMATION_PROMPT, KEY_INFORMATION_SYSTEM_PROMPT, SUMMARY_TEXT_PROMPT
+from .structured import extract_json
+
+
+def dataframe_job(kind: str) -> usage.Job:
+	# DataFrame helpers run as a bulk job with the usual budget, unless the caller already started one
+	return usage.current_job() or usage.Job(kind, settings.LLM_JOB_TOKEN_BUDGET)
 
 
 def extract_key_information_by_llm(
-	subject: Optional[str], content: Optional[str], model_name: str = 'meta-llama/Llama-3.3-70B-Instruct'
+	subject: Optional[str], content: Optional[str], name: str = 'key_information'
 ) -> Dict[str, Any]:
 	"""
 	Extract structured key information from email content using LLM.
 	"""
-	api_key = os.getenv('OPEN_AI_TOKEN')
-
-	if not api_key:
-		raise ValueError('OPEN_AI_TOKEN environment variable not set')
-
-	client = OpenAI(api_key=api_key, base_url='https://llmlab.plgrid.pl/api/v1')
-	text = f'Subject: {subject or "N/A"}\n\nContent: {content or "N/A"}'
-
-	prompt = f"""Extract key information from the following email and return it as JSON with these fields:
-- project_name: Name of the project or system (if mentioned)
-- key_requirements: Array of key requirements, features, or specifications
-- risks: Array of risks, concerns, or issues mentioned
-- decisions: Array of decisions made or action items
-- technical_details: Array of technical details (APIs, endpoints, databases, architectures)
-- stakeholders: Array of people, teams, or departments mentioned
-- timeline: Any deadlines, dates, or timeline information (if mentioned)
-
-Email:
-{text}
-
-Return only valid JSON, nothing else. If a field has no information, use null or empty array."""
+	prompt = KEY_INFORMATION_PROMPT.format(subject=subject or 'N/A', content=content or 'N/A')
+	messages = [('system', KEY_INFORMATION_SYSTEM_PROMPT), ('human', prompt)]
 
 	try:
-		response = client.chat.completions.create(
-			model=model_name,
-			messages=[
-				{
-					'role': 'system',
-					'content': 'You are an expert at extracting structured information from emails. Always return valid JSON.',
-				},
-				{'role': 'user', 'content': prompt},
-			],
-			response_format={'type': 'json_object'},
-			temperature=0.1,
-			max_tokens=100,
-		)
-
-		result = json.loads(response.choices[0].message.content)
-		return result
-
+		response = llm_invoke(messages, 'key_information', name=name, json_mode=True)
+		result = extract_json(response.content)
+		return result if isinstance(result, dict) else {}
+	except usage.BudgetExceeded:
+		raise
 	except Exception as e:
 		print(f'Error in LLM information extraction: {e}')
 		return {}
@@ -83,22 +58,10 @@ def add_summary_to_dataframe(
 			skipped_count += 1
 			tasks.append('')
 		else:
-			tasks.append(
-				f"""Extract key information and create a concise summary of the following email.
-Focus on:
-- Main topic or project
-- Key requirements or specifications
-- Important decisions or action items
-- Risks or concerns mentioned
-- Technical details (APIs, systems, integrations)
+			tasks.append(SUMMARY_TEXT_PROMPT.format(subject=subject or 'N/A', content=content or 'N/A'))
 
-Email:
-{f'Subject: {subject or "N/A"}\n\nContent: {content or "N/A"}'}
-
-Provide a clear, concise summary (2-4 sentences) that captures the essential information."""
-			)
-
-	result = llm.batch(tasks)
+	with usage.activate(dataframe_job('dataframe_summary')):
+		result = llm_batch(tasks, 'dataframe_summary', concurrency=settings.LLM_CONCURRENCY, return_exceptions=False)
 
 	summaries: list[str] = [resp.content for resp in result]
 
@@ -111,7 +74,7 @@ def add_key_information_to_dataframe(
 	df: pd.DataFrame,
 	subject_column: str = 'subject',
 	content_column: str = 'message_content',
-	model_name: str = 'meta-llama/Llama-3.3-70B-Instruct',
+	name: str = 'key_information',
 ) -> pd.DataFrame:
 	"""
 	Add columns with extracted key information to DataFrame using LLM.
@@ -125,22 +88,23 @@ def add_key_information_to_dataframe(
 	df['stakeholders'] = None
 	df['timeline'] = None
 
-	for idx, row in df.iterrows():
-		subject = row.get(subject_column)
-		content = row.get(content_column)
+	with usage.activate(dataframe_job('key_information')):
+		for idx, row in df.iterrows():
+			subject = row.get(subject_column)
+			content = row.get(content_column)
 
-		if pd.isna(subject) and pd.isna(content):
-			continue
-
-		extracted = extract_key_information_by_llm(subject, content, model_name=model_name)
-
-		if extracted:
-			df.at[idx, 'project_name'] = extracted.get('project_name')
-			df.at[idx, 'key_requirements'] = extracted.get('key_requirements', [])
-			df.at[idx, 'risks'] = extracted.get('risks', [])
-			df.at[idx, 'decisions'] = extracted.get('decisions', [])
-			df.at[idx, 'technical_details'] = extracted.get('technical_details', [])
-			df.at[idx, 'stakeholders'] = extracted.get('stakeholders', [])
-			df.at[idx, 'timeline'] = extracted.get('timeline')
+			if pd.isna(subject) and pd.isna(content):
+				continue
+
+			extracted = extract_key_information_by_llm(subject, content, name=name)
+
+			if extracted:
+				df.at[idx, 'project_name'] = extracted.get('project_name')
+				df.at[idx, 'key_requirements'] = extracted.get('key_requirements', [])
+				df.at[idx, 'risks'] = extracted.get('risks', [])
+				df.at[idx, 'decisions'] = extracted.get('decisions', [])
+				df.at[idx, 'technical_details'] = extracted.get('technical_details', [])
+				df.at[idx, 'stakeholders'] = extracted.get('stakeholders', [])
+				df.at[idx, 'timeline'] = extracted.get('timeline')
 
 	return df
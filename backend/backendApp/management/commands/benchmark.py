@@ -0,0 +1,59 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...benchmark.suite import STAGES, run_suite
+
+
+class Command(BaseCommand):
+	help = 'Run the reproducible benchmark suite against synthetic mailboxes and a fake LLM, emitting JSON results.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--messages', type=int, default=1000, help='Messages generated for parse/encryption stages.')
+		parser.add_argument('--db-messages', type=int, default=200, help='Messages ingested for the database stages.')
+		parser.add_argument('--messages-per-file', type=int, default=5)
+		parser.add_argument('--llm-latency', type=float, default=0.0, help='Seconds the fake LLM sleeps per call.')
+		parser.add_argument('--repeat', type=int, default=5, help='Repetitions for latency measurements.')
+		parser.add_argument('--seed', type=int, default=0)
+		parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+		parser.add_argument(
+			'--check-imports',
+			action='store_true',
+			help='Fail when loading the URL configuration imports heavy modules such as pandas or LangChain.',
+		)
+		parser.add_argument('--output', help='Write the JSON results to this file instead of stdout.')
+
+	def handle(self, *args, **options):
+		if options['messages'] < 1 or options['db_messages'] < 1:
+			raise CommandError('--messages and --db-messages must be positive')
+
+		results = run_suite(
+			messages=options['messages'],
+			db_messages=options['db_messages'],
+			messages_per_file=options['messages_per_file'],
+			latency=options['llm_latency'],
+			repeat=options['repeat'],
+			seed=options['seed'],
+			stages=options['stages'],
+			log=lambda message: self.stderr.write(message),
+		)
+
+		output = json.dumps(results, indent=2)
+		if options['check_imports']:
+			imports = results['results'].get('imports')
+			if imports is None:
+				raise CommandError('--check-imports needs the imports stage')
+			# a crashed startup imports nothing heavy, it must not pass the check
+			if imports['returncode'] or imports.get('error'):
+				self.stdout.write(output)
+				raise CommandError(f'Startup failed with exit code {imports["returncode"]}: {imports.get("error")}')
+			if imports['heavy_modules']:
+				self.stdout.write(output)
+				raise CommandError(f'Heavy modules imported at startup: {", ".join(imports["heavy_modules"])}')
+
+		if options['output']:
+			with open(options['output'], 'w', encoding='utf-8') as f:
+				f.write(output)
+			self.stderr.write(f'Results written to {options["output"]}')
+		else:
+			self.stdout.write(output)
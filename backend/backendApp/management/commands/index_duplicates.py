@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from ...dedup import compute_signature, index_email
+from ...models import Email
+
+
+class Command(BaseCommand):
+	help = 'Add emails stored before near-duplicate detection existed to the MinHash/LSH index.'
+
+	def handle(self, *args, **options):
+		indexed = 0
+		for email in Email.objects.filter(minhash=None).iterator():
+			signature = compute_signature(email.message_content)
+			if signature is not None:
+				index_email(email, signature)
+				indexed += 1
+		self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} emails'))
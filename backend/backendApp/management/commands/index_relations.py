@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ...relations import rebuild
+
+
+class Command(BaseCommand):
+	help = 'Rebuild the communication graph and the project index from the stored emails.'
+
+	def handle(self, *args, **options):
+		indexed = rebuild()
+		self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} emails'))
@@ -0,0 +1,185 @@
+import collections
+import itertools
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import usage
+from ...emails import list_mail_files, parse_mail_file
+from ...ingest import ingest_file, record_file_error
+from ...models import IngestCheckpoint
+
+
+def _ignore_sigint() -> None:
+	# Ctrl-C is handled by the main process, which saves progress and stops the workers
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def parse_or_error(path: str) -> Tuple[str, Optional[str], Optional[list], Optional[str]]:
+	# one unreadable file must not stop the backfill, it is reported and skipped
+	try:
+		return (*parse_mail_file(path), None)
+	except Exception as e:
+		return path, None, None, f'{type(e).__name__}: {e}'
+
+
+class Progress:
+	"""
+	Live throughput and ETA readout, the ETA is estimated from the bytes of the remaining files.
+	"""
+
+	def __init__(self, stream, total_files: int, total_bytes: int):
+		self.stream = stream
+		self.total_files = total_files
+		self.total_bytes = total_bytes
+		self.files_done = 0
+		self.bytes_done = 0
+		self.bytes_skipped = 0
+		self.messages = 0
+		self.saved = 0
+		self.failed = 0
+		self.started = time.monotonic()
+		self.last_render = 0.0
+		self.interactive = stream.isatty()
+
+	def file_done(self, size: int, skipped: bool) -> None:
+		self.files_done += 1
+		if skipped:
+			self.bytes_skipped += size
+		else:
+			self.bytes_done += size
+		self.render()
+
+	def batch_done(self, messages: int, saved: int) -> None:
+		self.messages += messages
+		self.saved += saved
+		self.render()
+
+	def render(self, force: bool = False) -> None:
+		now = time.monotonic()
+		if not force and now - self.last_render < (0.5 if self.interactive else 10):
+			return
+		self.last_render = now
+
+		elapsed = now - self.started
+		rate = self.messages / elapsed if elapsed else 0.0
+		remaining = self.total_bytes - self.bytes_done - self.bytes_skipped
+		eta = f'{remaining * elapsed / self.bytes_done:.0f}s' if self.bytes_done else '?'
+		line = (
+			f'{self.files_done}/{self.total_files} files ({self.failed} failed), {self.messages} messages, {self.saved} saved, '
+			f'{rate:.1f} msg/s, elapsed {elapsed:.0f}s, ETA {eta}'
+		)
+		if self.interactive:
+			self.stream.write(f'\r{line}\x1b[K', ending='')
+			self.stream.flush()
+		else:
+			self.stream.write(line)
+
+
+class Command(BaseCommand):
+	help = 'Ingest mail files from the CLI with checkpointing, rerun the same command to resume after a crash or Ctrl-C.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('paths', nargs='+', help='Directories with .txt mail files.')
+		parser.add_argument('--workers', type=int, default=1, help='Processes used to read and parse mail files.')
+		parser.add_argument(
+			'--concurrency', type=int, default=settings.LLM_CONCURRENCY, help='Parallel LLM calls while summarizing a batch.'
+		)
+		parser.add_argument(
+			'--batch-size', type=int, default=settings.INGEST_BATCH_SIZE, help='Messages summarized and saved per checkpoint.'
+		)
+		parser.add_argument(
+			'--token-budget',
+			type=int,
+			default=settings.LLM_JOB_TOKEN_BUDGET,
+			help='Stop before the LLM usage of this run exceeds this many tokens.',
+		)
+		parser.add_argument('--restart', action='store_true', help='Forget saved progress of these files and start over.')
+
+	def handle(self, *args, **options):
+		if options['workers'] < 1 or options['concurrency'] < 1 or options['batch_size'] < 1:
+			raise CommandError('--workers, --concurrency and --batch-size must be positive')
+
+		files = sorted({os.path.abspath(path) for data_dir in options['paths'] for path in list_mail_files(data_dir)})
+		if not files:
+			raise CommandError('No .txt files found')
+		if options['restart']:
+			IngestCheckpoint.objects.filter(path__in=files).delete()
+
+		stats = {path: os.stat(path) for path in files}
+		progress = Progress(self.stderr, len(files), sum(stat.st_size for stat in stats.values()))
+		self.stderr.write(f'Ingesting {len(files)} files with {options["workers"]} workers')
+
+		try:
+			with usage.activate(usage.Job('ingest', options['token_budget'])):
+				for path, content_hash, messages, error in self.parse_files(files, options['workers']):
+					if error is not None:
+						record_file_error(path, error)
+						progress.failed += 1
+						progress.file_done(stats[path].st_size, skipped=True)
+						continue
+					before = progress.messages
+					try:
+						ingest_file(
+							path,
+							content_hash,
+							messages,
+							options['batch_size'],
+							options['concurrency'],
+							on_batch=progress.batch_done,
+							file_stat=stats[path],
+						)
+					except usage.BudgetExceeded:
+						raise
+					except Exception as e:
+						# batches saved before the error stay checkpointed, the rest of the file is retried next run
+						record_file_error(path, f'{type(e).__name__}: {e}')
+						progress.failed += 1
+					progress.file_done(stats[path].st_size, skipped=progress.messages == before)
+		except usage.BudgetExceeded as e:
+			progress.render(force=True)
+			self.stderr.write('')
+			raise CommandError(f'{e}. Progress is saved, run the same command again to continue.')
+		except KeyboardInterrupt:
+			progress.render(force=True)
+			self.stderr.write('')
+			self.stderr.write(self.style.WARNING('Interrupted, progress is saved. Run the same command again to resume.'))
+			sys.exit(130)
+
+		progress.render(force=True)
+		self.stderr.write('')
+		self.stdout.write(
+			self.style.SUCCESS(
+				f'Done: {progress.messages} messages processed, {progress.saved} emails saved, {progress.failed} files failed'
+			)
+		)
+
+	def parse_files(self, files: List[str], workers: int) -> Iterator[Tuple[str, Optional[str], Optional[list], Optional[str]]]:
+		"""
+		Yield parsed files in order, parsing ahead in a process pool with a bounded number of pending files.
+		Files that fail to read or parse are yielded with their error instead of messages.
+		"""
+		if workers == 1:
+			yield from map(parse_or_error, files)
+			return
+
+		executor = ProcessPoolExecutor(max_workers=workers, initializer=_ignore_sigint)
+		try:
+			remaining = iter(files)
+			pending = collections.deque(
+				executor.submit(parse_or_error, path) for path in itertools.islice(remaining, workers * 2)
+			)
+			while pending:
+				result = pending.popleft().result()
+				next_path = next(remaining, None)
+				if next_path is not None:
+					pending.append(executor.submit(parse_or_error, next_path))
+				yield result
+		finally:
+			executor.shutdown(wait=False, cancel_futures=True)
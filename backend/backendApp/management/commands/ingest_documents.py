@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...documents import ingest_documents, list_document_files
+from ...models import Email
+
+
+class Command(BaseCommand):
+	help = 'Extract PDF, DOCX and text documents into token-budgeted chunks, documents extracted before are reused.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('paths', nargs='+', help='Documents or directories with documents.')
+		parser.add_argument('--email', help='Id of the email the documents are attached to.')
+		parser.add_argument('--workers', type=int, default=settings.DOCUMENT_WORKERS, help='Processes used to extract documents.')
+
+	def handle(self, *args, **options):
+		if options['workers'] < 1:
+			raise CommandError('--workers must be positive')
+
+		email = None
+		if options['email']:
+			email = Email.objects.filter(pk=options['email']).only('id').first()
+			if email is None:
+				raise CommandError(f'Email {options["email"]} not found')
+
+		files = [file for path in options['paths'] for file in list_document_files(path)]
+		if not files:
+			raise CommandError('No documents found')
+
+		extracted = cached_count = 0
+		for path, document, cached in ingest_documents(files, email, options['workers']):
+			extracted += not cached
+			cached_count += cached
+			state = 'cached' if cached else 'extracted'
+			self.stderr.write(f'{path}: {state}, {document.pages} pages, {document.tokens} tokens')
+
+		self.stdout.write(
+			self.style.SUCCESS(
+				f'Done: {extracted} extracted, {cached_count} cached, {len(files) - extracted - cached_count} failed'
+			)
+		)
@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import usage
+from ...ingest import resummarize_emails, stale_emails
+from ...prompts import SUMMARY_VERSION
+from ...scheduler import BACKFILL
+
+# columns needed to build the prompt and to index the projects of an email, the rest stays deferred
+PROMPT_COLUMNS = ('id', 'encrypted_subject', 'encrypted_message_content', 'encrypted_date', 'created_at')
+
+
+class Command(BaseCommand):
+	help = 'Re-summarize emails whose summary came from an older prompt version or another model, old summaries stay readable.'
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--batch-size', type=int, default=settings.INGEST_BATCH_SIZE, help='Emails summarized and written per batch.'
+		)
+		parser.add_argument(
+			'--concurrency', type=int, default=settings.LLM_CONCURRENCY, help='Parallel LLM calls while summarizing a batch.'
+		)
+		parser.add_argument('--limit', type=int, help='Stop after this many emails.')
+		parser.add_argument(
+			'--token-budget',
+			type=int,
+			default=settings.LLM_JOB_TOKEN_BUDGET,
+			help='Stop before the LLM usage of this run exceeds this many tokens.',
+		)
+		parser.add_argument('--dry-run', action='store_true', help='Only count the stale emails.')
+
+	def handle(self, *args, **options):
+		if options['batch_size'] < 1 or options['concurrency'] < 1:
+			raise CommandError('--batch-size and --concurrency must be positive')
+
+		total = stale_emails().count()
+		if options['limit'] is not None:
+			total = min(total, options['limit'])
+		self.stderr.write(f'{total} emails to re-summarize with prompt version {SUMMARY_VERSION}')
+		if options['dry_run'] or not total:
+			return
+
+		done = 0
+		failed_ids = set()
+		try:
+			with usage.activate(usage.Job('resummarize', options['token_budget'], BACKFILL)):
+				while done + len(failed_ids) < total:
+					size = min(options['batch_size'], total - done - len(failed_ids))
+					# rewritten emails drop out of the stale set, failed ones are skipped for the rest of the run
+					batch = list(stale_emails().exclude(id__in=failed_ids).only(*PROMPT_COLUMNS)[:size])
+					if not batch:
+						break
+					failed = resummarize_emails(batch, options['concurrency'])
+					failed_ids.update(email.id for email in failed)
+					done += len(batch) - len(failed)
+					self.stderr.write(f'{done}/{total} re-summarized, {len(failed_ids)} failed')
+		except usage.BudgetExceeded as e:
+			raise CommandError(f'{e}. {done} emails were re-summarized, run the command again to continue.')
+
+		self.stdout.write(self.style.SUCCESS(f'Done: {done} emails re-summarized, {len(failed_ids)} failed'))
@@ -0,0 +1,53 @@
+import random
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...classifier import CategoryClassifier, training_data
+
+
+class Command(BaseCommand):
+	help = 'Train the local email category classifier on the LLM or manually labelled emails stored in the database.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--epochs', type=int, default=15)
+		parser.add_argument('--holdout', type=float, default=0.2, help='Fraction of emails kept aside for evaluation.')
+		parser.add_argument('--min-samples', type=int, default=20)
+		parser.add_argument('--seed', type=int, default=0)
+		parser.add_argument(
+			'--include-legacy',
+			action='store_true',
+			help='Also train on emails stored before label sources were recorded, which may include classifier labels.',
+		)
+
+	def handle(self, *args, **options):
+		texts, labels = training_data(options['include_legacy'])
+		if len(texts) < options['min_samples'] or len(set(labels)) < 2:
+			raise CommandError(f'Not enough labelled emails to train on ({len(texts)} emails, {len(set(labels))} categories)')
+
+		order = list(range(len(texts)))
+		random.Random(options['seed']).shuffle(order)
+		split = int(len(order) * (1 - options['holdout']))
+		train, test = order[:split], order[split:]
+
+		if test:
+			model = CategoryClassifier.fit(
+				[texts[i] for i in train], [labels[i] for i in train], epochs=options['epochs'], seed=options['seed']
+			)
+			predictions = [model.predict(texts[i]) for i in test]
+			accuracy = sum(label == labels[i] for (label, _), i in zip(predictions, test)) / len(test)
+			confident = [
+				(label, i)
+				for (label, confidence), i in zip(predictions, test)
+				if confidence >= settings.CATEGORY_CONFIDENCE_THRESHOLD
+			]
+			confident_accuracy = sum(label == labels[i] for label, i in confident) / len(confident) if confident else 0.0
+			self.stdout.write(
+				f'Holdout accuracy {accuracy:.3f}, {len(confident)}/{len(test)} above threshold '
+				f'with accuracy {confident_accuracy:.3f}'
+			)
+
+		# final model is trained on every labelled email
+		model = CategoryClassifier.fit(texts, labels, epochs=options['epochs'], seed=options['seed'])
+		model.save(settings.CATEGORY_MODEL_PATH)
+		self.stdout.write(self.style.SUCCESS(f'Trained on {len(texts)} emails, saved to {settings.CATEGORY_MODEL_PATH}'))
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...watcher import MailWatcher
+
+
+class Command(BaseCommand):
+	help = 'Watch mail directories and continuously ingest new or modified .txt files.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('paths', nargs='*', help='Directories to watch, defaults to settings.MAIL_DIRS.')
+		parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls.')
+		parser.add_argument('--debounce', type=float, default=2.0, help='Seconds a file must stay unchanged before ingesting.')
+		parser.add_argument('--queue-size', type=int, default=16, help='Ready files buffered before applying backpressure.')
+		parser.add_argument('--workers', type=int, default=1, help='Threads ingesting queued files.')
+		parser.add_argument('--concurrency', type=int, default=settings.LLM_CONCURRENCY)
+		parser.add_argument('--batch-size', type=int, default=settings.INGEST_BATCH_SIZE)
+		parser.add_argument(
+			'--token-budget', type=int, default=settings.LLM_JOB_TOKEN_BUDGET, help='Stop before LLM usage exceeds this.'
+		)
+		parser.add_argument('--once', action='store_true', help='Ingest what changed since the last run and exit.')
+
+	def handle(self, *args, **options):
+		if options['queue_size'] < 1 or options['workers'] < 1 or options['batch_size'] < 1:
+			raise CommandError('--queue-size, --workers and --batch-size must be positive')
+
+		watcher = MailWatcher(
+			options['paths'] or settings.MAIL_DIRS,
+			interval=options['interval'],
+			debounce=options['debounce'],
+			queue_size=options['queue_size'],
+			workers=options['workers'],
+			batch_size=options['batch_size'],
+			concurrency=options['concurrency'],
+			token_budget=options['token_budget'],
+			log=self.stdout.write,
+		)
+		self.stdout.write(f'Watching {", ".join(watcher.directories)}')
+		try:
+			watcher.run(once=options['once'])
+		except KeyboardInterrupt:
+			self.stdout.write(self.style.WARNING('Stopping, progress is saved'))
+		self.stdout.write(self.style.SUCCESS(f'Ingested {watcher.ingested_messages} emails from {watcher.ingested_files} files'))
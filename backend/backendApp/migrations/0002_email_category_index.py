@@ -0,0 +1,89 @@
+import hashlib
+import hmac
+import re
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Copies of the app helpers as they were when this migration was written, so later changes to them
+# do not change what the migration does
+OTHER = 'other'
+CATEGORIES = [
+	'project_update',
+	'requirements',
+	'technical',
+	'meeting',
+	'incident',
+	'security',
+	'legal',
+	'finance',
+	'sales',
+	'hr',
+	'announcement',
+	OTHER,
+]
+CATEGORY_KEYWORDS = [
+	('security', ['security', 'bezpiecze', 'privacy', 'rodo', 'gdpr', 'compliance', 'audit']),
+	('incident', ['incident', 'incydent', 'outage', 'escalat', 'eskalac', 'bug', 'support', 'troubleshoot', 'awari']),
+	('legal', ['legal', 'prawn', 'contract', 'umow', 'umów', 'regulat']),
+	('finance', ['financ', 'finans', 'budget', 'budżet', 'invoice', 'faktur', 'billing', 'cost', 'koszt', 'payment']),
+	('sales', ['sales', 'sprzeda', 'offer', 'ofert', 'customer', 'klient', 'marketing', 'proposal']),
+	('hr', ['hr', 'human resources', 'recruit', 'rekrut', 'onboarding', 'employee', 'pracowni', 'training', 'szkoleni']),
+	('meeting', ['meeting', 'spotkan', 'schedul', 'calendar', 'invitation', 'zaproszen', 'call']),
+	('requirements', ['requirement', 'wymagan', 'specification', 'specyfikac', 'scope', 'zakres', 'mvp', 'feature']),
+	('technical', ['technical', 'techniczn', 'architect', 'api', 'integrat', 'development', 'infrastructure', 'data']),
+	('project_update', ['project', 'projekt', 'status', 'update', 'progress', 'report', 'raport', 'plan']),
+	('announcement', ['announcement', 'ogłoszen', 'newsletter', 'event', 'wydarzen', 'charity', 'csr', 'social']),
+]
+
+
+def normalize_category(label):
+	if not label:
+		return OTHER
+
+	normalized = re.sub(r'[\s\-/]+', '_', label.strip().lower())
+	if normalized in CATEGORIES:
+		return normalized
+
+	text = label.lower()
+	words = set(re.findall(r'\w+', text))
+	for category, keywords in CATEGORY_KEYWORDS:
+		for keyword in keywords:
+			if (len(keyword) <= 3 and keyword in words) or (len(keyword) > 3 and keyword in text):
+				return category
+	return OTHER
+
+
+def blind_index(value):
+	key = hashlib.sha256(b'blind-index:' + settings.EMAIL_ENCRYPTION_KEY.encode()).digest()
+	return hmac.new(key, value.strip().lower().encode(), hashlib.sha256).hexdigest()
+
+
+def normalize_categories(apps, schema_editor):
+	"""
+	Map existing free-text categories onto the closed label set and fill their blind index.
+	"""
+	from cryptography.fernet import Fernet
+
+	fernet = Fernet(settings.EMAIL_ENCRYPTION_KEY.encode())
+	Email = apps.get_model('backendApp', 'Email')
+	for email in Email.objects.exclude(encrypted_category=None).iterator():
+		category = normalize_category(fernet.decrypt(email.encrypted_category.encode()).decode())
+		email.encrypted_category = fernet.encrypt(category.encode()).decode()
+		email.category_index = blind_index(category)
+		email.save(update_fields=['encrypted_category', 'category_index'])
+
+
+class Migration(migrations.Migration):
+	dependencies = [
+		('backendApp', '0001_initial'),
+	]
+
+	operations = [
+		migrations.AddField(
+			model_name='email',
+			name='category_index',
+			field=models.CharField(db_index=True, max_length=64, null=True),
+		),
+		migrations.RunPython(normalize_categories, migrations.RunPython.noop),
+	]
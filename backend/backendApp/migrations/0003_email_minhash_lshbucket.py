@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+	dependencies = [
+		('backendApp', '0002_email_category_index'),
+	]
+
+	operations = [
+		migrations.AddField(
+			model_name='email',
+			name='duplicate_of',
+			field=models.ForeignKey(
+				null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='backendApp.email'
+			),
+		),
+		migrations.AddField(
+			model_name='email',
+			name='minhash',
+			field=models.BinaryField(null=True),
+		),
+		migrations.CreateModel(
+			name='LSHBucket',
+			fields=[
+				('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+				('band', models.PositiveSmallIntegerField()),
+				('key', models.CharField(max_length=32)),
+				(
+					'email',
+					models.ForeignKey(
+						on_delete=django.db.models.deletion.CASCADE, related_name='lsh_buckets', to='backendApp.email'
+					),
+				),
+			],
+			options={
+				'indexes': [models.Index(fields=['band', 'key'], name='backendApp__band_c17a12_idx')],
+			},
+		),
+	]
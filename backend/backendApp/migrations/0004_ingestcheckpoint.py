@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+	dependencies = [
+		('backendApp', '0003_email_minhash_lshbucket'),
+	]
+
+	operations = [
+		migrations.CreateModel(
+			name='IngestCheckpoint',
+			fields=[
+				('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+				('path', models.CharField(max_length=1024, unique=True)),
+				('content_hash', models.CharField(max_length=64)),
+				('messages_done', models.PositiveIntegerField(default=0)),
+				('total_messages', models.PositiveIntegerField(default=0)),
+				('completed', models.BooleanField(default=False)),
+				('updated_at', models.DateTimeField(auto_now=True)),
+			],
+		),
+	]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:47
+
+import re
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Copies of the app helpers as they were when this migration was written, so later changes to them
+# do not change what the migration does
+PREVIEW_LENGTH = 200
+
+
+def make_preview(content):
+	text = re.sub(r'\s+', ' ', content).strip()
+	return text if len(text) <= PREVIEW_LENGTH else text[: PREVIEW_LENGTH - 1].rstrip() + '…'
+
+
+def fill_previews(apps, schema_editor):
+	"""
+	Store the encrypted preview snippet of emails ingested before previews existed.
+	"""
+	from cryptography.fernet import Fernet
+
+	fernet = Fernet(settings.EMAIL_ENCRYPTION_KEY.encode())
+	Email = apps.get_model('backendApp', 'Email')
+	for email in Email.objects.exclude(encrypted_message_content=None).iterator():
+		content = fernet.decrypt(email.encrypted_message_content.encode()).decode()
+		email.encrypted_preview = fernet.encrypt(make_preview(content).encode()).decode()
+		email.save(update_fields=['encrypted_preview'])
+
+
+class Migration(migrations.Migration):
+	dependencies = [
+		('backendApp', '0004_ingestcheckpoint'),
+	]
+
+	operations = [
+		migrations.AddField(
+			model_name='email',
+			name='encrypted_preview',
+			field=models.TextField(null=True),
+		),
+		migrations.RunPython(fill_previews, migrations.RunPython.noop),
+	]
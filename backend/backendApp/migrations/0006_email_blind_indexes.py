@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:48
+
+import hashlib
+import hmac
+
+from django.conf import settings
+from django.db import migrations, models
+
+INDEXED_FIELDS = ['sender_name', 'sender_email', 'recipient_name', 'recipient_email']
+
+
+# Copy of the app helper as it was when this migration was written, so later changes to it
+# do not change what the migration does
+def blind_index(value):
+	key = hashlib.sha256(b'blind-index:' + settings.EMAIL_ENCRYPTION_KEY.encode()).digest()
+	return hmac.new(key, value.strip().lower().encode(), hashlib.sha256).hexdigest()
+
+
+def fill_blind_indexes(apps, schema_editor):
+	"""
+	Compute the blind indexes of emails stored before they existed.
+	"""
+	from cryptography.fernet import Fernet
+
+	fernet = Fernet(settings.EMAIL_ENCRYPTION_KEY.encode())
+	Email = apps.get_model('backendApp', 'Email')
+	for email in Email.objects.iterator():
+		for field in INDEXED_FIELDS:
+			encrypted = getattr(email, f'encrypted_{field}')
+			setattr(email, f'{field}_index', blind_index(fernet.decrypt(encrypted.encode()).decode()) if encrypted else None)
+		email.save(update_fields=[f'{field}_index' for field in INDEXED_FIELDS])
+
+
+class Migration(migrations.Migration):
+	dependencies = [
+		('backendApp', '0005_email_encrypted_preview'),
+	]
+
+	operations = [
+		migrations.AddField(
+			model_name='email',
+			name='recipient_email_index',
+			field=models.CharField(db_index=True, max_length=64, null=True),
+		),
+		migrations.AddField(
+			model_name='email',
+			name='recipient_name_index',
+			field=models.CharField(db_index=True, max_length=64, null=True),
+		),
+		migrations.AddField(
+			model_name='email',
+			name='sender_email_index',
+			field=models.CharField(db_index=True, max_length=64, null=True),
+		),
+		migrations.AddField(
+			model_name='email',
+			name='sender_name_index',
+			field=models.CharField(db_index=True, max_length=64, null=True),
+		),
+		migrations.RunPython(fill_blind_indexes, migrations.RunPython.noop),
+	]
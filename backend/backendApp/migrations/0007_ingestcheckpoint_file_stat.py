@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+	dependencies = [
+		('backendApp', '0006_email_blind_indexes'),
+	]
+
+	operations = [
+		migrations.AddField(
+			model_name='ingestcheckpoint',
+			name='file_mtime_ns',
+			field=models.BigIntegerField(null=True),
+		),
+		migrations.AddField(
+			model_name='ingestcheckpoint',
+			name='file_size',
+			field=models.BigIntegerField(null=True),
+		),
+	]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:54
+
+import uuid
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+	dependencies = [
+		('backendApp', '0007_ingestcheckpoint_file_stat'),
+	]
+
+	operations = [
+		migrations.CreateModel(
+			name='Document',
+			fields=[
+				('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+				('content_hash', models.CharField(max_length=64, unique=True)),
+				('kind', models.CharField(max_length=8)),
+				('pages', models.PositiveIntegerField(default=0)),
+				('tokens', models.PositiveIntegerField(default=0)),
+				('created_at', models.DateTimeField(auto_now_add=True)),
+			],
+		),
+		migrations.CreateModel(
+			name='Attachment',
+			fields=[
+				('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+				('encrypted_file_name', models.TextField(null=True)),
+				('created_at', models.DateTimeField(auto_now_add=True)),
+				(
+					'email',
+					models.ForeignKey(
+						on_delete=django.db.models.deletion.CASCADE, related_name='attachments', to='backendApp.email'
+					),
+				),
+				(
+					'document',
+					models.ForeignKey(
+						on_delete=django.db.models.deletion.CASCADE, related_name='attachments', to='backendApp.document'
+					),
+				),
+			],
+			options={
+				'unique_together': {('email', 'document')},
+			},
+		),
+		migrations.CreateModel(
+			name='DocumentChunk',
+			fields=[
+				('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+				('index', models.PositiveIntegerField()),
+				('page_start', models.PositiveIntegerField()),
+				('page_end', models.PositiveIntegerField()),
+				('tokens', models.PositiveIntegerField()),
+				('encrypted_text', models.TextField(null=True)),
+				(
+					'document',
+					models.ForeignKey(
+						on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='backendApp.document'
+					),
+				),
+			],
+			options={
+				'ordering': ('document', 'index'),
+				'unique_together': {('document', 'index')},
+			},
+		),
+	]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+	dependencies = [
+		('backendApp', '0008_document_chunk_attachment'),
+	]
+
+	operations = [
+		migrations.CreateModel(
+			name='LLMUsage',
+			fields=[
+				('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+				('job', models.CharField(db_index=True, max_length=32, null=True)),
+				('job_id', models.UUIDField(db_index=True, null=True)),
+				('endpoint', models.CharField(max_length=32)),
+				('model', models.CharField(max_length=128)),
+				('calls', models.PositiveIntegerField(default=1)),
+				('prompt_tokens', models.PositiveIntegerField(default=0)),
+				('completion_tokens', models.PositiveIntegerField(default=0)),
+				('estimated', models.BooleanField(default=False)),
+				('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+			],
+		),
+	]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+	dependencies = [
+		('backendApp', '0009_llmusage'),
+	]
+
+	operations = [
+		migrations.AddField(
+			model_name='email',
+			name='llm_model',
+			field=models.CharField(max_length=128, null=True),
+		),
+		migrations.AddField(
+			model_name='email',
+			name='prompt_version',
+			field=models.CharField(db_index=True, max_length=16, null=True),
+		),
+	]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+	dependencies = [
+		('backendApp', '0010_email_prompt_version'),
+	]
+
+	operations = [
+		migrations.CreateModel(
+			name='LLMFailure',
+			fields=[
+				('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+				('endpoint', models.CharField(max_length=32)),
+				('prompt_version', models.CharField(max_length=16, null=True)),
+				('error', models.TextField()),
+				('encrypted_response', models.TextField(null=True)),
+				('resolved', models.BooleanField(db_index=True, default=False)),
+				('created_at', models.DateTimeField(auto_now_add=True)),
+				(
+					'email',
+					models.ForeignKey(
+						null=True, on_delete=django.db.models.deletion.CASCADE, related_name='llm_failures', to='backendApp.email'
+					),
+				),
+			],
+		),
+	]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:08
+
+import uuid
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+	dependencies = [
+		('backendApp', '0011_llmfailure'),
+	]
+
+	operations = [
+		migrations.CreateModel(
+			name='AnalysisSession',
+			fields=[
+				('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+				('encrypted_history', models.TextField(null=True)),
+				('created_at', models.DateTimeField(auto_now_add=True)),
+				('updated_at', models.DateTimeField(auto_now=True)),
+			],
+		),
+		migrations.AddField(
+			model_name='llmanalysis',
+			name='created_at',
+			field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+		),
+		migrations.AddField(
+			model_name='llmanalysis',
+			name='session',
+			field=models.ForeignKey(
+				null=True, on_delete=django.db.models.deletion.CASCADE, related_name='analyses', to='backendApp.analysissession'
+			),
+		),
+	]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:12
+
+import uuid
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+	dependencies = [
+		('backendApp', '0012_analysis_session'),
+	]
+
+	operations = [
+		migrations.CreateModel(
+			name='Project',
+			fields=[
+				('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+				('key', models.CharField(max_length=64, unique=True)),
+				('encrypted_name', models.TextField()),
+				('created_at', models.DateTimeField(auto_now_add=True)),
+			],
+		),
+		migrations.AddField(
+			model_name='email',
+			name='encrypted_project_name',
+			field=models.TextField(null=True),
+		),
+		migrations.CreateModel(
+			name='CommunicationEdge',
+			fields=[
+				('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+				('sender_key', models.CharField(max_length=64)),
+				('recipient_key', models.CharField(db_index=True, max_length=64)),
+				('encrypted_sender', models.TextField(null=True)),
+				('encrypted_recipient', models.TextField(null=True)),
+				('count', models.PositiveIntegerField(default=0)),
+				('last_contact', models.DateTimeField()),
+			],
+			options={
+				'indexes': [models.Index(fields=['-count'], name='backendApp__count_8f2193_idx')],
+				'unique_together': {('sender_key', 'recipient_key')},
+			},
+		),
+		migrations.CreateModel(
+			name='ProjectEmail',
+			fields=[
+				('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+				(
+					'source',
+					models.CharField(
+						choices=[('subject', 'Subject code'), ('file', 'Mail file name'), ('llm', 'Summary LLM')], max_length=16
+					),
+				),
+				('contact_at', models.DateTimeField()),
+				(
+					'email',
+					models.ForeignKey(
+						on_delete=django.db.models.deletion.CASCADE, related_name='project_links', to='backendApp.email'
+					),
+				),
+				(
+					'project',
+					models.ForeignKey(
+						on_delete=django.db.models.deletion.CASCADE, related_name='emails', to='backendApp.project'
+					),
+				),
+			],
+			options={
+				'unique_together': {('project', 'email')},
+			},
+		),
+	]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+	dependencies = [
+		('backendApp', '0013_relations_index'),
+	]
+
+	operations = [
+		migrations.AddField(
+			model_name='ingestcheckpoint',
+			name='error',
+			field=models.TextField(null=True),
+		),
+	]
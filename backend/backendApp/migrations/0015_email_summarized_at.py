@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+	dependencies = [
+		('backendApp', '0014_ingestcheckpoint_error'),
+	]
+
+	operations = [
+		migrations.AddField(
+			model_name='email',
+			name='summarized_at',
+			field=models.DateTimeField(null=True),
+		),
+	]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+	dependencies = [
+		('backendApp', '0015_email_summarized_at'),
+	]
+
+	operations = [
+		migrations.AddField(
+			model_name='email',
+			name='category_source',
+			field=models.CharField(
+				choices=[('llm', 'Summary LLM'), ('classifier', 'Local classifier'), ('manual', 'Manual')],
+				max_length=16,
+				null=True,
+			),
+		),
+	]
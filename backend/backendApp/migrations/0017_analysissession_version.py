@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+	dependencies = [
+		('backendApp', '0016_email_category_source'),
+	]
+
+	operations = [
+		migrations.AddField(
+			model_name='analysissession',
+			name='version',
+			field=models.PositiveIntegerField(default=0),
+		),
+	]
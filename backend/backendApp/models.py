@@ -1,8 +1,21 @@
+import json
+import re
 import uuid
 
 from django.db import models
+from django.utils import timezone
 
-from .anonymization import decrypt_value, encrypt_value
+from .anonymization import blind_index, decrypt_value, encrypt_value
+
+PREVIEW_LENGTH = 200
+
+
+def make_preview(content: str) -> str:
+	"""
+	Short single-line snippet of a message body shown in email lists.
+	"""
+	text = re.sub(r'\s+', ' ', content).strip()
+	return text if len(text) <= PREVIEW_LENGTH else text[: PREVIEW_LENGTH - 1].rstrip() + '…'
 
 
 class Email(models.Model):
@@ -16,6 +29,25 @@ class Email(models.Model):
 	encrypted_date = models.TextField(null=True)
 	encrypted_message_content = models.TextField(null=True)
 	encrypted_category = models.TextField(null=True)
+	encrypted_preview = models.TextField(null=True)
+	# project or system named by the summary LLM
+	encrypted_project_name = models.TextField(null=True)
+	category_index = models.CharField(max_length=64, null=True, db_index=True)
+	# blind indexes allow exact-match lookups (admin search) without decrypting
+	sender_name_index = models.CharField(max_length=64, null=True, db_index=True)
+	sender_email_index = models.CharField(max_length=64, null=True, db_index=True)
+	recipient_name_index = models.CharField(max_length=64, null=True, db_index=True)
+	recipient_email_index = models.CharField(max_length=64, null=True, db_index=True)
+	# who assigned the category, the local classifier is only trained on LLM and manual labels
+	CATEGORY_SOURCES = [('llm', 'Summary LLM'), ('classifier', 'Local classifier'), ('manual', 'Manual')]
+	category_source = models.CharField(max_length=16, null=True, choices=CATEGORY_SOURCES)
+	# prompt version (prompts.SUMMARY_VERSION) and model that produced summary and category
+	prompt_version = models.CharField(max_length=16, null=True, db_index=True)
+	llm_model = models.CharField(max_length=128, null=True)
+	# set when `manage.py resummarize` replaces the summary, cached analysis working sets are rebuilt after it
+	summarized_at = models.DateTimeField(null=True)
+	minhash = models.BinaryField(null=True)
+	duplicate_of = models.ForeignKey('self', null=True, on_delete=models.SET_NULL, related_name='duplicates')
 	created_at = models.DateTimeField(auto_now_add=True)
 
 	class Meta:
@@ -38,6 +70,7 @@ class Email(models.Model):
 	@sender_name.setter
 	def sender_name(self, value):
 		self.encrypted_sender_name = encrypt_value(value) if value else None
+		self.sender_name_index = blind_index(value) if value else None
 
 	@property
 	def summary(self):
@@ -54,6 +87,15 @@ class Email(models.Model):
 	@category.setter
 	def category(self, value):
 		self.encrypted_category = encrypt_value(value) if value else None
+		self.category_index = blind_index(value) if value else None
+
+	@property
+	def project_name(self):
+		return decrypt_value(self.encrypted_project_name) if self.encrypted_project_name else None
+
+	@project_name.setter
+	def project_name(self, value):
+		self.encrypted_project_name = encrypt_value(value) if value else None
 
 	@property
 	def sender_email(self):
@@ -62,6 +104,7 @@ class Email(models.Model):
 	@sender_email.setter
 	def sender_email(self, value):
 		self.encrypted_sender_email = encrypt_value(value) if value else None
+		self.sender_email_index = blind_index(value) if value else None
 
 	@property
 	def recipient_name(self):
@@ -70,6 +113,7 @@ class Email(models.Model):
 	@recipient_name.setter
 	def recipient_name(self, value):
 		self.encrypted_recipient_name = encrypt_value(value) if value else None
+		self.recipient_name_index = blind_index(value) if value else None
 
 	@property
 	def recipient_email(self):
@@ -78,6 +122,7 @@ class Email(models.Model):
 	@recipient_email.setter
 	def recipient_email(self, value):
 		self.encrypted_recipient_email = encrypt_value(value) if value else None
+		self.recipient_email_index = blind_index(value) if value else None
 
 	@property
 	def subject(self):
@@ -102,9 +147,14 @@ class Email(models.Model):
 	@message_content.setter
 	def message_content(self, value):
 		self.encrypted_message_content = encrypt_value(value) if value else None
+		self.encrypted_preview = encrypt_value(make_preview(value)) if value else None
+
+	@property
+	def preview(self):
+		return decrypt_value(self.encrypted_preview) if self.encrypted_preview else None
 
 	def __str__(self):
-		return self.subject
+		return self.subject or str(self.id)
 
 	def to_dict(self):
 		return {
@@ -119,10 +169,255 @@ class Email(models.Model):
 		}
 
 
+class LSHBucket(models.Model):
+	"""
+	One MinHash band of an email, emails sharing a bucket are near-duplicate candidates.
+	"""
+
+	band = models.PositiveSmallIntegerField()
+	key = models.CharField(max_length=32)
+	email = models.ForeignKey(Email, on_delete=models.CASCADE, related_name='lsh_buckets')
+
+	class Meta:
+		indexes = [models.Index(fields=['band', 'key'])]
+
+
+class IngestCheckpoint(models.Model):
+	"""
+	Ingest progress of a single mail file, used to resume `manage.py ingest` after a crash
+	and by `manage.py watch_mail` to skip files that did not change.
+	"""
+
+	path = models.CharField(max_length=1024, unique=True)
+	content_hash = models.CharField(max_length=64)
+	messages_done = models.PositiveIntegerField(default=0)
+	total_messages = models.PositiveIntegerField(default=0)
+	completed = models.BooleanField(default=False)
+	# size and modification time of the completely ingested file
+	file_size = models.BigIntegerField(null=True)
+	file_mtime_ns = models.BigIntegerField(null=True)
+	# why the file could not be read or ingested, cleared once it is
+	error = models.TextField(null=True)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	def __str__(self):
+		return f'{self.path} ({self.messages_done}/{self.total_messages})'
+
+
+class Document(models.Model):
+	"""
+	Extracted text of an attachment, cached by content hash so each file is extracted once.
+	"""
+
+	id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+	# keyed hash of the file bytes, see documents.document_hash
+	content_hash = models.CharField(max_length=64, unique=True)
+	kind = models.CharField(max_length=8)
+	pages = models.PositiveIntegerField(default=0)
+	tokens = models.PositiveIntegerField(default=0)
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	def __str__(self):
+		return f'{self.kind} document, {self.pages} pages'
+
+
+class DocumentChunk(models.Model):
+	"""
+	Token-budgeted segment of a document, in reading order.
+	"""
+
+	document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='chunks')
+	index = models.PositiveIntegerField()
+	page_start = models.PositiveIntegerField()
+	page_end = models.PositiveIntegerField()
+	tokens = models.PositiveIntegerField()
+	encrypted_text = models.TextField(null=True)
+
+	class Meta:
+		ordering = ('document', 'index')
+		unique_together = ('document', 'index')
+
+	@property
+	def text(self):
+		return decrypt_value(self.encrypted_text) if self.encrypted_text else None
+
+	@text.setter
+	def text(self, value):
+		self.encrypted_text = encrypt_value(value) if value else None
+
+
+class Attachment(models.Model):
+	"""
+	Document attached to an email, the same document may be attached to many emails.
+	"""
+
+	id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+	email = models.ForeignKey(Email, on_delete=models.CASCADE, related_name='attachments')
+	document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='attachments')
+	encrypted_file_name = models.TextField(null=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		unique_together = ('email', 'document')
+
+	@property
+	def file_name(self):
+		return decrypt_value(self.encrypted_file_name) if self.encrypted_file_name else None
+
+	@file_name.setter
+	def file_name(self, value):
+		self.encrypted_file_name = encrypt_value(value) if value else None
+
+
+class LLMUsage(models.Model):
+	"""
+	Ledger of LLM token usage, one row per call or batch of calls.
+	"""
+
+	# kind and run of the job that made the calls, null for calls outside a job
+	job = models.CharField(max_length=32, null=True, db_index=True)
+	job_id = models.UUIDField(null=True, db_index=True)
+	endpoint = models.CharField(max_length=32)
+	model = models.CharField(max_length=128)
+	calls = models.PositiveIntegerField(default=1)
+	prompt_tokens = models.PositiveIntegerField(default=0)
+	completion_tokens = models.PositiveIntegerField(default=0)
+	# counts of at least one call were estimated locally because the server reported none
+	estimated = models.BooleanField(default=False)
+	created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+	def __str__(self):
+		return f'{self.endpoint} {self.model}: {self.prompt_tokens}+{self.completion_tokens} tokens'
+
+
+class LLMFailure(models.Model):
+	"""
+	LLM answer that could not be used even after a repair attempt, kept so the email can be retried.
+	"""
+
+	email = models.ForeignKey(Email, null=True, on_delete=models.CASCADE, related_name='llm_failures')
+	endpoint = models.CharField(max_length=32)
+	prompt_version = models.CharField(max_length=16, null=True)
+	error = models.TextField()
+	encrypted_response = models.TextField(null=True)
+	# set once the email was summarized successfully
+	resolved = models.BooleanField(default=False, db_index=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	@property
+	def response(self):
+		return decrypt_value(self.encrypted_response) if self.encrypted_response else None
+
+	@response.setter
+	def response(self, value):
+		self.encrypted_response = encrypt_value(value) if value else None
+
+	def __str__(self):
+		return f'{self.endpoint}: {self.error}'
+
+
+class CommunicationEdge(models.Model):
+	"""
+	Emails sent from one participant to another. Participants are keyed by the blind index of their address,
+	or of their name when the address is missing.
+	"""
+
+	sender_key = models.CharField(max_length=64)
+	recipient_key = models.CharField(max_length=64, db_index=True)
+	encrypted_sender = models.TextField(null=True)
+	encrypted_recipient = models.TextField(null=True)
+	count = models.PositiveIntegerField(default=0)
+	last_contact = models.DateTimeField()
+
+	class Meta:
+		unique_together = ('sender_key', 'recipient_key')
+		indexes = [models.Index(fields=['-count'])]
+
+	@property
+	def sender(self):
+		return decrypt_value(self.encrypted_sender) if self.encrypted_sender else None
+
+	@sender.setter
+	def sender(self, value):
+		self.encrypted_sender = encrypt_value(value) if value else None
+
+	@property
+	def recipient(self):
+		return decrypt_value(self.encrypted_recipient) if self.encrypted_recipient else None
+
+	@recipient.setter
+	def recipient(self, value):
+		self.encrypted_recipient = encrypt_value(value) if value else None
+
+
+class Project(models.Model):
+	"""
+	Project or topic named by a code in a subject or mail file name (e.g. ATS-HRCLOUD-MVP) or by the summary LLM.
+	"""
+
+	id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+	# blind index of the name
+	key = models.CharField(max_length=64, unique=True)
+	encrypted_name = models.TextField()
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	@property
+	def name(self):
+		return decrypt_value(self.encrypted_name)
+
+	@name.setter
+	def name(self, value):
+		self.encrypted_name = encrypt_value(value)
+		self.key = blind_index(value)
+
+	def __str__(self):
+		return str(self.id)
+
+
+class ProjectEmail(models.Model):
+	SOURCES = [('subject', 'Subject code'), ('file', 'Mail file name'), ('llm', 'Summary LLM')]
+
+	project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='emails')
+	email = models.ForeignKey(Email, on_delete=models.CASCADE, related_name='project_links')
+	source = models.CharField(max_length=16, choices=SOURCES)
+	# date of the email, or when it was stored if the date does not parse
+	contact_at = models.DateTimeField()
+
+	class Meta:
+		unique_together = ('project', 'email')
+
+
+class AnalysisSession(models.Model):
+	"""
+	Conversation of follow-up analysis questions, the history holds the questions and answers so far.
+	"""
+
+	id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+	encrypted_history = models.TextField(null=True)
+	# bumped with every saved turn, a follow-up saves only over the version it read
+	version = models.PositiveIntegerField(default=0)
+	created_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	@property
+	def history(self):
+		return json.loads(decrypt_value(self.encrypted_history)) if self.encrypted_history else []
+
+	@history.setter
+	def history(self, value):
+		self.encrypted_history = encrypt_value(json.dumps(value, ensure_ascii=False)) if value else None
+
+	def __str__(self):
+		return str(self.id)
+
+
 class LLMAnalysis(models.Model):
 	id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+	session = models.ForeignKey(AnalysisSession, null=True, on_delete=models.CASCADE, related_name='analyses')
 	encrypted_question = models.TextField(null=True)
 	encrypted_answer = models.TextField(null=True)
+	# analyses from before sessions get the time of the migration
+	created_at = models.DateTimeField(default=timezone.now, db_index=True)
 
 	# -------- PROPERTIES FOR DECRYPTED ACCESS --------
 	@property
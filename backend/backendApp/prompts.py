@@ -0,0 +1,127 @@
+import hashlib
+
+from .categories import CATEGORIES
+
+SUMMARY_PROMPT = """Extract key information and create a concise summary of the following email.
+Focus on:
+- Main topic or project
+- Key requirements or specifications
+- Important decisions or action items
+- Risks or concerns mentioned
+- Technical details (APIs, systems, integrations)
+
+Email:
+Subject: {subject}
+
+Content: {content}
+
+Provide JSON with the following fields:
+- summary: A clear, concise summary (2-4 sentences) that captures the essential information.
+- category: Exactly one of: {categories}.
+- project_name: Short name of the project or system the email is about, or null if there is none.
+
+Return the response in ONLY JSON format like this:
+{{
+  "summary": "...",
+  "category": "...",
+  "project_name": "..."
+}}
+"""
+
+# Used when the local classifier already decided the category
+SUMMARY_ONLY_PROMPT = """Extract key information and create a concise summary of the following email.
+Focus on:
+- Main topic or project
+- Key requirements or specifications
+- Important decisions or action items
+- Risks or concerns mentioned
+- Technical details (APIs, systems, integrations)
+
+Email:
+Subject: {subject}
+
+Content: {content}
+
+Provide JSON with the following fields:
+- summary: A clear, concise summary (2-4 sentences) that captures the essential information.
+- project_name: Short name of the project or system the email is about, or null if there is none.
+
+Return the response in ONLY JSON format like this:
+{{
+  "summary": "...",
+  "project_name": "..."
+}}
+"""
+
+# One cheap retry for an answer that failed to parse, the email is not sent again
+REPAIR_PROMPT = """The following answer should be a single JSON object with the fields {fields}, but it is invalid: {error}.
+Return only the corrected JSON object, without code fences or any other text.
+
+Answer:
+{response}
+"""
+
+# Plain text summary used by llm_summary.add_summary_to_dataframe
+SUMMARY_TEXT_PROMPT = """Extract key information and create a concise summary of the following email.
+Focus on:
+- Main topic or project
+- Key requirements or specifications
+- Important decisions or action items
+- Risks or concerns mentioned
+- Technical details (APIs, systems, integrations)
+
+Email:
+Subject: {subject}
+
+Content: {content}
+
+Provide a clear, concise summary (2-4 sentences) that captures the essential information."""
+
+KEY_INFORMATION_SYSTEM_PROMPT = 'You are an expert at extracting structured information from emails. Always return valid JSON.'
+
+KEY_INFORMATION_PROMPT = """Extract key information from the following email and return it as JSON with these fields:
+- project_name: Name of the project or system (if mentioned)
+- key_requirements: Array of key requirements, features, or specifications
+- risks: Array of risks, concerns, or issues mentioned
+- decisions: Array of decisions made or action items
+- technical_details: Array of technical details (APIs, endpoints, databases, architectures)
+- stakeholders: Array of people, teams, or departments mentioned
+- timeline: Any deadlines, dates, or timeline information (if mentioned)
+
+Email:
+Subject: {subject}
+
+Content: {content}
+
+Return only valid JSON, nothing else. If a field has no information, use null or empty array."""
+
+ANALYSIS_PROMPT = (
+	'You are an expert assistant analyzing internal email data. Use ONLY the provided email context.'
+	'\n\nCommunication and project index:\n{relations}'
+	'\n\nRetrieved Context: {context}'
+	'\n\nAttachment excerpts:\n{attachments}'
+	'\n\nUser Question: {question}'
+)
+
+# follow-ups get the conversation so far, summaries of all emails and the full text of the emails matching the question
+ANALYSIS_FOLLOWUP_PROMPT = (
+	'You are an expert assistant analyzing internal email data. Use ONLY the provided email context'
+	' and the conversation so far.'
+	'\n\nConversation so far:\n{history}'
+	'\n\nCommunication and project index:\n{relations}'
+	'\n\nEmail summaries:\n{summaries}'
+	'\n\nFull text of the most relevant emails: {context}'
+	'\n\nAttachment excerpts:\n{attachments}'
+	'\n\nUser Question: {question}'
+)
+
+
+def prompt_version(*parts: str) -> str:
+	"""
+	Short content hash of a prompt, it changes whenever the prompt text changes.
+	"""
+	return hashlib.sha256('\x00'.join(parts).encode()).hexdigest()[:12]
+
+
+# Stored with every summary, emails with another version are re-summarized by `manage.py resummarize`
+SUMMARY_VERSION = prompt_version(SUMMARY_PROMPT, SUMMARY_ONLY_PROMPT, ', '.join(CATEGORIES))
@@ -0,0 +1,282 @@
+import datetime
+import pathlib
+import re
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min, Q, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .anonymization import blind_index, encrypt_value
+from .models import CommunicationEdge, Email, Project, ProjectEmail
+
+# e.g. ATS-HRCLOUD-MVP-001, the trailing number of a thread is dropped from the project name
+PROJECT_CODE = re.compile(r'\b[A-Z][A-Z0-9]+(?:-[A-Z0-9]+)+\b')
+DATE_FORMATS = ('%Y-%m-%d %H:%M', '%Y-%m-%d, %H:%M', '%d.%m.%Y %H:%M', '%d.%m.%Y')
+
+# columns needed to index an email, the message body stays deferred
+INDEX_COLUMNS = (
+	'id',
+	'encrypted_sender_name',
+	'encrypted_sender_email',
+	'encrypted_recipient_name',
+	'encrypted_recipient_email',
+	'sender_name_index',
+	'sender_email_index',
+	'recipient_name_index',
+	'recipient_email_index',
+	'encrypted_subject',
+	'encrypted_date',
+	'encrypted_project_name',
+	'created_at',
+)
+
+
+def project_code(text: Optional[str]) -> Optional[str]:
+	"""
+	First project code in text, without trailing numeric parts.
+	"""
+	match = PROJECT_CODE.search(text or '')
+	if not match:
+		return None
+	parts = match.group().split('-')
+	while len(parts) > 2 and parts[-1].isdigit():
+		parts.pop()
+	return '-'.join(parts)
+
+
+def contact_time(email: Email) -> datetime.datetime:
+	"""
+	Date of the email, or when it was stored if the date does not parse.
+	"""
+	date = (email.date or '').strip()
+	for date_format in DATE_FORMATS:
+		try:
+			return timezone.make_aware(datetime.datetime.strptime(date, date_format))
+		except ValueError:
+			continue
+	return email.created_at or timezone.now()
+
+
+def _participant(name: Optional[str], address: Optional[str], name_key: Optional[str], address_key: Optional[str]):
+	key = address_key or name_key
+	if key is None:
+		return None, None
+	label = f'{name} <{address}>' if name and address else name or address
+	return key, label
+
+
+def sender(email: Email) -> Tuple[Optional[str], Optional[str]]:
+	return _participant(email.sender_name, email.sender_email, email.sender_name_index, email.sender_email_index)
+
+
+def recipient(email: Email) -> Tuple[Optional[str], Optional[str]]:
+	return _participant(email.recipient_name, email.recipient_email, email.recipient_name_index, email.recipient_email_index)
+
+
+def index_edges(emails: Iterable[Email]) -> None:
+	"""
+	Add emails to the communication graph, one update per sender and recipient pair of the batch.
+	"""
+	pairs: Dict[Tuple[str, str], Dict[str, Any]] = {}
+	for email in emails:
+		sender_key, sender_label = sender(email)
+		recipient_key, recipient_label = recipient(email)
+		if sender_key is None or recipient_key is None:
+			continue
+		pair = pairs.setdefault(
+			(sender_key, recipient_key), {'sender': sender_label, 'recipient': recipient_label, 'count': 0, 'last': None}
+		)
+		pair['count'] += 1
+		when = contact_time(email)
+		pair['last'] = when if pair['last'] is None else max(pair['last'], when)
+
+	for (sender_key, recipient_key), pair in pairs.items():
+		edge, created = CommunicationEdge.objects.get_or_create(
+			sender_key=sender_key,
+			recipient_key=recipient_key,
+			defaults={
+				'encrypted_sender': encrypt_value(pair['sender']),
+				'encrypted_recipient': encrypt_value(pair['recipient']),
+				'count': pair['count'],
+				'last_contact': pair['last'],
+			},
+		)
+		if not created:
+			CommunicationEdge.objects.filter(pk=edge.pk).update(
+				count=F('count') + pair['count'], last_contact=Greatest('last_contact', Value(pair['last']))
+			)
+
+
+def _get_project(name: str, projects: Dict[str, Project]) -> Project:
+	key = blind_index(name)
+	if key not in projects:
+		project = Project.objects.filter(key=key).first()
+		if project is None:
+			project = Project(name=name)
+			try:
+				with transaction.atomic():
+					project.save()
+			except IntegrityError:
+				# created by a concurrent ingest
+				project = Project.objects.get(key=key)
+		projects[key] = project
+	return projects[key]
+
+
+def index_projects(emails: Iterable[Email], source_path: Optional[str] = None, replace_llm: bool = False) -> None:
+	"""
+	Link emails to the projects named by a code in their subject or in the name of the mail file they came from
+	and by their summary. With replace_llm, links from an earlier summary are replaced (after re-summarizing).
+	"""
+	file_code = project_code(pathlib.Path(source_path).stem) if source_path else None
+	projects: Dict[str, Project] = {}
+	links = []
+	emails = list(emails)
+	if replace_llm:
+		ProjectEmail.objects.filter(email__in=emails, source='llm').delete()
+	for email in emails:
+		names = [('subject', project_code(email.subject)), ('file', file_code), ('llm', (email.project_name or '').strip())]
+		when = contact_time(email)
+		for source, name in names:
+			if name:
+				links.append(ProjectEmail(project=_get_project(name, projects), email=email, source=source, contact_at=when))
+	# the first source naming a project wins, links of an email that already exist are kept
+	ProjectEmail.objects.bulk_create(links, ignore_conflicts=True)
+
+
+def index_emails(emails: List[Email], source_path: Optional[str] = None) -> None:
+	"""
+	Add newly stored emails to the communication graph and the project index.
+	"""
+	index_edges(emails)
+	index_projects(emails, source_path)
+
+
+def rebuild(batch_size: int = 500) -> int:
+	"""
+	Rebuild the graph and the project links from the stored emails, returns the number of indexed emails.
+
+	Links from mail file names are kept, the file an email came from is not stored.
+	"""
+	with transaction.atomic():
+		CommunicationEdge.objects.all().delete()
+		ProjectEmail.objects.exclude(source='file').delete()
+		indexed = 0
+		batch: List[Email] = []
+		for email in Email.objects.only(*INDEX_COLUMNS).iterator(chunk_size=batch_size):
+			batch.append(email)
+			if len(batch) == batch_size:
+				index_emails(batch)
+				indexed += len(batch)
+				batch = []
+		index_emails(batch)
+		Project.objects.filter(emails__isnull=True).delete()
+	return indexed + len(batch)
+
+
+def top_edges(participant: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+	"""
+	Pairs exchanging the most emails, only those involving participant (address or name) when given.
+	"""
+	edges = CommunicationEdge.objects.order_by('-count', '-last_contact')
+	if participant:
+		key = blind_index(participant)
+		edges = edges.filter(Q(sender_key=key) | Q(recipient_key=key))
+	return [
+		{'sender': edge.sender, 'recipient': edge.recipient, 'count': edge.count, 'last_contact': edge.last_contact}
+		for edge in edges[: max(limit, 0)]
+	]
+
+
+def _matches(name: str, terms: List[str]) -> bool:
+	words = re.findall(r'\w+', name.lower())
+	return all(any(word.startswith(term) for word in words) for term in terms)
+
+
+def find_projects(query: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+	"""
+	Projects with their number of emails and last contact, most active first. query keeps the projects
+	whose name has a word starting with each of its words, e.g. 'hrcloud ats' finds ATS-HRCLOUD-MVP.
+
+	Names are encrypted, so with a query the projects are decrypted and matched until limit of them matched.
+	"""
+	if limit < 1:
+		return []
+	projects = (
+		Project.objects.annotate(email_count=Count('emails'), last_contact=Max('emails__contact_at'))
+		.filter(email_count__gt=0)
+		.order_by('-email_count', '-last_contact')
+	)
+	terms = re.findall(r'\w+', (query or '').lower())
+	if not terms:
+		projects = projects[:limit]
+	result = []
+	for project in projects.iterator():
+		name = project.name
+		if terms and not _matches(name, terms):
+			continue
+		result.append({'id': project.id, 'name': name, 'emails': project.email_count, 'last_contact': project.last_contact})
+		if len(result) == limit:
+			break
+	return result
+
+
+def project_participants(project_ids: List[Any], limit: int = 10) -> Dict[Any, List[Dict[str, Any]]]:
+	"""
+	People who sent or received the emails of each project, most active first.
+	"""
+	links = ProjectEmail.objects.filter(project_id__in=project_ids)
+	people: Dict[Any, Dict[str, Dict[str, Any]]] = defaultdict(dict)
+	samples = {}
+	for role, prefix in (('sent', 'sender'), ('received', 'recipient')):
+		rows = (
+			links.annotate(key=Coalesce(f'email__{prefix}_email_index', f'email__{prefix}_name_index'))
+			.exclude(key=None)
+			.values('project_id', 'key')
+			.annotate(count=Count('id'), last=Max('contact_at'), sample=Min('email_id'))
+		)
+		for row in rows:
+			person = people[row['project_id']].setdefault(
+				row['key'], {'participant': None, 'sent': 0, 'received': 0, 'last_contact': row['last']}
+			)
+			person[role] = row['count']
+			person['last_contact'] = max(person['last_contact'], row['last'])
+			samples.setdefault((row['key'], prefix), row['sample'])
+
+	# one label per participant, decrypted from one of their emails
+	emails = Email.objects.only(*INDEX_COLUMNS).in_bulk(set(samples.values()))
+	labels = {}
+	for (key, prefix), sample in samples.items():
+		if key not in labels and sample in emails:
+			labels[key] = (sender if prefix == 'sender' else recipient)(emails[sample])[1]
+
+	result = {}
+	for project_id, by_key in people.items():
+		for key, person in by_key.items():
+			person['participant'] = labels.get(key)
+		ranked = sorted(by_key.values(), key=lambda person: (-(person['sent'] + person['received']), person['participant'] or ''))
+		result[project_id] = ranked[:limit]
+	return result
+
+
+def _day(value: Optional[datetime.datetime]) -> str:
+	return f'{value:%Y-%m-%d}' if value else '?'
+
+
+def relations_context(edges: int = 20, projects: int = 20, participants: int = 5) -> str:
+	"""
+	Compact pre-aggregated graph and project index for the analysis prompt.
+	"""
+	lines = ['Most frequent correspondence (sender -> recipient: emails, last contact):']
+	for edge in top_edges(limit=edges):
+		lines.append(f'- {edge["sender"]} -> {edge["recipient"]}: {edge["count"]}, {_day(edge["last_contact"])}')
+	found = find_projects(limit=projects)
+	people = project_participants([project['id'] for project in found], participants)
+	lines.append('Projects (emails, last contact, participants):')
+	for project in found:
+		names = ', '.join(person['participant'] or '?' for person in people.get(project['id'], []))
+		lines.append(f'- {project["name"]}: {project["emails"]}, {_day(project["last_contact"])}, {names}')
+	return '\n'.join(lines)
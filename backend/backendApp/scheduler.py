@@ -0,0 +1,198 @@
+import collections
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Hashable, Iterator, List, Optional
+
+from django.conf import settings
+
+try:
+	import fcntl
+except ImportError:  # Windows, the slots are then shared within a process only
+	fcntl = None
+
+# Priority classes, highest first
+INTERACTIVE = 'interactive'
+BACKFILL = 'backfill'
+BULK = 'bulk'
+PRIORITIES = [INTERACTIVE, BACKFILL, BULK]
+
+WAIT_SAMPLES = 1000
+LOCK_POLL_INTERVAL = 0.05
+
+
+class SlotFiles:
+	"""
+	Counting semaphore shared by the processes of a host, each of the size lock files is one slot held with flock.
+
+	The OS drops the locks of a process that exits, so a killed ingest never leaks its slots.
+	"""
+
+	def __init__(self, directory: str, name: str, size: int):
+		self.paths = [os.path.join(directory, f'{name}-{i}.lock') for i in range(size)]
+		os.makedirs(directory, exist_ok=True)
+
+	def acquire(self) -> int:
+		"""
+		Block until a slot is free, returns the descriptor holding it.
+		"""
+		while True:
+			for path in self.paths:
+				fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+				try:
+					fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+					return fd
+				except BlockingIOError:
+					os.close(fd)
+			time.sleep(LOCK_POLL_INTERVAL)
+
+	def release(self, fd: int) -> None:
+		fcntl.flock(fd, fcntl.LOCK_UN)
+		os.close(fd)
+
+
+class LLMScheduler:
+	"""
+	Shares the LLM call slots of the process between priority classes.
+
+	A free slot goes to the highest priority class with waiting calls, and within a class round-robin
+	to the jobs waiting in it, FIFO per job. shares[c] caps the slots held by class c together
+	with all lower classes, so the slots above the cap of the lower classes stay free for interactive calls.
+
+	With lock_dir the caps of the backfill and bulk classes also hold across the processes using the same directory,
+	so a `manage.py ingest` or `watch_mail` run leaves the interactive slots of the web server free.
+	"""
+
+	def __init__(self, slots: int, shares: Dict[str, float], lock_dir: Optional[str] = None):
+		self.slots = slots
+		self.limits = {priority: max(1, math.floor(shares.get(priority, 1.0) * slots)) for priority in PRIORITIES}
+		self.lock_dir = lock_dir if fcntl is not None else None
+		# lowest class first, every call takes the files of its class and of the higher capped classes in this order
+		self.shared = {
+			priority: SlotFiles(self.lock_dir, priority, self.limits[priority])
+			for priority in reversed(PRIORITIES[1:])
+			if self.lock_dir
+		}
+		self.condition = threading.Condition()
+		self.running = {priority: 0 for priority in PRIORITIES}
+		# priority -> job -> waiting calls, dicts keep the round-robin order of the jobs
+		self.queues: Dict[str, Dict[Hashable, Deque[object]]] = {priority: {} for priority in PRIORITIES}
+		self.served = {priority: 0 for priority in PRIORITIES}
+		self.waits: Dict[str, Deque[float]] = {priority: collections.deque(maxlen=WAIT_SAMPLES) for priority in PRIORITIES}
+
+	def _may_run(self, priority: str) -> bool:
+		level = PRIORITIES.index(priority)
+		return (
+			sum(self.running.values()) < self.slots and sum(self.running[p] for p in PRIORITIES[level:]) < self.limits[priority]
+		)
+
+	def _next(self) -> Optional[object]:
+		for priority in PRIORITIES:
+			queue = self.queues[priority]
+			if queue:
+				# lower classes do not overtake a higher class that is only waiting for its share
+				return next(iter(queue.values()))[0] if self._may_run(priority) else None
+		return None
+
+	def acquire(self, priority: str, job: Hashable = None) -> float:
+		"""
+		Block until the call may run, returns the seconds it waited.
+		"""
+		ticket = object()
+		started = time.monotonic()
+		with self.condition:
+			self.queues[priority].setdefault(job, collections.deque()).append(ticket)
+			while self._next() is not ticket:
+				self.condition.wait()
+
+			# the job goes to the back of its class so the other jobs get the next slots
+			calls = self.queues[priority].pop(job)
+			calls.popleft()
+			if calls:
+				self.queues[priority][job] = calls
+			self.running[priority] += 1
+			waited = time.monotonic() - started
+			self.served[priority] += 1
+			self.waits[priority].append(waited)
+			self.condition.notify_all()
+		return waited
+
+	def release(self, priority: str) -> None:
+		with self.condition:
+			self.running[priority] -= 1
+			self.condition.notify_all()
+
+	@contextmanager
+	def slot(self, priority: str, job: Hashable = None) -> Iterator[float]:
+		started = time.monotonic()
+		self.acquire(priority, job)
+		level = PRIORITIES.index(priority)
+		held = []
+		try:
+			for shared_priority, files in self.shared.items():
+				if PRIORITIES.index(shared_priority) <= level:
+					held.append((files, files.acquire()))
+			yield time.monotonic() - started
+		finally:
+			for files, fd in reversed(held):
+				files.release(fd)
+			self.release(priority)
+
+	def metrics(self) -> Dict[str, Any]:
+		"""
+		Queue depth, running calls and wait times of the recent calls per priority class.
+		"""
+		with self.condition:
+			classes = {}
+			for priority in PRIORITIES:
+				waits = sorted(self.waits[priority])
+				classes[priority] = {
+					'limit': self.limits[priority],
+					'running': self.running[priority],
+					'queued': sum(len(calls) for calls in self.queues[priority].values()),
+					'waiting_jobs': len(self.queues[priority]),
+					'served': self.served[priority],
+					'wait_ms': {
+						'p50': _percentile(waits, 0.5) * 1000,
+						'p95': _percentile(waits, 0.95) * 1000,
+						'max': waits[-1] * 1000 if waits else 0.0,
+					},
+				}
+			return {'slots': self.slots, 'scope': 'host' if self.shared else 'process', 'classes': classes}
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+	if not ordered:
+		return 0.0
+	return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+_scheduler: Optional[LLMScheduler] = None
+_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+	"""
+	Scheduler shared by all LLM calls of the process, configured by LLM_SCHEDULER_SLOTS, LLM_PRIORITY_SHARES
+	and LLM_SCHEDULER_LOCK_DIR.
+	"""
+	global _scheduler
+	with _lock:
+		if _scheduler is None:
+			_scheduler = LLMScheduler(
+				settings.LLM_SCHEDULER_SLOTS, settings.LLM_PRIORITY_SHARES, settings.LLM_SCHEDULER_LOCK_DIR or None
+			)
+		return _scheduler
+
+
+def set_scheduler(scheduler: Optional[LLMScheduler]) -> Optional[LLMScheduler]:
+	"""
+	Replace the process scheduler (e.g. with a smaller one in benchmarks), returns the previous one or None.
+	"""
+	global _scheduler
+	with _lock:
+		previous = _scheduler
+		_scheduler = scheduler
+	return previous
@@ -1,12 +1,40 @@
 from rest_framework import serializers
 
-from .models import Email, LLMAnalysis
+from .models import Attachment, Email, LLMAnalysis
+
+# Encrypted columns the list serializer needs, everything else is deferred
+EMAIL_LIST_COLUMNS = [
+	'id',
+	'encrypted_sender_name',
+	'encrypted_sender_email',
+	'encrypted_subject',
+	'encrypted_date',
+	'encrypted_summary',
+	'encrypted_category',
+	'encrypted_preview',
+]
+
+
+class EmailListSerializerGet(serializers.ModelSerializer):
+	class Meta:
+		model = Email
+		fields = [
+			'id',
+			'sender_name',
+			'sender_email',
+			'subject',
+			'date',
+			'summary',
+			'category',
+			'preview',
+		]
 
 
 class EmailSerializerGet(serializers.ModelSerializer):
 	class Meta:
 		model = Email
 		fields = [
+			'id',
 			'sender_name',
 			'sender_email',
 			'recipient_name',
@@ -16,10 +44,22 @@ class EmailSerializerGet(serializers.ModelSerializer):
 			'message_content',
 			'summary',
 			'category',
+			'prompt_version',
+			'llm_model',
 		]
 
 
+class AttachmentSerializerGet(serializers.ModelSerializer):
+	kind = serializers.CharField(source='document.kind')
+	pages = serializers.IntegerField(source='document.pages')
+	tokens = serializers.IntegerField(source='document.tokens')
+
+	class Meta:
+		model = Attachment
+		fields = ['id', 'file_name', 'kind', 'pages', 'tokens', 'created_at']
+
+
 class LLMAnalysisSerializerGet(serializers.ModelSerializer):
 	class Meta:
 		model = LLMAnalysis
-		fields = ['question', 'answer']
+		fields = ['question', 'answer', 'session', 'created_at']
@@ -0,0 +1,139 @@
+import json
+import re
+from typing import Any, Dict, List, Tuple
+
+from .prompts import REPAIR_PROMPT
+
+
+class StructuredOutputError(ValueError):
+	pass
+
+
+# field -> (type, required)
+Schema = Dict[str, Tuple[type, bool]]
+
+SUMMARY_SCHEMA: Schema = {'summary': (str, True), 'category': (str, True), 'project_name': (str, False)}
+# the local classifier already decided the category
+SUMMARY_ONLY_SCHEMA: Schema = {'summary': (str, True), 'category': (str, False), 'project_name': (str, False)}
+
+_FENCE = re.compile(r'```[a-zA-Z]*[ \t]*\n?(.*?)(?:```|$)', re.DOTALL)
+_TYPE_NAMES = {str: 'string', int: 'integer', float: 'number', bool: 'boolean', list: 'array', dict: 'object'}
+
+
+class TruncatedOutputError(StructuredOutputError):
+	pass
+
+
+def _json_candidates(text: str) -> List[str]:
+	"""
+	Texts starting at each { or [, inside the code fence first when there is one.
+	"""
+	fenced = _FENCE.search(text)
+	blocks = [fenced.group(1), text] if fenced and ('{' in fenced.group(1) or '[' in fenced.group(1)) else [text]
+	return [block[i:] for block in blocks for i, char in enumerate(block) if char in '{[']
+
+
+def _drop_trailing_comma(out: List[str]) -> None:
+	i = len(out) - 1
+	while i >= 0 and out[i].isspace():
+		i -= 1
+	if i >= 0 and out[i] == ',':
+		del out[i:]
+
+
+def _first_value(text: str) -> Tuple[str, str]:
+	"""
+	Cut the first JSON value out of text, dropping trailing commas, returns it and the rest of text.
+	Raises TruncatedOutputError when the value is never closed, e.g. because the answer hit the token limit.
+	"""
+	out: List[str] = []
+	closers: List[str] = []
+	in_string = escaped = False
+	for position, char in enumerate(text):
+		if in_string:
+			out.append(char)
+			if escaped:
+				escaped = False
+			elif char == '\\':
+				escaped = True
+			elif char == '"':
+				in_string = False
+			continue
+		if char == '"':
+			in_string = True
+		elif char in '{[':
+			closers.append('}' if char == '{' else ']')
+		elif char in '}]':
+			_drop_trailing_comma(out)
+			if not closers or closers.pop() != char:
+				raise StructuredOutputError('Unbalanced brackets in the response')
+			out.append(char)
+			if not closers:
+				return ''.join(out), text[position + 1 :]
+			continue
+		out.append(char)
+	raise TruncatedOutputError('The response was cut off before the JSON was complete')
+
+
+def extract_json(text: str) -> Any:
+	"""
+	Parse JSON from an LLM answer that may wrap it in code fences or prose (which may contain brackets too)
+	or have trailing commas. A truncated answer raises TruncatedOutputError, so it is not taken for a complete one.
+	"""
+	text = (text or '').strip()
+	try:
+		return json.loads(text)
+	except ValueError:
+		pass
+	error = StructuredOutputError('No JSON object in the response')
+	truncated = False
+	for candidate in _json_candidates(text):
+		try:
+			value, rest = _first_value(candidate)
+			# after an unclosed value only a value ending the answer counts, anything else lies inside the cut off one
+			if truncated and rest.strip(' \t\r\n`'):
+				continue
+			return json.loads(value)
+		except TruncatedOutputError as e:
+			truncated = True
+			error = e
+		except StructuredOutputError as e:
+			error = e
+		except json.JSONDecodeError as e:
+			error = StructuredOutputError(f'Invalid JSON in the response: {e.msg}')
+	raise error
+
+
+def validate(data: Any, schema: Schema) -> Dict[str, Any]:
+	"""
+	The schema fields of a parsed answer, raises StructuredOutputError for missing or mistyped fields.
+	"""
+	if not isinstance(data, dict):
+		raise StructuredOutputError(f'Expected a JSON object, got {type(data).__name__}')
+	result = {}
+	for field, (field_type, required) in schema.items():
+		value = data.get(field)
+		if value is None or value == '':
+			if required:
+				raise StructuredOutputError(f'Missing field "{field}"')
+			result[field] = None
+			continue
+		if not isinstance(value, field_type):
+			raise StructuredOutputError(f'Field "{field}" must be a {_TYPE_NAMES.get(field_type, field_type.__name__)}')
+		result[field] = value
+	return result
+
+
+def parse_structured(text: str, schema: Schema) -> Dict[str, Any]:
+	return validate(extract_json(text), schema)
+
+
+def build_repair_prompt(response: str, schema: Schema, error: str) -> str:
+	"""
+	Prompt asking to fix a malformed answer, it only contains the answer so it is much cheaper than a retry.
+	"""
+	fields = ', '.join(
+		f'"{field}" ({_TYPE_NAMES.get(field_type, field_type.__name__)}{"" if required else ", optional"})'
+		for field, (field_type, required) in schema.items()
+	)
+	return REPAIR_PROMPT.format(fields=fields, error=error, response=response)
@@ -1,23 +1,22 @@
-from dotenv import load_dotenv
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai.chat_models import ChatOpenAI
+from .llm_client import get_llm, llm_invoke
+from .prompts import ANALYSIS_PROMPT
 
-load_dotenv()
 
-llm = ChatOpenAI(base_url='https://llmlab.plgrid.pl/api/v1', model='meta-llama/Llama-3.3-70B-Instruct', temperature=0)
-
-
-def query_llm(prompt: str, emails: list[dict]) -> str:
+def query_llm(prompt: str, emails: list[dict], relations: str = '', attachments: str = 'none') -> str:
 	"""
 	Rus simple query to llm
 	"""
-	context_prompt = ChatPromptTemplate.from_template(
-		'You are an expert assistant analyzing internal email data. Use ONLY the provided email context.'
-		'\n\nRetrieved Context: {context}'
-		'\n\nUser Question: {question}'
-	)
-	chain = {'context': (lambda x: str(emails)), 'question': (lambda x: x)} | context_prompt | llm | StrOutputParser()
-	response = chain.invoke(prompt)
+	from langchain_core.prompts import ChatPromptTemplate
+
+	context_prompt = ChatPromptTemplate.from_template(ANALYSIS_PROMPT)
+	messages = context_prompt.format_messages(context=str(emails), relations=relations, attachments=attachments, question=prompt)
+	response = llm_invoke(messages, 'analyze')
+
+	return response.content
+
 
-	return response
+def __getattr__(name: str):
+	# `llm` used to be created at import time, keep it importable for existing callers
+	if name == 'llm':
+		return get_llm()
+	raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -1 +1,672 @@
-# Create your tests here.
+import os
+import pathlib
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+from types import SimpleNamespace
+from unittest import mock
+
+import pandas as pd
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from . import analysis, ingest, llm_summary, usage
+from . import scheduler as llm_scheduler
+from .admin import EstimatedCountPaginator
+from .classifier import CategoryClassifier, classify_email, get_classifier, training_data
+from .dedup import compute_signature, find_duplicate, index_email, similarity
+from .extraction import chunk_pages, estimate_tokens
+from .llm_client import set_llm
+from .models import AnalysisSession, CommunicationEdge, Email, IngestCheckpoint, LLMAnalysis, LLMFailure, LLMUsage
+from .relations import index_edges, index_emails, project_code
+from .scheduler import BACKFILL, BULK, INTERACTIVE, LLMScheduler
+from .structured import SUMMARY_SCHEMA, StructuredOutputError, TruncatedOutputError, extract_json, validate
+from .watcher import MailWatcher
+
+BODY = (
+	'Hello team, the quarterly report for the retail segment is attached. Please review the revenue numbers '
+	'and the cost breakdown before the Friday meeting, we will decide on the budget for the next quarter there. '
+	'Let me know if anything is missing or unclear in the spreadsheet.'
+)
+
+
+class ExtractJsonTests(SimpleTestCase):
+	def test_plain_json(self):
+		self.assertEqual(extract_json('{"summary": "s", "category": "hr"}'), {'summary': 's', 'category': 'hr'})
+
+	def test_code_fence_and_trailing_comma(self):
+		answer = 'Sure:\n```json\n{"summary": "s", "tags": ["a", "b",],}\n```'
+		self.assertEqual(extract_json(answer), {'summary': 's', 'tags': ['a', 'b']})
+
+	def test_brackets_in_prose_before_the_json(self):
+		self.assertEqual(extract_json('Here [is] the JSON: {"summary": "s"}'), {'summary': 's'})
+		self.assertEqual(extract_json('Result {see below}: {"summary": "s"} done'), {'summary': 's'})
+
+	def test_truncated_answer_is_rejected(self):
+		with self.assertRaises(TruncatedOutputError):
+			extract_json('{"summary": "abc')
+		# the complete inner object of a cut off answer is not taken for the answer
+		with self.assertRaises(TruncatedOutputError):
+			extract_json('{"summary": "abc", "details": {"a": 1}, "category": "fin')
+
+	def test_no_json(self):
+		with self.assertRaises(StructuredOutputError):
+			extract_json('I cannot summarize this email.')
+
+	def test_validate(self):
+		self.assertEqual(
+			validate({'summary': 's', 'category': 'hr', 'extra': 1}, SUMMARY_SCHEMA),
+			{'summary': 's', 'category': 'hr', 'project_name': None},
+		)
+		with self.assertRaisesMessage(StructuredOutputError, 'Missing field "category"'):
+			validate({'summary': 's', 'category': ''}, SUMMARY_SCHEMA)
+		with self.assertRaisesMessage(StructuredOutputError, 'must be a string'):
+			validate({'summary': ['s'], 'category': 'hr'}, SUMMARY_SCHEMA)
+		with self.assertRaisesMessage(StructuredOutputError, 'Expected a JSON object'):
+			validate(['s'], SUMMARY_SCHEMA)
+
+
+class IngestBudgetTests(TestCase):
+	def test_batch_is_saved_when_the_budget_stops_the_repair(self):
+		from . import ingest
+
+		def llm_batch(prompts, endpoint, *args, **kwargs):
+			if endpoint == 'repair':
+				raise usage.BudgetExceeded('job budget')
+			return [
+				SimpleNamespace(content='{"summary": "s", "category": "hr"}' if i == 0 else 'no json')
+				for i in range(len(prompts))
+			]
+
+		messages = [
+			{'subject': 'first', 'message_content': 'first message body with enough words'},
+			{'subject': 'second', 'message_content': 'another body, different from the first one'},
+		]
+		with mock.patch.object(ingest, 'llm_batch', llm_batch):
+			with self.assertRaises(usage.BudgetExceeded):
+				ingest.ingest_file('/mail/box.txt', 'hash', messages, batch_size=2)
+		checkpoint = IngestCheckpoint.objects.get(path='/mail/box.txt')
+		self.assertEqual(checkpoint.messages_done, 2)
+		self.assertEqual(Email.objects.count(), 2)
+		self.assertEqual(LLMFailure.objects.get().email.subject, 'second')
+
+
+class CategoryClassifierTests(SimpleTestCase):
+	texts = [
+		'invoice payment overdue budget',
+		'budget cost invoice for the quarter',
+		'payment of the invoice and budget review',
+		'meeting invitation calendar tomorrow',
+		'schedule a meeting in the calendar',
+		'calendar invitation for the weekly meeting',
+	]
+	labels = ['finance'] * 3 + ['meeting'] * 3
+
+	def test_fit_predict(self):
+		model = CategoryClassifier.fit(self.texts, self.labels)
+		self.assertEqual(model.labels, ['finance', 'meeting'])
+		self.assertEqual(model.predict('please pay the invoice')[0], 'finance')
+		self.assertEqual(model.predict('meeting in my calendar')[0], 'meeting')
+		self.assertAlmostEqual(float(model.predict_proba('invoice').sum()), 1.0, places=5)
+
+	def test_save_load_and_reload(self):
+		with tempfile.TemporaryDirectory() as tmp:
+			path = pathlib.Path(tmp) / 'model.npz'
+			with override_settings(CATEGORY_MODEL_PATH=path, CATEGORY_CONFIDENCE_THRESHOLD=0.0):
+				self.assertIsNone(get_classifier())
+				model = CategoryClassifier.fit(self.texts, self.labels)
+				model.save(path)
+				loaded = get_classifier()
+				self.assertEqual(loaded.predict('invoice budget'), model.predict('invoice budget'))
+				self.assertIs(get_classifier(), loaded)
+				self.assertEqual(classify_email('Invoice', 'payment of the budget'), 'finance')
+
+				# a retrained model replacing the file is picked up by the running process
+				CategoryClassifier.fit(self.texts, ['legal'] * 3 + ['hr'] * 3).save(path)
+				stat = path.stat()
+				os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+				self.assertEqual(get_classifier().labels, ['hr', 'legal'])
+				self.assertEqual(os.listdir(tmp), ['model.npz'])
+
+
+class TrainingDataTests(TestCase):
+	def test_only_llm_and_manual_labels_of_originals(self):
+		original = Email.objects.create(subject='invoice', category='finance', category_source='llm')
+		Email.objects.create(subject='fwd invoice', category='finance', category_source='llm', duplicate_of=original)
+		Email.objects.create(subject='meeting', category='meeting', category_source='manual')
+		Email.objects.create(subject='guess', category='hr', category_source='classifier')
+		Email.objects.create(subject='legacy', category='legal')
+		Email.objects.create(subject='unlabelled')
+
+		self.assertEqual(sorted(training_data()[1]), ['finance', 'meeting'])
+		self.assertEqual(sorted(training_data(include_legacy=True)[1]), ['finance', 'legal', 'meeting'])
+
+
+class NearDuplicateTests(TestCase):
+	def test_similarity(self):
+		signature = compute_signature(BODY)
+		self.assertEqual(similarity(signature, compute_signature(BODY)), 1.0)
+		# quoted lines, case and punctuation do not matter
+		self.assertEqual(similarity(signature, compute_signature(BODY.upper() + '\n> earlier message')), 1.0)
+		self.assertGreater(similarity(signature, compute_signature(BODY.replace('Friday', 'Monday'))), 0.8)
+		other = compute_signature('The server migration is planned for next weekend, expect a short outage of the portal.')
+		self.assertLess(similarity(signature, other), 0.2)
+		self.assertIsNone(compute_signature('too short'))
+
+	def test_lsh_lookup(self):
+		original = Email.objects.create(subject='report', message_content=BODY, summary='Quarterly report')
+		index_email(original, compute_signature(BODY))
+		copy = Email.objects.create(
+			subject='Fwd: report', message_content=BODY, summary='Quarterly report', duplicate_of=original
+		)
+		index_email(copy, compute_signature(BODY))
+
+		# near-duplicates resolve to the root of the cluster
+		self.assertEqual(find_duplicate(compute_signature(BODY.replace('Friday', 'Monday'))), original)
+		self.assertIsNone(find_duplicate(compute_signature('Completely unrelated text about the office party next week.')))
+		self.assertIsNone(find_duplicate(None))
+
+	def test_unsummarized_emails_are_not_reused(self):
+		email = Email.objects.create(subject='report', message_content=BODY)
+		index_email(email, compute_signature(BODY))
+		self.assertIsNone(find_duplicate(compute_signature(BODY)))
+
+	def test_near_duplicate_of_a_failed_save_is_stored(self):
+		from . import ingest
+
+		messages = [{'subject': 'report', 'message_content': BODY}, {'subject': 'Fwd: report', 'message_content': BODY}]
+		summary = SimpleNamespace(content='{"summary": "Quarterly report", "category": "finance"}')
+		with mock.patch.object(ingest, 'llm_batch', lambda prompts, *args, **kwargs: [summary for _ in prompts]):
+			prepared = ingest.summarize_batch(messages)
+		self.assertEqual([item['twin'] for item in prepared], [None, 0])
+
+		save_email = ingest.save_email
+
+		def failing_first(message, item, original):
+			if message['subject'] == 'report':
+				raise ValueError('constraint failed')
+			return save_email(message, item, original)
+
+		with mock.patch.object(ingest, 'save_email', failing_first):
+			self.assertEqual(ingest.save_batch(messages, prepared), 1)
+		email = Email.objects.get()
+		self.assertEqual((email.subject, email.summary, email.duplicate_of), ('Fwd: report', 'Quarterly report', None))
+
+
+def write_mail_file(path: pathlib.Path, messages: int, encoding: str = 'utf-8') -> None:
+	parts = []
+	for i in range(messages):
+		body = ' '.join(f'topic{i}word{j}' for j in range(12))
+		parts.append(
+			f'Od: Sender {i} <sender{i}@example.com>\nWysłano: 2025-03-07 09:{i:02d}\n'
+			f'Do: Recipient <recipient@example.com>\nTemat: Message {i}\n\n{body}\n'
+		)
+	path.write_bytes('\n'.join(parts).encode(encoding))
+
+
+def summaries(prompts, *args, **kwargs):
+	return [SimpleNamespace(content='{"summary": "s", "category": "hr"}') for _ in prompts]
+
+
+class IngestCommandTests(TestCase):
+	def setUp(self):
+		self.tmp = tempfile.TemporaryDirectory()
+		self.addCleanup(self.tmp.cleanup)
+		self.dir = pathlib.Path(self.tmp.name)
+
+	def ingest(self, *args):
+		call_command(
+			'ingest', str(self.dir), '--batch-size', '2', *args, stdout=open(os.devnull, 'w'), stderr=open(os.devnull, 'w')
+		)
+
+	def test_resume_after_a_stop_partway_through_a_file(self):
+		write_mail_file(self.dir / 'box.txt', 5)
+		calls = []
+
+		def budget_after_first_batch(prompts, *args, **kwargs):
+			calls.append(len(prompts))
+			if len(calls) > 1:
+				raise usage.BudgetExceeded('job budget')
+			return summaries(prompts)
+
+		with mock.patch.object(ingest, 'llm_batch', budget_after_first_batch), self.assertRaisesMessage(Exception, 'job budget'):
+			self.ingest()
+		checkpoint = IngestCheckpoint.objects.get()
+		self.assertEqual((checkpoint.messages_done, checkpoint.completed), (2, False))
+		self.assertEqual(Email.objects.count(), 2)
+
+		calls.clear()
+		with mock.patch.object(ingest, 'llm_batch', mock.Mock(side_effect=summaries)) as llm_batch:
+			self.ingest()
+		# only the messages after the checkpoint are summarized again
+		self.assertEqual(sum(len(call.args[0]) for call in llm_batch.call_args_list), 3)
+		self.assertEqual(Email.objects.count(), 5)
+		self.assertTrue(IngestCheckpoint.objects.get().completed)
+
+		with mock.patch.object(ingest, 'llm_batch', mock.Mock(side_effect=summaries)) as llm_batch:
+			self.ingest()
+		llm_batch.assert_not_called()
+
+	def test_failing_files_are_recorded_and_skipped(self):
+		write_mail_file(self.dir / 'a_unreadable.txt', 1, encoding='utf-16')
+		write_mail_file(self.dir / 'b_broken.txt', 1)
+		write_mail_file(self.dir / 'c_good.txt', 2)
+		ingest_file = ingest.ingest_file
+
+		def broken(path, *args, **kwargs):
+			if path.endswith('b_broken.txt'):
+				raise RuntimeError('database is gone')
+			return ingest_file(path, *args, **kwargs)
+
+		with (
+			mock.patch.object(ingest, 'llm_batch', summaries),
+			mock.patch('backendApp.management.commands.ingest.ingest_file', broken),
+		):
+			self.ingest()
+		errors = dict(IngestCheckpoint.objects.exclude(error=None).values_list('path', 'error'))
+		self.assertEqual(sorted(pathlib.Path(path).name for path in errors), ['a_unreadable.txt', 'b_broken.txt'])
+		self.assertIn('UnicodeDecodeError', errors[str(self.dir / 'a_unreadable.txt')])
+		self.assertEqual(errors[str(self.dir / 'b_broken.txt')], 'RuntimeError: database is gone')
+		self.assertEqual(Email.objects.count(), 2)
+
+
+class EmailViewTests(TestCase):
+	def setUp(self):
+		self.email = Email.objects.create(subject='report', message_content=BODY, summary='Quarterly report', category='finance')
+
+	def test_list_does_not_load_bodies(self):
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get('/emails/')
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(len(queries), 1)
+		self.assertNotIn('encrypted_message_content', queries[0]['sql'])
+		[row] = response.json()
+		self.assertNotIn('message_content', row)
+		self.assertEqual((row['subject'], row['summary'], row['preview']), ('report', 'Quarterly report', self.email.preview))
+
+	def test_list_filters_by_category(self):
+		Email.objects.create(subject='party', category='hr')
+		response = self.client.get('/emails/', {'category': 'Finance'})
+		self.assertEqual([row['id'] for row in response.json()], [str(self.email.id)])
+
+	def test_detail_returns_the_body(self):
+		response = self.client.get(f'/emails/{self.email.id}/')
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.json()['message_content'], BODY)
+
+	def test_detail_of_a_missing_email_is_404(self):
+		response = self.client.get(f'/emails/{uuid.uuid4()}/')
+		self.assertEqual(response.status_code, 404)
+
+
+class EmailAdminTests(TestCase):
+	def setUp(self):
+		self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+		self.invoice = Email.objects.create(subject='invoice', sender_email='Anna@Example.com', category='finance')
+		self.meeting = Email.objects.create(subject='meeting', recipient_name='Jan Kowalski', category='meeting')
+
+	def changelist(self, **params):
+		response = self.client.get('/admin/backendApp/email/', params)
+		self.assertEqual(response.status_code, 200)
+		return {email.id for email in response.context['cl'].result_list}
+
+	def test_search_matches_blind_indexes_exactly(self):
+		self.assertEqual(self.changelist(q=' anna@example.com '), {self.invoice.id})
+		self.assertEqual(self.changelist(q='jan kowalski'), {self.meeting.id})
+		self.assertEqual(self.changelist(q=str(self.meeting.id)), {self.meeting.id})
+		self.assertEqual(self.changelist(q='anna'), set())
+
+	def test_category_filter(self):
+		self.assertEqual(self.changelist(category='finance'), {self.invoice.id})
+
+	def test_estimated_count_only_for_large_unfiltered_tables(self):
+		# MAX(rowid) still counts the deleted first row, which tells the estimate apart from COUNT(*)
+		self.invoice.delete()
+		emails = Email.objects.order_by('-created_at')
+		with override_settings(ADMIN_EXACT_COUNT_LIMIT=1):
+			self.assertEqual(EstimatedCountPaginator(emails, 50).count, 2)
+			self.assertEqual(EstimatedCountPaginator(emails.filter(duplicate_of=None), 50).count, 1)
+		with override_settings(ADMIN_EXACT_COUNT_LIMIT=10):
+			self.assertEqual(EstimatedCountPaginator(emails, 50).count, 1)
+
+
+class MailWatcherTests(TestCase):
+	def test_once_stops_on_budget_with_files_queued(self):
+		with tempfile.TemporaryDirectory() as tmp:
+			for i in range(5):
+				pathlib.Path(tmp, f'{i}.txt').write_text('mail')
+			watcher = MailWatcher([tmp], debounce=0, queue_size=10, workers=1, log=lambda message: None)
+			with (
+				# the test database is not shared with the watcher thread
+				mock.patch.object(watcher, 'load_known'),
+				mock.patch('backendApp.watcher.parse_mail_file', lambda path: (path, 'hash', [])),
+				mock.patch('backendApp.watcher.ingest_file', side_effect=usage.BudgetExceeded('budget')) as ingest_file,
+			):
+				thread = threading.Thread(target=watcher.run, kwargs={'once': True})
+				thread.start()
+				thread.join(10)
+			self.assertFalse(thread.is_alive(), 'watcher did not stop')
+			self.assertEqual(ingest_file.call_count, 1)
+			self.assertTrue(watcher.stop_event.is_set())
+			self.assertEqual(watcher.inflight, set())
+			self.assertEqual(watcher.queue.unfinished_tasks, 0)
+
+	def test_scan_waits_for_changes_to_settle(self):
+		with tempfile.TemporaryDirectory() as tmp:
+			path = pathlib.Path(tmp, 'box.txt')
+			path.write_text('mail')
+			watcher = MailWatcher([tmp], debounce=0, queue_size=10, workers=1, log=lambda message: None)
+			self.assertEqual(watcher.scan(), [])
+			[(ready, stat)] = watcher.scan()
+			self.assertEqual(ready, str(path))
+
+			watcher.known[ready] = (stat.st_size, stat.st_mtime_ns)
+			del watcher.pending[ready]
+			self.assertEqual(watcher.scan(), [])
+			path.write_text('more mail')
+			self.assertEqual(watcher.scan(), [])
+			self.assertEqual([ready for ready, _ in watcher.scan()], [str(path)])
+
+
+class ChunkPagesTests(SimpleTestCase):
+	def test_chunks_follow_paragraphs_and_pages(self):
+		pages = ['First paragraph.\n\nSecond   paragraph.', '', 'Third paragraph on page three.']
+		chunks = list(chunk_pages(pages, 10))
+		self.assertEqual([(start, end) for start, end, _, _ in chunks], [(1, 1), (3, 3)])
+		self.assertEqual(chunks[0][2], 'First paragraph.\n\nSecond paragraph.')
+		self.assertEqual(chunks[1][2], 'Third paragraph on page three.')
+		for _, _, text, tokens in chunks:
+			self.assertEqual(tokens, estimate_tokens(text))
+
+	def test_chunk_spans_pages(self):
+		self.assertEqual(list(chunk_pages(['Page one.', 'Page two.'], 100)), [(1, 2, 'Page one.\n\nPage two.', 6)])
+
+	def test_long_paragraph_is_split(self):
+		paragraph = ' '.join(f'word{i}' for i in range(200))
+		chunks = list(chunk_pages([paragraph], 16))
+		self.assertGreater(len(chunks), 1)
+		self.assertTrue(all(tokens <= 16 for _, _, _, tokens in chunks))
+		self.assertEqual(' '.join(text for _, _, text, _ in chunks).split(), paragraph.split())
+
+	def test_empty_document(self):
+		self.assertEqual(list(chunk_pages(['', '  \n\n '], 10)), [])
+
+
+class LLMUsageTests(TestCase):
+	def setUp(self):
+		from .benchmark.fake_llm import FakeChatModel
+
+		self.model = FakeChatModel()
+		previous = set_llm(self.model, 'key_information')
+		self.addCleanup(set_llm, previous, 'key_information')
+
+	def test_budget_stops_before_the_call(self):
+		with mock.patch.object(type(self.model), '_generate') as generate, usage.activate(usage.Job('test', budget=10)):
+			with self.assertRaises(usage.BudgetExceeded):
+				llm_summary.extract_key_information_by_llm('report', BODY)
+		generate.assert_not_called()
+		self.assertFalse(LLMUsage.objects.exists())
+
+	def test_key_information_is_recorded_under_its_job(self):
+		df = pd.DataFrame([{'subject': 'report', 'message_content': BODY}, {'subject': None, 'message_content': None}])
+		llm_summary.add_key_information_to_dataframe(df)
+		record = LLMUsage.objects.get()
+		self.assertEqual((record.job, record.endpoint, record.calls), ('key_information', 'key_information', 1))
+		self.assertGreater(record.prompt_tokens, 0)
+
+	@override_settings(LLM_CONCURRENCY=4)
+	def test_dataframe_summaries_run_concurrently(self):
+		df = pd.DataFrame([{'subject': 'report', 'message_content': BODY}])
+		with mock.patch.object(llm_summary, 'llm_batch', return_value=[SimpleNamespace(content='summary')]) as llm_batch:
+			df = llm_summary.add_summary_to_dataframe(df)
+		self.assertEqual(llm_batch.call_args.kwargs['concurrency'], 4)
+		self.assertEqual(df['summary'].tolist(), ['summary'])
+
+
+class ResummarizeTests(TestCase):
+	def setUp(self):
+		self.original = Email.objects.create(subject='report', message_content=BODY, summary='old', prompt_version='v0')
+		self.copy = Email.objects.create(
+			subject='fwd report', message_content=BODY, summary='old', prompt_version='v0', duplicate_of=self.original
+		)
+		self.current = Email.objects.create(
+			subject='current', summary='s', prompt_version=ingest.SUMMARY_VERSION, llm_model=ingest.configured_model()
+		)
+
+	def test_stale_emails_leave_out_duplicates_and_current_summaries(self):
+		unsummarized = Email.objects.create(subject='new')
+		self.assertEqual(list(ingest.stale_emails()), [unsummarized, self.original])
+
+	def test_new_summary_replaces_the_duplicates_summary(self):
+		with mock.patch.object(ingest, 'llm_batch', summaries):
+			self.assertEqual(ingest.resummarize_emails([self.original]), [])
+		for email in (self.original, self.copy):
+			email.refresh_from_db()
+			self.assertEqual((email.summary, email.category, email.category_source), ('s', 'hr', 'llm'))
+			self.assertEqual(email.prompt_version, ingest.SUMMARY_VERSION)
+			self.assertIsNotNone(email.summarized_at)
+		self.assertEqual(list(ingest.stale_emails()), [])
+
+	def test_failed_summary_keeps_the_old_one(self):
+		no_json = mock.Mock(return_value=[SimpleNamespace(content='no json')])
+		with mock.patch.object(ingest, 'llm_batch', no_json):
+			self.assertEqual(ingest.resummarize_emails([self.original]), [self.original])
+		self.copy.refresh_from_db()
+		self.assertEqual((self.copy.summary, self.copy.prompt_version), ('old', 'v0'))
+		self.assertFalse(LLMFailure.objects.get().resolved)
+
+
+class LLMSchedulerTests(SimpleTestCase):
+	def acquire_in_thread(self, scheduler, priority, job, order):
+		def call():
+			with scheduler.slot(priority, job):
+				order.append((priority, job))
+
+		thread = threading.Thread(target=call)
+		thread.start()
+		return thread
+
+	def wait_queued(self, scheduler, priority, calls):
+		deadline = time.monotonic() + 5
+		while scheduler.metrics()['classes'][priority]['queued'] < calls:
+			self.assertLess(time.monotonic(), deadline, 'call was not queued')
+			time.sleep(0.005)
+
+	def test_share_keeps_slots_for_interactive_calls(self):
+		scheduler = LLMScheduler(4, {INTERACTIVE: 1.0, BACKFILL: 0.75, BULK: 0.5})
+		self.assertEqual(scheduler.limits, {INTERACTIVE: 4, BACKFILL: 3, BULK: 2})
+		scheduler.acquire(BULK)
+		scheduler.acquire(BULK)
+		self.assertFalse(scheduler._may_run(BULK))
+		self.assertTrue(scheduler._may_run(BACKFILL))
+		scheduler.acquire(BACKFILL)
+		# backfill and bulk together hold their share, the last slot stays free for interactive calls
+		self.assertFalse(scheduler._may_run(BACKFILL))
+		self.assertTrue(scheduler._may_run(INTERACTIVE))
+
+	def test_higher_priority_is_served_first(self):
+		scheduler = LLMScheduler(1, {})
+		order = []
+		scheduler.acquire(INTERACTIVE)
+		threads = [self.acquire_in_thread(scheduler, BULK, 'ingest', order)]
+		self.wait_queued(scheduler, BULK, 1)
+		threads.append(self.acquire_in_thread(scheduler, INTERACTIVE, 'question', order))
+		self.wait_queued(scheduler, INTERACTIVE, 1)
+		scheduler.release(INTERACTIVE)
+		for thread in threads:
+			thread.join(5)
+		self.assertEqual(order, [(INTERACTIVE, 'question'), (BULK, 'ingest')])
+
+	def test_round_robin_between_jobs_of_a_class(self):
+		scheduler = LLMScheduler(1, {})
+		order = []
+		scheduler.acquire(INTERACTIVE)
+		threads = []
+		for calls, job in enumerate(['first', 'first', 'second'], start=1):
+			threads.append(self.acquire_in_thread(scheduler, BULK, job, order))
+			self.wait_queued(scheduler, BULK, calls)
+		scheduler.release(INTERACTIVE)
+		for thread in threads:
+			thread.join(5)
+		self.assertEqual([job for _, job in order], ['first', 'second', 'first'])
+		self.assertEqual(scheduler.metrics()['classes'][BULK]['served'], 3)
+
+	@unittest.skipIf(llm_scheduler.fcntl is None, 'no flock on this platform')
+	def test_caps_hold_across_schedulers_sharing_a_lock_dir(self):
+		shares = {BACKFILL: 0.5, BULK: 0.5}
+		with tempfile.TemporaryDirectory() as tmp:
+			web, ingest_run = LLMScheduler(2, shares, tmp), LLMScheduler(2, shares, tmp)
+			self.assertEqual(web.metrics()['scope'], 'host')
+			order = []
+			with ingest_run.slot(BULK, 'ingest'):
+				thread = self.acquire_in_thread(web, BACKFILL, 'resummarize', order)
+				# the bulk call of the other scheduler holds the one slot of backfill and bulk together
+				time.sleep(0.2)
+				with web.slot(INTERACTIVE, 'question'):
+					order.append((INTERACTIVE, 'question'))
+			thread.join(5)
+			self.assertEqual(order, [(INTERACTIVE, 'question'), (BACKFILL, 'resummarize')])
+		self.assertEqual(LLMScheduler(2, shares).metrics()['scope'], 'process')
+
+
+class AnalysisSessionTests(TestCase):
+	def setUp(self):
+		Email.objects.create(subject='report', message_content=BODY, summary='Quarterly report')
+		patches = [
+			mock.patch.object(analysis, '_cache', analysis.ContextCache(60, 4)),
+			mock.patch.object(analysis, 'query_llm', return_value='first answer'),
+			mock.patch.object(analysis, 'llm_invoke', return_value=SimpleNamespace(content='follow-up answer')),
+		]
+		for patch in patches:
+			patch.start()
+			self.addCleanup(patch.stop)
+
+	def test_follow_up_gets_the_conversation(self):
+		session = AnalysisSession()
+		analysis.ask(session, 'Which report is due?')
+		self.assertTrue(AnalysisSession.objects.filter(pk=session.pk).exists())
+
+		stored = AnalysisSession.objects.get(pk=session.pk)
+		answer = analysis.ask(stored, 'Who sent it?')
+		self.assertEqual(answer.answer, 'follow-up answer')
+		prompt = '\n'.join(message.content for message in analysis.llm_invoke.call_args.args[0])
+		self.assertIn('Q: Which report is due?\nA: first answer', prompt)
+		stored.refresh_from_db()
+		self.assertEqual([turn['question'] for turn in stored.history], ['Which report is due?', 'Who sent it?'])
+		self.assertEqual(LLMAnalysis.objects.filter(session=stored).count(), 2)
+
+	@override_settings(ANALYSIS_HISTORY_TURNS=2)
+	def test_history_keeps_the_last_turns(self):
+		session = AnalysisSession()
+		for question in ('first', 'second', 'third'):
+			analysis.ask(session, question)
+		session.refresh_from_db()
+		self.assertEqual([turn['question'] for turn in session.history], ['second', 'third'])
+
+	def test_concurrent_follow_ups_keep_both_turns(self):
+		session = AnalysisSession()
+		analysis.ask(session, 'first')
+		# both requests read the session before either saved its answer
+		one, other = AnalysisSession.objects.get(pk=session.pk), AnalysisSession.objects.get(pk=session.pk)
+		analysis.ask(one, 'second')
+		analysis.ask(other, 'third')
+		session.refresh_from_db()
+		self.assertEqual([turn['question'] for turn in session.history], ['first', 'second', 'third'])
+		self.assertEqual(session.version, 2)
+
+	def test_working_set_is_rebuilt_when_emails_change(self):
+		first = analysis.working_set('session')
+		self.assertIs(analysis.working_set('session'), first)
+		# another session over the same emails shares the decrypted working set
+		self.assertIs(analysis.working_set('other'), first)
+		Email.objects.create(subject='late news')
+		rebuilt = analysis.working_set('session')
+		self.assertIsNot(rebuilt, first)
+		self.assertEqual(len(rebuilt.emails), 2)
+
+
+class ContextCacheTests(SimpleTestCase):
+	def test_entries_expire_after_their_last_use(self):
+		cache = analysis.ContextCache(ttl=10, size=4)
+		working_set = analysis.WorkingSet(('fingerprint',), [])
+		with mock.patch.object(analysis.time, 'monotonic', return_value=100):
+			cache.put('session', working_set)
+		with mock.patch.object(analysis.time, 'monotonic', return_value=105):
+			self.assertIs(cache.get('session'), working_set)
+		with mock.patch.object(analysis.time, 'monotonic', return_value=114):
+			self.assertIs(cache.find(('fingerprint',)), working_set)
+		with mock.patch.object(analysis.time, 'monotonic', return_value=116):
+			self.assertIsNone(cache.find(('fingerprint',)))
+			self.assertIsNone(cache.get('session'))
+
+	def test_least_recently_used_entry_is_evicted(self):
+		cache = analysis.ContextCache(ttl=60, size=2)
+		sets = [analysis.WorkingSet((i,), []) for i in range(3)]
+		cache.put('a', sets[0])
+		cache.put('b', sets[1])
+		cache.get('a')
+		cache.put('c', sets[2])
+		self.assertIsNone(cache.get('b'))
+		self.assertIs(cache.get('a'), sets[0])
+
+
+class RelationsTests(TestCase):
+	def email(self, sender, recipient, subject, date):
+		return Email.objects.create(
+			sender_name=sender,
+			sender_email=f'{sender.lower()}@example.com',
+			recipient_email=recipient,
+			subject=subject,
+			date=date,
+		)
+
+	def test_project_code(self):
+		self.assertEqual(project_code('Re: ATS-HRCLOUD-MVP-001 kickoff'), 'ATS-HRCLOUD-MVP')
+		self.assertEqual(project_code('BILLSTREAM-2 invoices'), 'BILLSTREAM-2')
+		self.assertIsNone(project_code('lunch on friday'))
+		self.assertIsNone(project_code(None))
+
+	def test_index_edges_counts_pairs(self):
+		emails = [
+			self.email('Anna', 'jan@example.com', 'one', '2025-03-07 09:15'),
+			self.email('Anna', 'jan@example.com', 'two', '2025-03-09 10:00'),
+			self.email('Jan', 'anna@example.com', 'reply', '2025-03-08 11:00'),
+		]
+		index_edges(emails[:2])
+		index_edges(emails[2:])
+		index_edges(emails[:1])
+		edges = {(edge.sender, edge.recipient): edge for edge in CommunicationEdge.objects.all()}
+		anna = edges['Anna <anna@example.com>', 'jan@example.com']
+		self.assertEqual((anna.count, anna.last_contact.day), (3, 9))
+		self.assertEqual(edges['Jan <jan@example.com>', 'anna@example.com'].count, 1)
+
+	def test_projects_search(self):
+		index_emails(
+			[
+				self.email('Anna', 'jan@example.com', 'ATS-HRCLOUD-MVP-001 kickoff', '2025-03-07 09:15'),
+				self.email('Jan', 'anna@example.com', 'Re: ATS-HRCLOUD-MVP-001 kickoff', '2025-03-08 11:00'),
+				self.email('Anna', 'ola@example.com', 'BILLSTREAM-API rollout', '2025-03-09 10:00'),
+			]
+		)
+		[project] = self.client.get('/projects/', {'q': 'hrcloud ats'}).json()
+		self.assertEqual((project['name'], project['emails']), ('ATS-HRCLOUD-MVP', 2))
+		self.assertEqual(
+			sorted((person['participant'], person['sent'], person['received']) for person in project['participants']),
+			[('Anna <anna@example.com>', 1, 1), ('Jan <jan@example.com>', 1, 1)],
+		)
+		self.assertEqual([project['name'] for project in self.client.get('/projects/', {'limit': 1}).json()], ['ATS-HRCLOUD-MVP'])
+		self.assertEqual(self.client.get('/projects/', {'q': 'payroll'}).json(), [])
+
+	@override_settings(API_MAX_LIMIT=50)
+	def test_limits_out_of_range_are_rejected(self):
+		for url in ('/relations/', '/projects/'):
+			for limit in ('-1', '0', '51', 'many'):
+				response = self.client.get(url, {'limit': limit})
+				self.assertEqual(response.status_code, 400, (url, limit))
+			self.assertEqual(self.client.get(url, {'limit': 50}).status_code, 200)
+		self.assertEqual(self.client.get('/projects/', {'participants': '-3'}).status_code, 400)
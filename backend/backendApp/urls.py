@@ -1,11 +1,31 @@
 from django.urls import path
 
-from .views import AnalyzeEmailsView, EmailAPIView, SaveAnalyzeEmailsView, SaveEmailsAPIView, TestAPIView
+from .views import (
+	AnalyzeEmailsView,
+	CommunicationGraphAPIView,
+	EmailAPIView,
+	EmailAttachmentsAPIView,
+	EmailDetailAPIView,
+	EmailDuplicatesAPIView,
+	ProjectsAPIView,
+	SaveAnalyzeEmailsView,
+	SaveEmailsAPIView,
+	SchedulerAPIView,
+	TestAPIView,
+	UsageAPIView,
+)
 
 urlpatterns = [
 	path('test/', TestAPIView.as_view(), name='test'),  # for testing
 	path('emails/', EmailAPIView.as_view(), name='emails'),  # get and post
+	path('emails/<uuid:pk>/', EmailDetailAPIView.as_view(), name='email-detail'),  # get
+	path('emails/<uuid:pk>/attachments/', EmailAttachmentsAPIView.as_view(), name='email-attachments'),  # get and post
+	path('emails/duplicates/', EmailDuplicatesAPIView.as_view(), name='email-duplicates'),  # get
 	path('emails/save/', SaveEmailsAPIView.as_view(), name='save-emails'),  # post
 	path('analyze/', AnalyzeEmailsView.as_view(), name='analyze-emails'),  # get and post
+	path('usage/', UsageAPIView.as_view(), name='usage'),  # get
+	path('scheduler/', SchedulerAPIView.as_view(), name='scheduler'),  # get
+	path('relations/', CommunicationGraphAPIView.as_view(), name='relations'),  # get
+	path('projects/', ProjectsAPIView.as_view(), name='projects'),  # get
 	path('analyze/save', SaveAnalyzeEmailsView.as_view(), name='save-analyze-emails'),  # post
 ]
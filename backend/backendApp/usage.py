@@ -0,0 +1,174 @@
+import collections
+import contextvars
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Deque, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .extraction import estimate_tokens
+from .models import LLMUsage
+from .scheduler import BULK
+
+
+class BudgetExceeded(Exception):
+	pass
+
+
+class Job:
+	"""
+	One run of an LLM consuming job (an ingest, a watcher, an API request), tokens are counted against its budget
+	and its calls are scheduled with its priority class.
+	"""
+
+	def __init__(self, kind: str, budget: Optional[int] = None, priority: str = BULK):
+		self.kind = kind
+		self.id = uuid.uuid4()
+		self.budget = budget
+		self.priority = priority
+		# tokens used plus tokens reserved by calls in flight
+		self.spent = 0
+		self.lock = threading.Lock()
+
+	def reserve(self, tokens: int) -> None:
+		with self.lock:
+			if self.budget is not None and self.spent + tokens > self.budget:
+				raise BudgetExceeded(f'{self.kind} job would exceed its budget of {self.budget} tokens ({self.spent} used)')
+			self.spent += tokens
+
+	def settle(self, reserved: int, used: int) -> None:
+		with self.lock:
+			self.spent += used - reserved
+
+
+_current_job: contextvars.ContextVar[Optional[Job]] = contextvars.ContextVar('llm_job', default=None)
+
+
+@contextmanager
+def activate(job: Job) -> Iterator[Job]:
+	"""
+	Attribute LLM calls of the current thread to job. Threads do not inherit the job, workers activate it themselves.
+	"""
+	token = _current_job.set(job)
+	try:
+		yield job
+	finally:
+		_current_job.reset(token)
+
+
+def current_job() -> Optional[Job]:
+	return _current_job.get()
+
+
+class TokenRateLimiter:
+	"""
+	Sliding one minute window of tokens used by this process, calls wait until their estimate fits.
+	"""
+
+	def __init__(self):
+		self.window: Deque[Tuple[float, int]] = collections.deque()
+		self.used = 0
+		self.lock = threading.Lock()
+
+	def acquire(self, tokens: int, limit: int) -> None:
+		while True:
+			with self.lock:
+				now = time.monotonic()
+				while self.window and now - self.window[0][0] >= 60:
+					self.used -= self.window.popleft()[1]
+				# a single call above the limit would wait forever, it only waits for an empty window
+				if not self.window or self.used + tokens <= limit:
+					self.window.append((now, tokens))
+					self.used += tokens
+					return
+				wait = 60 - (now - self.window[0][0])
+			time.sleep(wait)
+
+
+_limiter = TokenRateLimiter()
+
+
+def prompt_text(prompt: Any) -> str:
+	if isinstance(prompt, str):
+		return prompt
+	if isinstance(prompt, (list, tuple)):
+		return '\n'.join(str(getattr(message, 'content', message)) for message in prompt)
+	return str(prompt)
+
+
+def tokens_today() -> int:
+	start = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+	used = LLMUsage.objects.filter(created_at__gte=start).aggregate(total=Sum(F('prompt_tokens') + F('completion_tokens')))
+	return used['total'] or 0
+
+
+def reserve(prompts: List[Any]) -> int:
+	"""
+	Check the budgets before sending prompts and throttle to LLM_TOKENS_PER_MINUTE, returns the reserved estimate.
+
+	Raises BudgetExceeded when the calls could push the job or the daily usage over its budget.
+	"""
+	estimate = sum(estimate_tokens(prompt_text(prompt)) + settings.LLM_EXPECTED_COMPLETION_TOKENS for prompt in prompts)
+	if settings.LLM_DAILY_TOKEN_BUDGET is not None and tokens_today() + estimate > settings.LLM_DAILY_TOKEN_BUDGET:
+		raise BudgetExceeded(f'Daily budget of {settings.LLM_DAILY_TOKEN_BUDGET} tokens would be exceeded')
+	job = current_job()
+	if job is not None:
+		job.reserve(estimate)
+	if settings.LLM_TOKENS_PER_MINUTE:
+		_limiter.acquire(estimate, settings.LLM_TOKENS_PER_MINUTE)
+	return estimate
+
+
+def release(reserved: int) -> None:
+	"""
+	Return the reservation of calls that failed before any usage was reported.
+	"""
+	job = current_job()
+	if job is not None:
+		job.settle(reserved, 0)
+
+
+def record(
+	endpoint: str, model: str, calls: int, prompt_tokens: int, completion_tokens: int, estimated: bool, reserved: int = 0
+) -> LLMUsage:
+	"""
+	Add calls to the usage ledger under the current job.
+	"""
+	job = current_job()
+	if job is not None:
+		job.settle(reserved, prompt_tokens + completion_tokens)
+	return LLMUsage.objects.create(
+		job=job.kind if job else None,
+		job_id=job.id if job else None,
+		endpoint=endpoint,
+		model=model,
+		calls=calls,
+		prompt_tokens=prompt_tokens,
+		completion_tokens=completion_tokens,
+		estimated=estimated,
+	)
+
+
+def record_responses(endpoint: str, model: str, prompts: List[Any], responses: List[Any], reserved: int = 0) -> LLMUsage:
+	"""
+	Record LangChain responses, using their usage metadata or a local estimate when the server sent none.
+	"""
+	prompt_tokens = completion_tokens = calls = 0
+	estimated = False
+	for prompt, response in zip(prompts, responses):
+		if isinstance(response, Exception):
+			continue
+		calls += 1
+		usage = getattr(response, 'usage_metadata', None)
+		if usage:
+			prompt_tokens += usage.get('input_tokens', 0)
+			completion_tokens += usage.get('output_tokens', 0)
+		else:
+			estimated = True
+			prompt_tokens += estimate_tokens(prompt_text(prompt))
+			completion_tokens += estimate_tokens(str(response.content))
+	return record(endpoint, model, calls, prompt_tokens, completion_tokens, estimated, reserved)
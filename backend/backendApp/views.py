@@ -1,8 +1,13 @@
-import json
 import logging
+import uuid
+from datetime import timedelta
+from typing import Any, Dict, List
 
+from django.conf import settings
+from django.db.models import Count, Sum
 from django.forms import model_to_dict
 from django.http import JsonResponse
+from django.utils import timezone
 from django.views.decorators.csrf import ensure_csrf_cookie
 from rest_framework import status
 from rest_framework.exceptions import NotFound
@@ -11,37 +16,39 @@ from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from . import usage
+from .analysis import ask
+from .anonymization import blind_index
+from .categories import normalize_category
+from .documents import attach_upload
 from .emails import analysis_to_csv, emails_to_csv, parse_mails_to_dataframe
-from .llm_summary import add_summary_to_dataframe
-from .models import Email, LLMAnalysis
-from .serializers import EmailSerializerGet, LLMAnalysisSerializerGet
-from .test_connection import llm, query_llm
+from .extraction import document_kind
+from .models import AnalysisSession, Email, LLMAnalysis, LLMUsage
+from .relations import find_projects, project_participants, top_edges
+from .scheduler import INTERACTIVE, get_scheduler
+from .serializers import (
+	EMAIL_LIST_COLUMNS,
+	AttachmentSerializerGet,
+	EmailListSerializerGet,
+	EmailSerializerGet,
+	LLMAnalysisSerializerGet,
+)
 
 logger = logging.getLogger(__name__)
 
-SUMMARY_PROMPT = """Extract key information and create a concise summary of the following email.
-Focus on:
-- Main topic or project
-- Key requirements or specifications
-- Important decisions or action items
-- Risks or concerns mentioned
-- Technical details (APIs, systems, integrations)
 
-Email:
-Subject: {subject}
-
-Content: {content}
-
-Provide JSON with the following fields:
-- summary: A clear, concise summary (2-4 sentences) that captures the essential information.
-- category: A category label for the email - use widely recognized categories.
-
-Return the response in ONLY JSON format like this:
-{{
-  "summary": "...",
-  "category": "..."
-}}
-"""
+def count_param(request: Request, name: str, default: int) -> int:
+	"""
+	Query parameter between 1 and settings.API_MAX_LIMIT, raises ValueError with the message for the client otherwise.
+	"""
+	value = request.query_params.get(name)
+	try:
+		number = default if value is None else int(value)
+	except ValueError:
+		number = 0
+	if not 1 <= number <= settings.API_MAX_LIMIT:
+		raise ValueError(f'{name} must be a whole number from 1 to {settings.API_MAX_LIMIT}')
+	return number
 
 
 @ensure_csrf_cookie
@@ -60,71 +67,224 @@ class EmailAPIView(APIView):  # type: ignore[misc]
 		if email_path is None:
 			return Response({'message': 'no email_path'}, status=status.HTTP_400_BAD_REQUEST)
 
+		# deferred, the ingest pipeline pulls in NumPy and LangChain
+		from .ingest import ingest_batch
+
 		df = parse_mails_to_dataframe(email_path)
 		total = len(df)
 		processed = 0
 
 		logger.info(f'Starting to process {total} emails incrementally')
 
-		# Process each email individually and save immediately
-		for idx, row in df.iterrows():
-			try:
-				# Generate summary for single email using LangChain llm
-				subject = row.get('subject') or 'N/A'
-				content = row.get('message_content') or 'N/A'
-				prompt = SUMMARY_PROMPT.format(subject=subject, content=content)
-				result = llm.invoke(prompt).content
-				as_json = json.loads(result)
-
-				print(f'Result for email {idx}: {result}')
-
-				# Save immediately to database
-				Email.objects.create(
-					sender_name=row.get('sender_name'),
-					sender_email=row.get('sender_email'),
-					recipient_name=row.get('recipient_name'),
-					recipient_email=row.get('recipient_email'),
-					subject=row.get('subject'),
-					date=row.get('date'),
-					message_content=row.get('message_content'),
-					summary=as_json.get('summary'),
-					category=as_json.get('category'),
-				)
-				processed += 1
-				logger.info(f'Processed email {processed}/{total}: {row.get("subject", "No subject")[:50]}')
-			except Exception as e:
-				logger.error(f'Error processing email {idx}: {e}')
-				continue
+		# Process emails in batches, each batch is saved before the next one is summarized
+		messages = df.astype(object).where(df.notna(), None).to_dict('records')
+		try:
+			with usage.activate(usage.Job('api_ingest', settings.LLM_JOB_TOKEN_BUDGET)):
+				for offset in range(0, total, settings.INGEST_BATCH_SIZE):
+					processed += ingest_batch(messages[offset : offset + settings.INGEST_BATCH_SIZE], settings.LLM_CONCURRENCY)
+					logger.info(f'Processed {processed}/{total} emails')
+		except usage.BudgetExceeded as e:
+			logger.warning(f'Stopped after {processed}/{total} emails: {e}')
+			return Response({'message': str(e), 'total': total, 'processed': processed}, status=status.HTTP_429_TOO_MANY_REQUESTS)
 
 		logger.info(f'Completed processing {processed}/{total} emails')
 		return Response({'message': 'Done', 'total': total, 'processed': processed}, status=status.HTTP_201_CREATED)
 
 	def get(self, request: Request) -> Response:
-		emails = Email.objects.filter()
-		serializer = EmailSerializerGet(emails, many=True)
+		# bodies are served by EmailDetailAPIView, the list only reads and decrypts the list columns
+		emails = Email.objects.only(*EMAIL_LIST_COLUMNS).order_by('-created_at')
+		category = request.query_params.get('category')
+		if category:
+			emails = emails.filter(category_index=blind_index(normalize_category(category)))
+		serializer = EmailListSerializerGet(emails, many=True)
+		return Response(serializer.data)
+
+
+class EmailDetailAPIView(APIView):  # type: ignore[misc]
+	def get(self, request: Request, pk) -> Response:
+		email = Email.objects.filter(pk=pk).first()
+		if email is None:
+			raise NotFound('Email not found')
+		serializer = EmailSerializerGet(email)
 		return Response(serializer.data)
 
 
+class EmailAttachmentsAPIView(APIView):  # type: ignore[misc]
+	def get_email(self, pk) -> Email:
+		email = Email.objects.filter(pk=pk).only('id').first()
+		if email is None:
+			raise NotFound('Email not found')
+		return email
+
+	def get(self, request: Request, pk) -> Response:
+		attachments = self.get_email(pk).attachments.select_related('document').order_by('created_at')
+		serializer = AttachmentSerializerGet(attachments, many=True)
+		return Response(serializer.data)
+
+	def post(self, request: Request, pk) -> Response:
+		upload = request.FILES.get('file')
+		if upload is None:
+			return Response({'message': 'no file'}, status=status.HTTP_400_BAD_REQUEST)
+		try:
+			document_kind(upload.name)
+		except ValueError as e:
+			return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+		attachment = attach_upload(self.get_email(pk), upload)
+		if attachment is None:
+			# extracted in the background, listed under GET once done
+			return Response({'message': 'Processing'}, status=status.HTTP_202_ACCEPTED)
+		return Response(AttachmentSerializerGet(attachment).data, status=status.HTTP_201_CREATED)
+
+
+class EmailDuplicatesAPIView(APIView):  # type: ignore[misc]
+	def get(self, request: Request) -> Response:
+		"""
+		Near-duplicate clusters, largest first: the summarized original and the emails that reused its summary.
+		"""
+		clusters = (
+			Email.objects.filter(duplicates__isnull=False)
+			.annotate(duplicate_count=Count('duplicates'))
+			.order_by('-duplicate_count')
+			.only('id', 'encrypted_subject', 'encrypted_summary', 'encrypted_category')
+		)
+		members: Dict[Any, List[str]] = {}
+		for duplicate_id, original_id in Email.objects.filter(duplicate_of__isnull=False).values_list('id', 'duplicate_of_id'):
+			members.setdefault(original_id, []).append(str(duplicate_id))
+
+		return Response(
+			[
+				{
+					'id': str(email.id),
+					'subject': email.subject,
+					'summary': email.summary,
+					'category': email.category,
+					'duplicate_count': email.duplicate_count,
+					'duplicates': members.get(email.id, []),
+				}
+				for email in clusters
+			]
+		)
+
+
 class AnalyzeEmailsView(APIView):  # type: ignore[misc]
 	permission_classes = [AllowAny]
 
 	def post(self, request) -> Response:
-		emails = Email.objects.all()
-		if not emails.exists():
+		"""
+		Answer the question in 'text'. Without 'session_id' a new analysis session is started,
+		with it the question is a follow-up reusing the conversation and the emails of the session.
+		"""
+		if not Email.objects.exists():
 			raise NotFound('No emails found')
 
 		text_request = request.data.get('text', '')
+		session_id = request.data.get('session_id')
+		if session_id:
+			try:
+				session = AnalysisSession.objects.filter(pk=uuid.UUID(str(session_id))).first()
+			except ValueError:
+				return Response({'message': 'invalid session_id'}, status=status.HTTP_400_BAD_REQUEST)
+			if session is None:
+				raise NotFound('Analysis session not found')
+		else:
+			# saved by ask together with the first answer
+			session = AnalysisSession()
+
+		try:
+			with usage.activate(usage.Job('analyze', settings.LLM_JOB_TOKEN_BUDGET, INTERACTIVE)):
+				analysis = ask(session, text_request)
+		except usage.BudgetExceeded as e:
+			return Response({'message': str(e)}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+		return Response({'emails': {analysis.answer}, 'session_id': session.id}, status=status.HTTP_200_OK)
+
+	def get(self, request: Request) -> Response:
+		"""
+		Past analyses, only those of one session with ?session_id=.
+		"""
+		analyses = LLMAnalysis.objects.order_by('created_at')
+		if request.query_params.get('session_id'):
+			try:
+				analyses = analyses.filter(session_id=uuid.UUID(request.query_params['session_id']))
+			except ValueError:
+				return Response({'message': 'invalid session_id'}, status=status.HTTP_400_BAD_REQUEST)
+		serializer = LLMAnalysisSerializerGet(analyses, many=True)
+		return Response(serializer.data)
+
 
-		data = [email.to_dict() for email in emails]
+class UsageAPIView(APIView):  # type: ignore[misc]
+	def get(self, request: Request) -> Response:
+		"""
+		Token usage per job, endpoint and model, optionally filtered by ?job=, ?job_id= and ?days=.
+		"""
+		ledger = LLMUsage.objects.all()
+		params = request.query_params
+		try:
+			if params.get('job'):
+				ledger = ledger.filter(job=params['job'])
+			if params.get('job_id'):
+				ledger = ledger.filter(job_id=uuid.UUID(params['job_id']))
+			if params.get('days'):
+				ledger = ledger.filter(created_at__gte=timezone.now() - timedelta(days=float(params['days'])))
+		except ValueError:
+			return Response({'message': 'invalid job_id or days'}, status=status.HTTP_400_BAD_REQUEST)
+
+		rows = ledger.values('job', 'endpoint', 'model').annotate(
+			calls=Sum('calls'), prompt_tokens=Sum('prompt_tokens'), completion_tokens=Sum('completion_tokens')
+		)
+		groups = []
+		for row in rows:
+			total = row['prompt_tokens'] + row['completion_tokens']
+			groups.append({**row, 'total_tokens': total, 'tokens_per_call': total / row['calls'] if row['calls'] else None})
+		groups.sort(key=lambda group: group['total_tokens'], reverse=True)
+		return Response(
+			{
+				'total_tokens': sum(row['total_tokens'] for row in groups),
+				'groups': groups,
+				'today': {'tokens': usage.tokens_today(), 'budget': settings.LLM_DAILY_TOKEN_BUDGET},
+				'job_budget': settings.LLM_JOB_TOKEN_BUDGET,
+				'tokens_per_minute': settings.LLM_TOKENS_PER_MINUTE or None,
+			}
+		)
+
+
+class CommunicationGraphAPIView(APIView):  # type: ignore[misc]
+	def get(self, request: Request) -> Response:
+		"""
+		Sender and recipient pairs exchanging the most emails, ?participant= (address or name) keeps the pairs involving them.
+		"""
+		try:
+			limit = count_param(request, 'limit', 20)
+		except ValueError as e:
+			return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+		return Response(top_edges(request.query_params.get('participant'), limit))
 
-		resp = query_llm(text_request, data)
-		LLMAnalysis.objects.create(question=text_request, answer=resp)
-		return Response({'emails': {resp}}, status=status.HTTP_200_OK)
 
+class ProjectsAPIView(APIView):  # type: ignore[misc]
 	def get(self, request: Request) -> Response:
-		emails = LLMAnalysis.objects.filter()
-		serializer = LLMAnalysisSerializerGet(emails, many=True)
-		return Response(serializer.data)
+		"""
+		Projects with their emails, last contact and participants, ?q= keeps those matching all its words.
+		"""
+		try:
+			limit = count_param(request, 'limit', 20)
+			participants = count_param(request, 'participants', 10)
+		except ValueError as e:
+			return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+		projects = find_projects(request.query_params.get('q'), limit)
+		people = project_participants([project['id'] for project in projects], participants)
+		for project in projects:
+			project['participants'] = people.get(project['id'], [])
+		return Response(projects)
+
+
+class SchedulerAPIView(APIView):  # type: ignore[misc]
+	def get(self, request: Request) -> Response:
+		"""
+		Queue depth, running calls and wait times of the LLM scheduler of this process per priority class.
+
+		The queues are per process, scope 'host' means the backfill and bulk caps also hold for other processes.
+		"""
+		return Response(get_scheduler().metrics())
 
 
 class SaveEmailsAPIView(APIView):  # type: ignore[misc]
@@ -0,0 +1,202 @@
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from django.db import close_old_connections
+
+from . import usage
+from .emails import list_mail_files, parse_mail_file
+from .ingest import ingest_file, record_file_error
+from .models import IngestCheckpoint
+
+logger = logging.getLogger(__name__)
+
+FileKey = Tuple[int, int]
+
+
+class WatcherStopped(Exception):
+	pass
+
+
+class MailWatcher:
+	"""
+	Polls mail directories and pushes new or modified files through the ingest pipeline.
+
+	A file is queued once its size and modification time stayed the same for `debounce` seconds,
+	so bursts of writes are ingested once. The queue is bounded: when the LLM is the bottleneck
+	ready files stay pending instead of piling up in memory.
+	"""
+
+	def __init__(
+		self,
+		directories: Iterable[str],
+		interval: float = 5.0,
+		debounce: float = 2.0,
+		queue_size: int = 16,
+		workers: int = 1,
+		batch_size: int = 16,
+		concurrency: int = 1,
+		token_budget: Optional[int] = None,
+		log: Callable[[str], None] = logger.info,
+	):
+		self.directories = [os.path.abspath(directory) for directory in directories]
+		self.interval = interval
+		self.debounce = debounce
+		self.workers = workers
+		self.batch_size = batch_size
+		self.concurrency = concurrency
+		self.log = log
+		# LLM usage of all workers counts against one budget
+		self.job = usage.Job('watch_mail', token_budget)
+
+		self.queue: 'queue.Queue[Tuple[str, os.stat_result]]' = queue.Queue(maxsize=queue_size)
+		self.stop_event = threading.Event()
+		self.lock = threading.Lock()
+		# files already ingested in their current state
+		self.known: Dict[str, FileKey] = {}
+		# changed files waiting for writes to settle: path -> (key, time of the last change)
+		self.pending: Dict[str, Tuple[FileKey, float]] = {}
+		self.inflight: Set[str] = set()
+		self.ingested_files = 0
+		self.ingested_messages = 0
+
+	def load_known(self) -> None:
+		"""
+		Files completely ingested earlier (by the watcher or `manage.py ingest`) are skipped without reading them.
+		"""
+		checkpoints = IngestCheckpoint.objects.filter(completed=True, file_mtime_ns__isnull=False)
+		for path, size, mtime_ns in checkpoints.values_list('path', 'file_size', 'file_mtime_ns').iterator():
+			self.known[path] = (size, mtime_ns)
+
+	def scan(self) -> List[Tuple[str, os.stat_result]]:
+		"""
+		One polling pass, returns the files whose changes settled and should be ingested.
+		"""
+		now = time.monotonic()
+		ready = []
+		for directory in self.directories:
+			for path in list_mail_files(directory):
+				path = os.path.abspath(path)
+				try:
+					stat = os.stat(path)
+				except FileNotFoundError:
+					continue
+				key = (stat.st_size, stat.st_mtime_ns)
+				with self.lock:
+					if self.known.get(path) == key or path in self.inflight:
+						continue
+				previous = self.pending.get(path)
+				if previous is None or previous[0] != key:
+					self.pending[path] = (key, now)
+				elif now - previous[1] >= self.debounce:
+					ready.append((path, stat))
+		return ready
+
+	def enqueue(self, ready: List[Tuple[str, os.stat_result]]) -> int:
+		"""
+		Queue ready files until the queue is full, returns how many had to stay pending.
+		"""
+		for i, (path, stat) in enumerate(ready):
+			try:
+				self.queue.put_nowait((path, stat))
+			except queue.Full:
+				return len(ready) - i
+			with self.lock:
+				self.inflight.add(path)
+			del self.pending[path]
+		return 0
+
+	def check_stopped(self, messages: int, saved: int) -> None:
+		# called after every checkpointed batch, so stopping never loses finished work
+		if self.stop_event.is_set():
+			raise WatcherStopped()
+
+	def process(self, path: str, stat: os.stat_result) -> None:
+		key = (stat.st_size, stat.st_mtime_ns)
+		try:
+			path, content_hash, messages = parse_mail_file(path)
+			saved = ingest_file(
+				path, content_hash, messages, self.batch_size, self.concurrency, on_batch=self.check_stopped, file_stat=stat
+			)
+			with self.lock:
+				self.ingested_files += 1
+				self.ingested_messages += saved
+			self.log(f'Ingested {path}: {saved} new emails')
+		except WatcherStopped:
+			# the checkpoint resumes this file on the next start
+			key = None
+		except usage.BudgetExceeded as e:
+			self.log(f'Stopping: {e}')
+			self.stop_event.set()
+			key = None
+		except Exception as e:
+			# retried when the file changes again
+			record_file_error(path, f'{type(e).__name__}: {e}')
+		finally:
+			with self.lock:
+				if key is not None:
+					self.known[path] = key
+				self.inflight.discard(path)
+
+	def work(self) -> None:
+		with usage.activate(self.job):
+			while not self.stop_event.is_set():
+				try:
+					path, stat = self.queue.get(timeout=0.5)
+				except queue.Empty:
+					continue
+				close_old_connections()
+				try:
+					self.process(path, stat)
+				finally:
+					self.queue.task_done()
+		self.drain()
+		close_old_connections()
+
+	def drain(self) -> None:
+		"""
+		Drop the files still queued when stopping, they are picked up again by the next run.
+		"""
+		while True:
+			try:
+				path, _ = self.queue.get_nowait()
+			except queue.Empty:
+				return
+			with self.lock:
+				self.inflight.discard(path)
+			self.queue.task_done()
+
+	def run(self, once: bool = False) -> None:
+		"""
+		Poll until stopped, or with once=True ingest everything that changed and return.
+		"""
+		self.load_known()
+		threads = [threading.Thread(target=self.work, name=f'mail-watcher-{i}', daemon=True) for i in range(self.workers)]
+		for thread in threads:
+			thread.start()
+
+		try:
+			while not self.stop_event.is_set():
+				backlog = self.enqueue(self.scan())
+				if backlog:
+					self.log(f'Ingestion is behind, {backlog} ready files wait for a free queue slot')
+				if once and not self.pending:
+					# queued and running files are in flight, a worker stopping on the budget drops the queued ones
+					while self.inflight and not self.stop_event.wait(0.1):
+						pass
+					break
+				self.stop_event.wait(0 if once and self.debounce == 0 else self.interval)
+		finally:
+			self.stop(threads)
+
+	def stop(self, threads: Optional[List[threading.Thread]] = None) -> None:
+		"""
+		Stop polling, workers stop after their current batch is saved and checkpointed.
+		"""
+		self.stop_event.set()
+		for thread in threads or []:
+			thread.join()
+		self.drain()
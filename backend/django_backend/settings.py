@@ -22,6 +22,75 @@ load_dotenv()  # loads .env file into environment variables
 
 EMAIL_ENCRYPTION_KEY = os.getenv('EMAIL_ENCRYPTION_KEY')
 
+# LLM clients, created lazily by backendApp.llm_client
+LLM_BASE_URL = os.getenv('LLM_BASE_URL', 'https://llmlab.plgrid.pl/api/v1')
+LLM_MODELS = {
+	'default': {'model': os.getenv('LLM_MODEL', 'meta-llama/Llama-3.3-70B-Instruct'), 'temperature': 0},
+	'key_information': {
+		'model': os.getenv('LLM_MODEL', 'meta-llama/Llama-3.3-70B-Instruct'),
+		'temperature': 0.1,
+		'max_tokens': 100,
+	},
+}
+LLM_MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', '16'))
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '120'))
+# Ask for JSON object responses where a prompt expects JSON, disable for servers without response_format support
+LLM_JSON_MODE = os.getenv('LLM_JSON_MODE', 'true').lower() in ('1', 'true', 'yes')
+
+# Token budgets, unset means unlimited. A job (one ingest run, watcher or API request) or the day's total usage
+# stops with BudgetExceeded before a call could exceed its budget, calls wait to stay under the per-minute rate.
+LLM_JOB_TOKEN_BUDGET = int(os.environ['LLM_JOB_TOKEN_BUDGET']) if os.getenv('LLM_JOB_TOKEN_BUDGET') else None
+LLM_DAILY_TOKEN_BUDGET = int(os.environ['LLM_DAILY_TOKEN_BUDGET']) if os.getenv('LLM_DAILY_TOKEN_BUDGET') else None
+LLM_TOKENS_PER_MINUTE = int(os.getenv('LLM_TOKENS_PER_MINUTE', '0'))
+# Completion tokens assumed per call when checking budgets before the call
+LLM_EXPECTED_COMPLETION_TOKENS = int(os.getenv('LLM_EXPECTED_COMPLETION_TOKENS', '200'))
+
+# LLM calls of a process run in these slots, interactive calls (analysis) before backfill (resummarize) before bulk (ingest).
+# The share of a class caps the slots held by it and all lower classes, the rest stays free for the higher classes.
+LLM_SCHEDULER_SLOTS = int(os.getenv('LLM_SCHEDULER_SLOTS', str(LLM_MAX_CONNECTIONS)))
+LLM_PRIORITY_SHARES = {
+	'interactive': 1.0,
+	'backfill': float(os.getenv('LLM_BACKFILL_SHARE', '0.75')),
+	'bulk': float(os.getenv('LLM_BULK_SHARE', '0.75')),
+}
+# Lock files that apply the backfill and bulk shares across the processes of the host (web server, ingest, watcher),
+# empty keeps the scheduler per process
+LLM_SCHEDULER_LOCK_DIR = os.getenv('LLM_SCHEDULER_LOCK_DIR', str(BASE_DIR / 'llm_slots'))
+
+# Analysis sessions: decrypted emails of a session stay cached for follow-up questions until unused for the TTL (seconds),
+# follow-ups get the last turns of the conversation, email summaries and the full text of the best matching emails only
+ANALYSIS_SESSION_TTL = float(os.getenv('ANALYSIS_SESSION_TTL', '1800'))
+ANALYSIS_SESSION_CACHE_SIZE = int(os.getenv('ANALYSIS_SESSION_CACHE_SIZE', '16'))
+ANALYSIS_HISTORY_TURNS = int(os.getenv('ANALYSIS_HISTORY_TURNS', '6'))
+ANALYSIS_FOLLOWUP_EMAILS = int(os.getenv('ANALYSIS_FOLLOWUP_EMAILS', '5'))
+# Estimated tokens of attachment text matching the question added to every analysis prompt
+ANALYSIS_ATTACHMENT_TOKENS = int(os.getenv('ANALYSIS_ATTACHMENT_TOKENS', '2000'))
+
+# Local email category classifier, trained with `manage.py train_classifier`
+CATEGORY_MODEL_PATH = BASE_DIR / 'category_model.npz'
+# Predictions below this probability are sent to the LLM instead
+CATEGORY_CONFIDENCE_THRESHOLD = float(os.getenv('CATEGORY_CONFIDENCE_THRESHOLD', '0.8'))
+
+# Estimated Jaccard similarity above which an email reuses the summary of an earlier near-duplicate
+DUPLICATE_SIMILARITY_THRESHOLD = float(os.getenv('DUPLICATE_SIMILARITY_THRESHOLD', '0.8'))
+
+# Admin changelists of tables larger than this show an estimated row count instead of running COUNT(*)
+ADMIN_EXACT_COUNT_LIMIT = int(os.getenv('ADMIN_EXACT_COUNT_LIMIT', '10000'))
+
+# Largest ?limit= (and ?participants=) accepted by the /relations/ and /projects/ endpoints
+API_MAX_LIMIT = int(os.getenv('API_MAX_LIMIT', '100'))
+
+# Ingestion: emails summarized and saved per batch and parallel LLM calls per batch
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '16'))
+LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', '4'))
+
+# Directories polled by `manage.py watch_mail`, separated with os.pathsep
+MAIL_DIRS = os.getenv('MAIL_DIRS', str(BASE_DIR.parent / 'data')).split(os.pathsep)
+
+# Attachment text extraction: processes of the extraction pool and estimated tokens per stored chunk
+DOCUMENT_WORKERS = int(os.getenv('DOCUMENT_WORKERS', '2'))
+DOCUMENT_CHUNK_TOKENS = int(os.getenv('DOCUMENT_CHUNK_TOKENS', '512'))
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 